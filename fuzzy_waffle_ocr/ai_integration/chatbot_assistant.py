@@ -20,15 +20,16 @@ class FuzzyWaffleAssistant:
     
     def get_chatbot_settings(self) -> Dict[str, Any]:
         """Get chatbot settings, prefer Raven integration if available"""
+        from fuzzy_waffle_ocr.doctype.ocr_settings.ocr_settings import get_ocr_settings, get_raven_settings
         
         # Try to get settings from Fuzzy Waffle OCR Settings first
         try:
-            ocr_settings = frappe.get_single("OCR Settings")
-            if ocr_settings.get("chatbot_enabled") and ocr_settings.get("openai_api_key"):
+            ocr_settings = get_ocr_settings()
+            if ocr_settings.chatbot_enabled and ocr_settings.openai_api_key:
                 return {
                     "enabled": True,
                     "api_key": ocr_settings.openai_api_key,
-                    "model": ocr_settings.get("ai_model", "gpt-3.5-turbo"),
+                    "model": ocr_settings.ai_model,
                     "source": "fuzzy_waffle"
                 }
         except:
@@ -36,12 +37,12 @@ class FuzzyWaffleAssistant:
         
         # Fallback to Raven settings if available
         try:
-            raven_settings = frappe.get_single("Raven Settings")
-            if raven_settings.get("openai_api_key"):
+            raven_settings = get_raven_settings()
+            if raven_settings.openai_api_key:
                 return {
                     "enabled": True,
                     "api_key": raven_settings.openai_api_key,
-                    "model": raven_settings.get("openai_model", "gpt-3.5-turbo"),
+                    "model": raven_settings.openai_model,
                     "source": "raven"
                 }
         except:
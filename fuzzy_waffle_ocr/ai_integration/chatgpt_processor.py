@@ -1,8 +1,6 @@
 import frappe
-import openai
 import json
 from typing import Dict, List, Any, Optional
-import requests
 
 class ChatGPTInvoiceProcessor:
     """
@@ -18,18 +16,27 @@ class ChatGPTInvoiceProcessor:
     
     def __init__(self):
         self.settings = self.get_ai_settings()
+    
+    def get_openai(self):
+        """Import the OpenAI client on first AI call, so constructing the processor stays cheap"""
+        import openai
+        
         if self.settings.get('openai_api_key'):
             openai.api_key = self.settings['openai_api_key']
+        
+        return openai
     
     def get_ai_settings(self) -> Dict[str, Any]:
         """Get AI integration settings"""
+        from fuzzy_waffle_ocr.doctype.ocr_settings.ocr_settings import get_ocr_settings
+        
         try:
-            settings = frappe.get_single("OCR Settings")
+            settings = get_ocr_settings()
             return {
-                "openai_api_key": settings.get("openai_api_key"),
-                "ai_enabled": settings.get("ai_enabled", False),
-                "ai_model": settings.get("ai_model", "gpt-4"),
-                "max_tokens": settings.get("max_tokens", 2000)
+                "openai_api_key": settings.openai_api_key,
+                "ai_enabled": settings.ai_enabled,
+                "ai_model": settings.ai_model,
+                "max_tokens": settings.max_tokens
             }
         except:
             return {
@@ -55,7 +62,7 @@ class ChatGPTInvoiceProcessor:
         prompt = self._build_ocr_enhancement_prompt(raw_ocr_text, image_context)
         
         try:
-            response = openai.ChatCompletion.create(
+            response = self.get_openai().ChatCompletion.create(
                 model=self.settings['ai_model'],
                 messages=[
                     {
@@ -183,7 +190,7 @@ Consider categories like:
 """
         
         try:
-            response = openai.ChatCompletion.create(
+            response = self.get_openai().ChatCompletion.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=500,
@@ -238,7 +245,7 @@ Return JSON:
 """
         
         try:
-            response = openai.ChatCompletion.create(
+            response = self.get_openai().ChatCompletion.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=400,
@@ -285,7 +292,7 @@ Return JSON with validation results:
 """
         
         try:
-            response = openai.ChatCompletion.create(
+            response = self.get_openai().ChatCompletion.create(
                 model="gpt-3.5-turbo", 
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=600,
@@ -0,0 +1,331 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import now_datetime, time_diff_in_seconds
+from redis import Redis
+import time
+from typing import Dict, List, Any, Optional
+
+BATCH_CHUNK_JOB = "fuzzy_waffle_ocr.api.batch_processing.process_batch_chunk"
+
+# Batch state lives in Redis for a day after the batch is queued
+BATCH_KEY_PREFIX = "fuzzy_waffle_ocr:ocr_batch:"
+BATCH_EXPIRES_IN_SEC = 24 * 60 * 60
+
+DEFAULT_MAX_BATCH_SIZE = 10
+
+@frappe.whitelist()
+def process_ocr_batch(supplier: str, document_type: str, file_urls=None, folder: str = None) -> Dict[str, Any]:
+    """
+    Queue many invoice files of one supplier for OCR
+    
+    Takes a list of file URLs, or a File folder whose files are all processed.
+    Files are split into chunks of OCR Settings' `max_batch_size`, each chunk
+    runs as its own job on the long queue, and the Invoice OCR Processor docs
+    of a chunk are written with one bulk insert. Poll get_ocr_batch_status with
+    the returned batch id; progress is also published as `ocr_batch_progress`
+    realtime events.
+    """
+    from fuzzy_waffle_ocr.doctype.ocr_settings.ocr_settings import get_ocr_settings
+    
+    frappe.has_permission("Invoice OCR Processor", "create", throw=True)
+    
+    settings = get_ocr_settings()
+    if not settings.batch_processing_enabled:
+        frappe.throw(_("Batch processing is disabled in OCR Settings"))
+    
+    file_urls = get_batch_files(file_urls, folder)
+    if not file_urls:
+        frappe.throw(_("No files to process"))
+    
+    chunk_size = settings.max_batch_size or DEFAULT_MAX_BATCH_SIZE
+    chunks = [file_urls[i:i + chunk_size] for i in range(0, len(file_urls), chunk_size)]
+    
+    batch = OCRBatch(frappe.generate_hash(length=10))
+    batch.start(
+        user=frappe.session.user,
+        supplier=supplier,
+        document_type=document_type,
+        total_files=len(file_urls),
+        chunks=len(chunks),
+        chunk_size=chunk_size
+    )
+    
+    for chunk_index, chunk in enumerate(chunks):
+        frappe.enqueue(
+            BATCH_CHUNK_JOB,
+            queue="long",
+            timeout=1800,
+            enqueue_after_commit=True,
+            batch_id=batch.batch_id,
+            chunk_index=chunk_index,
+            file_urls=chunk,
+            supplier=supplier,
+            document_type=document_type
+        )
+    
+    return {
+        "batch_id": batch.batch_id,
+        "files": len(file_urls),
+        "chunks": len(chunks),
+        "chunk_size": chunk_size,
+        "status": "queued"
+    }
+
+@frappe.whitelist()
+def get_ocr_batch_status(batch_id: str) -> Dict[str, Any]:
+    """API to poll the progress, throughput and failures of an OCR batch"""
+    batch = OCRBatch(batch_id)
+    meta = batch.get_meta()
+    
+    if not meta:
+        frappe.throw(_("OCR batch {0} not found or expired").format(batch_id), frappe.DoesNotExistError)
+    
+    if meta["user"] != frappe.session.user and "System Manager" not in frappe.get_roles():
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    
+    return batch.get_status(meta)
+
+def get_batch_files(file_urls=None, folder: Optional[str] = None) -> List[str]:
+    """File URLs passed in (list or JSON list), or those of every file in a File folder"""
+    if file_urls:
+        if isinstance(file_urls, str):
+            file_urls = frappe.parse_json(file_urls)
+        return list(dict.fromkeys(file_urls))
+    
+    if folder:
+        return frappe.get_all(
+            "File",
+            filters={"folder": folder, "is_folder": 0},
+            pluck="file_url",
+            order_by="creation asc"
+        )
+    
+    return []
+
+def process_batch_chunk(batch_id: str, chunk_index: int, file_urls: List[str], supplier: str, document_type: str):
+    """Background job: OCR one chunk of a batch and bulk insert its documents"""
+    from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    from fuzzy_waffle_ocr.doctype.invoice_ocr_processor.invoice_ocr_processor import run_ocr_pipeline
+    
+    batch = OCRBatch(batch_id)
+    batch.mark_running()
+    
+    # One processor per chunk: settings are read once, not per file
+    processor = OCRProcessor()
+    started = time.monotonic()
+    docs = []
+    failures = []
+    
+    for file_url in file_urls:
+        ocr_doc = frappe.get_doc({
+            "doctype": "Invoice OCR Processor",
+            "supplier": supplier,
+            "document_type": document_type,
+            "ocr_status": "Ready",
+            "source_file": file_url
+        })
+        
+        try:
+            run_ocr_pipeline(ocr_doc, file_url, processor=processor)
+            docs.append(ocr_doc)
+        except Exception as e:
+            frappe.log_error(f"OCR batch {batch_id} failed for {file_url}: {e}\n{frappe.get_traceback()}", "OCR Batch")
+            failures.append({"file_url": file_url, "error": str(e)})
+        
+        processor.metrics.flush(supplier)
+    
+    try:
+        # Recorded once per chunk: the insert covers all of its documents
+        with processor.metrics.stage("db_insert"):
+            rejected = bulk_insert_docs(docs)
+            frappe.db.commit()
+        
+        processor.metrics.flush(supplier)
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"OCR batch {batch_id} chunk {chunk_index} insert failed: {e}\n{frappe.get_traceback()}", "OCR Batch")
+        failures.extend({"file_url": doc.source_file, "error": str(e)} for doc in docs)
+        docs = []
+        rejected = []
+    
+    # Documents that failed validation take the normal insert path, so each one
+    # fails on its own with the usual error
+    for doc in rejected:
+        try:
+            doc.insert()
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"OCR batch {batch_id} failed for {doc.source_file}: {e}\n{frappe.get_traceback()}", "OCR Batch")
+            failures.append({"file_url": doc.source_file, "error": str(e)})
+            docs.remove(doc)
+    
+    batch.record_chunk(
+        chunk_index,
+        processed=len(docs),
+        failures=failures,
+        seconds=time.monotonic() - started,
+        names=[doc.name for doc in docs]
+    )
+
+def bulk_insert_docs(docs: List[Document]) -> List[Document]:
+    """
+    Validate and insert new documents of one doctype with one INSERT per table
+    
+    Runs naming, defaults, `validate` and the mandatory and link checks like
+    Document.insert, but skips the per-document insert hooks, so use it only
+    for doctypes whose insert has no side effects beyond its own rows.
+    Returns the documents that failed any of these steps; they are not
+    inserted and should go through Document.insert instead.
+    """
+    rejected = []
+    
+    if not docs:
+        return rejected
+    
+    rows = {}
+    
+    for doc in docs:
+        try:
+            doc.set_new_name()
+            doc.set_parent_in_children()
+            doc.set_user_and_timestamp()
+            doc.run_method("validate")
+            doc._validate_mandatory()
+            doc._validate_links()
+        except Exception:
+            frappe.clear_messages()
+            rejected.append(doc)
+            continue
+        
+        for d in [doc] + doc.get_all_children():
+            rows.setdefault(d.doctype, []).append(d.get_valid_dict(convert_dates_to_str=True))
+    
+    for doctype, doctype_rows in rows.items():
+        fields = list(doctype_rows[0])
+        frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in doctype_rows])
+    
+    return rejected
+
+class OCRBatch:
+    """
+    Redis-backed state of one OCR batch
+    
+    The batch description is a cached dict; counters are Redis hash fields
+    incremented atomically by the chunk jobs, so parallel chunks never
+    overwrite each other's progress.
+    """
+    
+    def __init__(self, batch_id: str):
+        self.batch_id = batch_id
+        self.key = BATCH_KEY_PREFIX + batch_id
+        self.cache = frappe.cache()
+    
+    def start(self, **meta):
+        meta.update(batch_id=self.batch_id, queued_at=str(now_datetime()))
+        self.set_meta(meta)
+    
+    def get_meta(self) -> Optional[Dict[str, Any]]:
+        return self.cache.get_value(self.key)
+    
+    def set_meta(self, meta: Dict[str, Any]):
+        self.cache.set_value(self.key, meta, expires_in_sec=BATCH_EXPIRES_IN_SEC)
+    
+    def mark_running(self):
+        meta = self.get_meta() or {}
+        if not meta.get("started_at"):
+            meta["started_at"] = str(now_datetime())
+            self.set_meta(meta)
+    
+    def record_chunk(self, chunk_index: int, processed: int, failures: List[Dict[str, str]],
+                     seconds: float, names: List[str]):
+        """Add a finished chunk to the batch counters and publish progress"""
+        counters = self.cache.make_key(self.key + ":counters")
+        
+        pipe = self.cache.pipeline()
+        pipe.hincrby(counters, "processed", processed)
+        pipe.hincrby(counters, "failed", len(failures))
+        pipe.hincrby(counters, "chunks_done", 1)
+        pipe.hincrbyfloat(counters, "ocr_seconds", seconds)
+        pipe.expire(counters, BATCH_EXPIRES_IN_SEC)
+        pipe.execute()
+        
+        self.cache.set_value(
+            f"{self.key}:chunk:{chunk_index}",
+            {"names": names, "failures": failures},
+            expires_in_sec=BATCH_EXPIRES_IN_SEC
+        )
+        
+        meta = self.get_meta() or {}
+        status = self.get_status(meta)
+        
+        if status["status"] == "Completed" and not meta.get("finished_at"):
+            meta["finished_at"] = str(now_datetime())
+            self.set_meta(meta)
+            status = self.get_status(meta)
+        
+        if meta.get("user"):
+            status.pop("failures", None)
+            frappe.publish_realtime("ocr_batch_progress", status, user=meta["user"])
+    
+    def get_counters(self) -> Dict[str, float]:
+        # Plain Redis numbers: RedisWrapper.hgetall would prefix the key again and unpickle them
+        raw = Redis.hgetall(self.cache, self.cache.make_key(self.key + ":counters")) or {}
+        counters = {frappe.safe_decode(key): float(value) for key, value in raw.items()}
+        
+        return {
+            "processed": int(counters.get("processed", 0)),
+            "failed": int(counters.get("failed", 0)),
+            "chunks_done": int(counters.get("chunks_done", 0)),
+            "ocr_seconds": counters.get("ocr_seconds", 0.0)
+        }
+    
+    def get_failures(self, chunks: int) -> List[Dict[str, str]]:
+        failures = []
+        
+        for chunk_index in range(chunks):
+            chunk = self.cache.get_value(f"{self.key}:chunk:{chunk_index}")
+            if chunk:
+                failures.extend(chunk["failures"])
+        
+        return failures
+    
+    def get_status(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Aggregate batch status
+        
+        Throughput is files finished per minute of wall time since the first
+        chunk started; `avg_seconds_per_file` is OCR time summed over chunks,
+        so with parallel workers it is larger than wall time per file.
+        """
+        counters = self.get_counters()
+        finished = counters["processed"] + counters["failed"]
+        
+        if counters["chunks_done"] >= meta.get("chunks", 0):
+            status = "Completed"
+        elif meta.get("started_at"):
+            status = "Running"
+        else:
+            status = "Queued"
+        
+        elapsed = 0.0
+        if meta.get("started_at"):
+            elapsed = time_diff_in_seconds(meta.get("finished_at") or now_datetime(), meta["started_at"])
+        
+        return {
+            "batch_id": self.batch_id,
+            "status": status,
+            "supplier": meta.get("supplier"),
+            "total_files": meta.get("total_files", 0),
+            "chunks": meta.get("chunks", 0),
+            "chunks_done": counters["chunks_done"],
+            "processed": counters["processed"],
+            "failed": counters["failed"],
+            "pending": max(meta.get("total_files", 0) - finished, 0),
+            "failure_rate": round(counters["failed"] * 100 / finished, 2) if finished else 0.0,
+            "elapsed_seconds": round(elapsed, 2),
+            "files_per_minute": round(finished * 60 / elapsed, 2) if elapsed else 0.0,
+            "avg_seconds_per_file": round(counters["ocr_seconds"] / finished, 2) if finished else 0.0,
+            "failures": self.get_failures(meta.get("chunks", 0))
+        }
@@ -0,0 +1,16 @@
+import frappe
+from werkzeug.wrappers import Response
+
+@frappe.whitelist()
+def get_ocr_metrics():
+    """
+    OCR pipeline stage histograms of this site in Prometheus text format
+    
+    Scrape with an API key of a System Manager. Histograms only grow while
+    debug mode is on in OCR Settings.
+    """
+    from fuzzy_waffle_ocr.ocr.metrics import render_prometheus, PROMETHEUS_CONTENT_TYPE
+    
+    frappe.only_for("System Manager")
+    
+    return Response(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,12 +1,37 @@
 import frappe
+from frappe import _
 from frappe.model.document import Document
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 class InvoiceOCRProcessor(Document):
     def validate(self):
         self.calculate_total_amount()
         self.update_automation_metrics()
+    
+    def on_update(self):
+        self.update_supplier_counter()
+    
+    def on_trash(self):
+        from fuzzy_waffle_ocr.doctype.ocr_supplier_counter.ocr_supplier_counter import update_completed_count
+        
+        if self.ocr_status == "Completed":
+            update_completed_count(self.supplier, -1)
+    
+    def update_supplier_counter(self):
+        """Keep the supplier's completed count in step when this document enters or leaves Completed"""
+        from fuzzy_waffle_ocr.doctype.ocr_supplier_counter.ocr_supplier_counter import update_completed_count
+        
+        before = self.get_doc_before_save()
+        was_completed = bool(before) and before.ocr_status == "Completed"
+        is_completed = self.ocr_status == "Completed"
+        supplier_changed = bool(before) and before.supplier != self.supplier
+        
+        if was_completed and (not is_completed or supplier_changed):
+            update_completed_count(before.supplier, -1)
+        
+        if is_completed and (not was_completed or supplier_changed):
+            update_completed_count(self.supplier, 1)
         
     def calculate_total_amount(self):
         total = 0
@@ -39,58 +64,48 @@ class InvoiceOCRProcessor(Document):
             self.processing_stage = "Stage 4"
             self.automation_percentage = 95
     
-    def process_ocr_data(self, ocr_text: str) -> Dict[str, Any]:
-        """Process OCR text and extract invoice data"""
+    def process_ocr_data(self, ocr_text: str, pages: List[Dict[str, Any]] = None, processor=None) -> Dict[str, Any]:
+        """Process OCR text (and page word boxes, when available) and extract invoice data"""
         from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
         
-        processor = OCRProcessor()
-        extracted_data = processor.extract_invoice_data(ocr_text)
+        processor = processor or OCRProcessor()
+        extracted_data = processor.extract_invoice_data(ocr_text, pages)
         
         # Apply learning patterns
-        self.apply_learning_patterns(extracted_data)
+        with processor.metrics.stage("learning"):
+            self.apply_learning_patterns(extracted_data)
         
         return extracted_data
     
     def apply_learning_patterns(self, extracted_data: Dict[str, Any]):
         """Apply learned patterns from supplier history"""
-        from fuzzy_waffle_ocr.learning.supplier_learning import SupplierLearning
-        
-        learning = SupplierLearning(self.supplier)
-        
-        # Apply item mapping patterns
-        if extracted_data.get('items'):
-            for item in extracted_data['items']:
-                mapped_item = learning.get_item_mapping(item.get('description'))
-                if mapped_item:
-                    item['erpnext_item'] = mapped_item['item_code']
-                    item['confidence'] = mapped_item['confidence']
-                    
-                    # Apply UOM conversion
-                    uom_conversion = learning.get_uom_conversion(
-                        item.get('description'),
-                        item.get('quantity'),
-                        item.get('uom')
-                    )
-                    if uom_conversion:
-                        item['erpnext_quantity'] = uom_conversion['erpnext_quantity']
-                        item['erpnext_uom'] = uom_conversion['erpnext_uom']
-                        item['erpnext_rate'] = uom_conversion['erpnext_rate']
+        from fuzzy_waffle_ocr.learning.mapping_resolver import SupplierMappingResolver
+        
+        # One query loads every mapping of the supplier; the rest is resolved in memory
+        resolved = SupplierMappingResolver(self.supplier).resolve(extracted_data)
+        
+        # Apply item mapping patterns and UOM conversions
+        for item, mapped_item in zip(extracted_data.get('items') or [], resolved['items']):
+            if mapped_item:
+                item['erpnext_item'] = mapped_item['item_code']
+                item['confidence'] = mapped_item['confidence']
+                
+                if mapped_item.get('erpnext_uom'):
+                    item['erpnext_quantity'] = mapped_item['erpnext_quantity']
+                    item['erpnext_uom'] = mapped_item['erpnext_uom']
+                    item['erpnext_rate'] = mapped_item['erpnext_rate']
         
         # Apply payment terms pattern
-        if extracted_data.get('payment_terms'):
-            mapped_terms = learning.get_payment_terms_mapping(
-                extracted_data['payment_terms']
-            )
-            if mapped_terms:
-                extracted_data['erpnext_payment_terms'] = mapped_terms
+        if resolved['payment_terms']:
+            extracted_data['erpnext_payment_terms'] = resolved['payment_terms']
         
         # Suggest project
-        project_suggestion = learning.suggest_project(extracted_data.get('items', []))
+        project_suggestion = resolved['project']
         if project_suggestion:
             self.suggested_project = project_suggestion['project']
             self.project_confidence = project_suggestion['confidence']
             
-        self.learning_confidence = learning.get_overall_confidence()
+        self.learning_confidence = resolved['confidence']
     
     def create_purchase_invoice(self) -> str:
         """Create Purchase Invoice from OCR data"""
@@ -225,36 +240,194 @@ class InvoiceOCRProcessor(Document):
 
 def get_supplier_processing_count(supplier: str) -> int:
     """Get count of processed invoices for a supplier"""
-    return frappe.db.count("Invoice OCR Processor", {"supplier": supplier, "ocr_status": "Completed"})
+    from fuzzy_waffle_ocr.doctype.ocr_supplier_counter.ocr_supplier_counter import get_completed_count
+    
+    # Maintained counter instead of counting processor rows on every save
+    return get_completed_count(supplier)
+
+# Background job that runs queued uploads through the OCR pipeline
+OCR_UPLOAD_JOB = "fuzzy_waffle_ocr.doctype.invoice_ocr_processor.invoice_ocr_processor.run_ocr_upload_job"
 
 @frappe.whitelist()
 def process_ocr_upload(file_url: str, supplier: str, document_type: str) -> Dict[str, Any]:
     """Process uploaded invoice file"""
     from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
     
-    processor = OCRProcessor()
-    
-    # Extract text from file
-    ocr_text = processor.extract_text_from_file(file_url)
-    
     # Create OCR processor document
     ocr_doc = frappe.get_doc({
         "doctype": "Invoice OCR Processor",
         "supplier": supplier,
         "document_type": document_type,
-        "ocr_status": "Processing"
+        "ocr_status": "Processing",
+        "source_file": file_url
     })
     
-    # Process OCR data
-    extracted_data = ocr_doc.process_ocr_data(ocr_text)
+    processor = OCRProcessor()
+    extracted_data = run_ocr_pipeline(ocr_doc, file_url, processor=processor)
     
-    # Update document with extracted data
-    ocr_doc.update(extracted_data)
-    ocr_doc.insert()
+    with processor.metrics.stage("db_insert"):
+        ocr_doc.insert()
+    
+    processor.metrics.flush(supplier)
     
     return {
         "name": ocr_doc.name,
         "status": "success",
         "confidence": ocr_doc.learning_confidence,
         "data": extracted_data
-    }
\ No newline at end of file
+    }
+
+@frappe.whitelist()
+def process_ocr_upload_async(file_url: str, supplier: str, document_type: str) -> Dict[str, Any]:
+    """
+    Queue uploaded invoice file for OCR and return immediately
+    
+    The Invoice OCR Processor is created as Queued and filled in by a background
+    job on the long queue. Progress is published as `ocr_upload_progress` realtime
+    events to the uploader and can be polled with get_ocr_upload_status.
+    """
+    ocr_doc = frappe.get_doc({
+        "doctype": "Invoice OCR Processor",
+        "supplier": supplier,
+        "document_type": document_type,
+        "ocr_status": "Queued",
+        "source_file": file_url
+    })
+    ocr_doc.insert()
+    
+    OCRUploadProgress(ocr_doc.name, ocr_doc.owner).update(status="Queued", step="queued")
+    
+    frappe.enqueue(
+        OCR_UPLOAD_JOB,
+        queue="long",
+        timeout=1800,
+        enqueue_after_commit=True,
+        name=ocr_doc.name
+    )
+    
+    return {
+        "name": ocr_doc.name,
+        "status": "queued"
+    }
+
+@frappe.whitelist()
+def get_ocr_upload_status(name: str) -> Dict[str, Any]:
+    """API to poll the status and progress of an OCR upload"""
+    status = frappe.db.get_value(
+        "Invoice OCR Processor",
+        name,
+        ["ocr_status", "ocr_stage", "learning_confidence", "error_message"],
+        as_dict=True
+    )
+    
+    if not status:
+        frappe.throw(_("OCR upload {0} not found").format(name), frappe.DoesNotExistError)
+    
+    frappe.has_permission("Invoice OCR Processor", "read", name, throw=True)
+    
+    return {
+        "name": name,
+        **status,
+        "progress": OCRUploadProgress.get(name)
+    }
+
+def run_ocr_upload_job(name: str):
+    """Run a queued upload through the OCR pipeline"""
+    from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    
+    ocr_doc = frappe.get_doc("Invoice OCR Processor", name)
+    progress = OCRUploadProgress(name, ocr_doc.owner)
+    processor = OCRProcessor(progress_callback=progress.on_ocr_event)
+    
+    try:
+        ocr_doc.db_set("ocr_status", "Processing", commit=True)
+        progress.update(status="Processing", step="ocr")
+        
+        run_ocr_pipeline(ocr_doc, ocr_doc.source_file, progress, processor)
+        
+        progress.update(step="saving")
+        ocr_doc.ocr_status = "Ready"
+        
+        with processor.metrics.stage("db_insert"):
+            ocr_doc.save()
+            frappe.db.commit()
+        
+        processor.metrics.flush(ocr_doc.supplier)
+        
+        progress.update(status="Ready", step="completed", confidence=ocr_doc.learning_confidence)
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"OCR upload {name} failed: {e}\n{frappe.get_traceback()}", "OCR Upload")
+        
+        frappe.db.set_value("Invoice OCR Processor", name, {
+            "ocr_status": "Failed",
+            "error_message": str(e)
+        })
+        frappe.db.commit()
+        
+        progress.update(status="Failed", step="failed", error=str(e))
+
+def run_ocr_pipeline(ocr_doc: "InvoiceOCRProcessor", file_url: str, progress: "OCRUploadProgress" = None,
+                     processor=None) -> Dict[str, Any]:
+    """
+    OCR the file, extract invoice data and apply learning, updating (but not saving) the document
+    
+    Pass `processor` to reuse one OCRProcessor (and its settings) across many files.
+    """
+    from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    
+    if processor is None:
+        processor = OCRProcessor(progress_callback=progress.on_ocr_event if progress else None)
+    
+    # Extract text and word boxes from file in one OCR pass
+    with processor.metrics.stage("ocr"):
+        document = processor.extract_document(file_url)
+    ocr_doc.ocr_stage = processor.ocr_stage
+    
+    if progress:
+        progress.update(step="extraction", ocr_stage=processor.ocr_stage, cache_hit=processor.cache_hit)
+    
+    # Process OCR data
+    extracted_data = ocr_doc.process_ocr_data(document["text"], document["pages"], processor)
+    
+    # Update document with extracted data
+    ocr_doc.update(extracted_data)
+    
+    return extracted_data
+
+class OCRUploadProgress:
+    """
+    Progress of one upload, published as realtime events and kept in Redis for polling
+    
+    `step` is the pipeline step (queued, ocr, extraction, saving, completed, failed);
+    while OCR runs, `ocr_stage` and `pages_done` / `stage_pages` track the cascade.
+    """
+    
+    KEY_PREFIX = "fuzzy_waffle_ocr:ocr_upload_progress:"
+    EXPIRES_IN_SEC = 24 * 60 * 60
+    
+    def __init__(self, name: str, user: str):
+        self.name = name
+        self.user = user
+        self.state = {"name": name}
+    
+    def update(self, **data):
+        self.state.update(data)
+        
+        frappe.cache().set_value(self.KEY_PREFIX + self.name, self.state, expires_in_sec=self.EXPIRES_IN_SEC)
+        frappe.publish_realtime("ocr_upload_progress", self.state, user=self.user)
+    
+    def on_ocr_event(self, event: str, data: Dict[str, Any]):
+        """Progress callback for OCRProcessor"""
+        if event == "document":
+            self.update(pages=data["pages"])
+        elif event == "text_layer":
+            self.update(text_layer_pages=len(data["pages"]))
+        elif event == "ocr_stage":
+            self.update(ocr_stage=data["stage"], stage_pages=len(data["pages"]), pages_done=0)
+        elif event == "page":
+            self.update(page=data["page"], pages_done=self.state.get("pages_done", 0) + 1)
+    
+    @classmethod
+    def get(cls, name: str) -> Optional[Dict[str, Any]]:
+        return frappe.cache().get_value(cls.KEY_PREFIX + name)
\ No newline at end of file
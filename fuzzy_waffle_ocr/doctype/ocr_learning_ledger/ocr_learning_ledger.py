@@ -0,0 +1,101 @@
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+import json
+from typing import Dict, List, Optional, Set
+
+# Rows per ledger statement
+LEDGER_CHUNK_SIZE = 1000
+
+class OCRLearningLedger(Document):
+    """
+    One document counted in the learned patterns, written by incremental learning
+    
+    Rows are always named explicitly as `source::reference_name` (see
+    get_ledger_name), never by the doctype's naming rule.
+    """
+    pass
+
+def get_ledger_name(source: str, reference_name: str) -> str:
+    # Deterministic, so lookups are by primary key and a document can only be counted once
+    return f"{source}::{reference_name}"
+
+def get_learned(source: str, reference_names: List[str]) -> Set[str]:
+    """The given documents of a source that are already counted"""
+    learned = set()
+    
+    for i in range(0, len(reference_names), LEDGER_CHUNK_SIZE):
+        chunk = [get_ledger_name(source, name) for name in reference_names[i:i + LEDGER_CHUNK_SIZE]]
+        learned.update(frappe.get_all(
+            "OCR Learning Ledger",
+            filters={"name": ["in", chunk]},
+            pluck="reference_name"
+        ))
+    
+    return learned
+
+def add_learned(source: str, reference_names: List[str]):
+    timestamp = now()
+    user = frappe.session.user
+    rows = [
+        (get_ledger_name(source, name), source, name, timestamp, timestamp, user, user)
+        for name in reference_names
+    ]
+    
+    for i in range(0, len(rows), LEDGER_CHUNK_SIZE):
+        frappe.db.bulk_insert(
+            "OCR Learning Ledger",
+            ("name", "source", "reference_name", "creation", "modified", "owner", "modified_by"),
+            rows[i:i + LEDGER_CHUNK_SIZE],
+            ignore_duplicates=True
+        )
+
+def remove_learned(source: str, reference_names: List[str]):
+    for i in range(0, len(reference_names), LEDGER_CHUNK_SIZE):
+        chunk = [get_ledger_name(source, name) for name in reference_names[i:i + LEDGER_CHUNK_SIZE]]
+        frappe.db.delete("OCR Learning Ledger", {"name": ("in", chunk)})
+
+def reset_ledger(source: str, condition: str, values: Optional[Dict] = None, scope: Optional[str] = None):
+    """
+    Replace a source's ledger with every document of the source matching a SQL condition
+    
+    With `scope`, a SQL condition on the source's documents, only the ledger
+    rows of documents in scope are replaced, e.g. one supplier shard.
+    """
+    if scope:
+        frappe.db.sql(f"""
+            DELETE FROM `tabOCR Learning Ledger`
+            WHERE source = %(source)s
+            AND reference_name IN (SELECT name FROM `tab{source}` WHERE {scope})
+        """, {**(values or {}), "source": source})
+        condition = f"({condition}) AND {scope}"
+    else:
+        frappe.db.delete("OCR Learning Ledger", {"source": source})
+    
+    frappe.db.sql(f"""
+        INSERT INTO `tabOCR Learning Ledger`
+            (name, source, reference_name, creation, modified, owner, modified_by, docstatus, idx)
+        SELECT
+            CONCAT(%(source)s, '::', name), %(source)s, name, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0
+        FROM `tab{source}`
+        WHERE {condition}
+    """, {**(values or {}), "source": source, "now": now(), "user": frappe.session.user})
+
+def get_watermark_key(source: str) -> str:
+    return f"fuzzy_waffle_ocr_learning_watermark:{frappe.scrub(source)}"
+
+def get_watermark(source: str) -> Optional[Dict[str, str]]:
+    """Modified timestamp and name of the last document of a source that learning has looked at"""
+    value = frappe.db.get_global(get_watermark_key(source))
+    return json.loads(value) if value else None
+
+def set_watermark(source: str, modified, name: str):
+    frappe.db.set_global(get_watermark_key(source), json.dumps({"modified": str(modified), "name": name}))
+
+def get_latest_watermark(source: str) -> Optional[Dict[str, str]]:
+    """Watermark covering every document of a source as of now"""
+    latest = frappe.db.sql(
+        f"SELECT modified, name FROM `tab{source}` ORDER BY modified DESC, name DESC LIMIT 1",
+        as_dict=True
+    )
+    return {"modified": str(latest[0].modified), "name": latest[0].name} if latest else None
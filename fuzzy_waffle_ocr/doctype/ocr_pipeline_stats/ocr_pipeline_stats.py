@@ -0,0 +1,6 @@
+import frappe
+from frappe.model.document import Document
+
+class OCRPipelineStats(Document):
+    """Hourly per-stage OCR pipeline timings, written by fuzzy_waffle_ocr.ocr.metrics.rollup_pipeline_stats"""
+    pass
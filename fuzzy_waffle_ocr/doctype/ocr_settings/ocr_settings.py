@@ -1,5 +1,8 @@
 import frappe
 from frappe.model.document import Document
+from frappe.utils import cint, flt
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, Optional
 
 class OCRSettings(Document):
     def validate(self):
@@ -13,10 +16,13 @@ class OCRSettings(Document):
         
         if self.confidence_threshold > self.auto_submit_threshold:
             frappe.throw("Auto Submit Threshold must be higher than Confidence Threshold")
+        
+        if self.parallel_ocr_workers and self.parallel_ocr_workers < 0:
+            frappe.throw("Parallel OCR Workers cannot be negative")
     
     def on_update(self):
-        """Clear cache when settings are updated"""
-        frappe.clear_cache()
+        """Invalidate cached settings (only this doctype's entry) once the change is committed"""
+        ocr_settings_cache.invalidate()
         
         # Test API connections if enabled
         if self.ai_enabled and self.openai_api_key:
@@ -48,4 +54,171 @@ class OCRSettings(Document):
             "model": self.ai_model,
             "max_tokens": self.max_tokens,
             "confidence_threshold": self.ai_confidence_threshold
-        }
\ No newline at end of file
+        }
+
+# Bump when the cached value classes change shape, so old Redis entries are never read
+SETTINGS_CACHE_VERSION = 1
+
+SETTINGS_KEY_PREFIX = "fuzzy_waffle_ocr:settings:"
+SETTINGS_EXPIRES_IN_SEC = 24 * 60 * 60
+
+def secret(default=None):
+    """A Password field: decrypted per process and never written to Redis"""
+    return field(default=default, repr=False, metadata={"secret": True})
+
+@dataclass(frozen=True)
+class OCRSettingsValues:
+    """Typed, read-only OCR Settings; defaults match the doctype's"""
+    ocr_engine: str = "tesseract"
+    confidence_threshold: float = 60
+    auto_submit_threshold: float = 95
+    learning_enabled: bool = True
+    handwriting_recognition: bool = True
+    ai_enabled: bool = False
+    ai_model: str = "gpt-3.5-turbo"
+    max_tokens: int = 1500
+    ai_confidence_threshold: float = 80
+    chatbot_enabled: bool = True
+    use_raven_credentials: bool = True
+    chatbot_welcome_message: str = ""
+    chatbot_max_history: int = 20
+    chatbot_auto_suggestions: bool = True
+    google_vision_enabled: bool = False
+    batch_processing_enabled: bool = False
+    max_batch_size: int = 10
+    use_pdf_text_layer: bool = True
+    ocr_cascade_enabled: bool = False
+    image_preprocessing: str = "enhanced"
+    parallel_ocr_workers: int = 0
+    ocr_cache_size_mb: int = 256
+    debug_mode: bool = False
+    openai_api_key: Optional[str] = secret()
+
+@dataclass(frozen=True)
+class RavenSettingsValues:
+    """The Raven Settings the assistant falls back to; defaults when Raven is not installed"""
+    openai_model: str = "gpt-3.5-turbo"
+    openai_api_key: Optional[str] = secret()
+
+class SettingsCache:
+    """
+    Values of a Single doctype, cached per request, per process and in Redis
+    
+    A per-site generation counter in Redis is part of every key. Invalidating
+    bumps it, so each process notices the change with one Redis read and no
+    other cache entries are touched. Password fields are decrypted once per
+    process and generation and kept out of Redis.
+    """
+    
+    def __init__(self, doctype: str, values_class):
+        self.doctype = doctype
+        self.values_class = values_class
+        self.key = SETTINGS_KEY_PREFIX + frappe.scrub(doctype)
+        
+        # site -> (generation, values)
+        self.process_cache = {}
+    
+    def get(self):
+        """Current values, reading the database only after a change"""
+        request_cache = getattr(frappe.local, "fuzzy_waffle_settings", None)
+        if request_cache is None:
+            request_cache = frappe.local.fuzzy_waffle_settings = {}
+        
+        if self.doctype in request_cache:
+            return request_cache[self.doctype]
+        
+        generation = self.get_generation()
+        cached = self.process_cache.get(frappe.local.site)
+        
+        if cached and cached[0] == generation:
+            values = cached[1]
+        else:
+            values = self.build(generation)
+            self.process_cache[frappe.local.site] = (generation, values)
+        
+        request_cache[self.doctype] = values
+        return values
+    
+    def build(self, generation: int):
+        cache = frappe.cache()
+        key = f"{self.key}:v{SETTINGS_CACHE_VERSION}:{generation}"
+        
+        payload = cache.get_value(key)
+        if payload is None:
+            payload = self.load()
+            cache.set_value(key, payload, expires_in_sec=SETTINGS_EXPIRES_IN_SEC)
+        
+        return self.values_class(**payload, **self.load_secrets())
+    
+    def load(self) -> Dict[str, Any]:
+        """Coerce the doctype's stored values to the value class' field types"""
+        if not frappe.db.exists("DocType", self.doctype):
+            return {}
+        
+        doc = frappe.get_single(self.doctype)
+        payload = {}
+        
+        for value_field in fields(self.values_class):
+            if value_field.metadata.get("secret"):
+                continue
+            
+            value = doc.get(value_field.name)
+            if value is None or value == "":
+                continue
+            
+            if value_field.type is bool:
+                value = bool(cint(value))
+            elif value_field.type is int:
+                value = cint(value)
+            elif value_field.type is float:
+                value = flt(value)
+            
+            payload[value_field.name] = value
+        
+        return payload
+    
+    def load_secrets(self) -> Dict[str, Any]:
+        from frappe.utils.password import get_decrypted_password
+        
+        secrets = {}
+        
+        for value_field in fields(self.values_class):
+            if value_field.metadata.get("secret"):
+                secrets[value_field.name] = get_decrypted_password(
+                    self.doctype, self.doctype, value_field.name, raise_exception=False
+                )
+        
+        return secrets
+    
+    def get_generation(self) -> int:
+        return cint(frappe.cache().get(self.generation_key()))
+    
+    def generation_key(self) -> str:
+        return frappe.cache().make_key(self.key + ":generation")
+    
+    def invalidate(self):
+        """Drop the cached values in every process once the current transaction commits"""
+        # Bumping earlier would let another process cache the old values under the new generation
+        frappe.db.after_commit.add(self.bump_generation)
+    
+    def bump_generation(self):
+        cache = frappe.cache()
+        old_generation = self.get_generation()
+        
+        cache.incr(self.generation_key())
+        cache.delete_value(f"{self.key}:v{SETTINGS_CACHE_VERSION}:{old_generation}")
+
+ocr_settings_cache = SettingsCache("OCR Settings", OCRSettingsValues)
+raven_settings_cache = SettingsCache("Raven Settings", RavenSettingsValues)
+
+def get_ocr_settings() -> OCRSettingsValues:
+    """Cached OCR Settings; use instead of frappe.get_single("OCR Settings") on hot paths"""
+    return ocr_settings_cache.get()
+
+def get_raven_settings() -> RavenSettingsValues:
+    """Cached Raven Settings (defaults when Raven is not installed)"""
+    return raven_settings_cache.get()
+
+def clear_raven_settings_cache(doc=None, method=None):
+    """doc_events hook: Raven Settings changed"""
+    raven_settings_cache.invalidate()
@@ -0,0 +1,60 @@
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+
+class OCRSupplierCounter(Document):
+    """Completed Invoice OCR Processor documents of one supplier, maintained by the processor's status changes"""
+    pass
+
+def get_completed_count(supplier: str) -> int:
+    """Completed documents of a supplier, read by primary key"""
+    if not supplier:
+        return 0
+    
+    return frappe.db.get_value("OCR Supplier Counter", supplier, "completed_count") or 0
+
+def update_completed_count(supplier: str, delta: int):
+    """
+    Atomically add delta to a supplier's counter, creating it on first use
+    
+    A single upsert, so concurrent saves never lose an update. It runs in the
+    caller's transaction and is rolled back with the status change that caused it.
+    """
+    if not supplier or not delta:
+        return
+    
+    now = now_datetime()
+    
+    frappe.db.sql("""
+        INSERT INTO `tabOCR Supplier Counter`
+            (name, supplier, completed_count, creation, modified, owner, modified_by, docstatus, idx)
+        VALUES
+            (%(supplier)s, %(supplier)s, GREATEST(%(delta)s, 0), %(now)s, %(now)s, %(user)s, %(user)s, 0, 0)
+        ON DUPLICATE KEY UPDATE
+            completed_count = GREATEST(completed_count + %(delta)s, 0),
+            modified = %(now)s,
+            modified_by = %(user)s
+    """, {"supplier": supplier, "delta": delta, "now": now, "user": frappe.session.user})
+
+def reconcile_supplier_counters():
+    """
+    Daily and after migrate: rebuild every supplier counter from the processor documents
+    
+    Fixes drift from status changes that bypassed document hooks (db_set,
+    bulk inserts, direct SQL) and seeds counters on sites that predate them.
+    """
+    now = now_datetime()
+    
+    frappe.db.sql("DELETE FROM `tabOCR Supplier Counter`")
+    frappe.db.sql("""
+        INSERT INTO `tabOCR Supplier Counter`
+            (name, supplier, completed_count, creation, modified, owner, modified_by, docstatus, idx)
+        SELECT
+            supplier, supplier, COUNT(*), %(now)s, %(now)s, 'Administrator', 'Administrator', 0, 0
+        FROM `tabInvoice OCR Processor`
+        WHERE ocr_status = 'Completed'
+        AND IFNULL(supplier, '') != ''
+        GROUP BY supplier
+    """, {"now": now})
+    
+    frappe.db.commit()
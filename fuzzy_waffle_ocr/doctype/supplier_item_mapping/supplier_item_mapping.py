@@ -5,6 +5,24 @@ import json
 class SupplierItemMapping(Document):
     def validate(self):
         self.update_success_rate()
+    
+    def on_update(self):
+        """Refresh the suggestion index of the supplier (and the previous one, if it changed) and the OCR text index"""
+        from fuzzy_waffle_ocr.learning.suggestion_index import invalidate_supplier_indexes
+        from fuzzy_waffle_ocr.learning.item_text_index import get_mapping_key, get_mapping_texts, log_text_changes
+        
+        before = self.get_doc_before_save()
+        invalidate_supplier_indexes([self.supplier, before.supplier if before else None])
+        log_text_changes([
+            (get_mapping_key(self.name), get_mapping_texts(self.supplier, self.ocr_item_text, self.erpnext_item_code))
+        ])
+    
+    def on_trash(self):
+        from fuzzy_waffle_ocr.learning.suggestion_index import invalidate_supplier_indexes
+        from fuzzy_waffle_ocr.learning.item_text_index import get_mapping_key, log_text_changes
+        
+        invalidate_supplier_indexes([self.supplier])
+        log_text_changes([(get_mapping_key(self.name), [])])
         
     def update_success_rate(self):
         """Calculate success rate based on corrections"""
@@ -68,6 +68,7 @@ doctype_js = {
 
 # before_install = "fuzzy_waffle_ocr.install.before_install"
 after_install = "fuzzy_waffle_ocr.install.after_install"
+after_migrate = ["fuzzy_waffle_ocr.doctype.ocr_supplier_counter.ocr_supplier_counter.reconcile_supplier_counters"]
 
 # Uninstallation
 # ------------
@@ -113,6 +114,14 @@ doc_events = {
     "Journal Entry": {
         "on_update": "fuzzy_waffle_ocr.learning.journal_learning.update_journal_patterns",
         "after_insert": "fuzzy_waffle_ocr.learning.journal_learning.record_new_journal_pattern"
+    },
+    "Raven Settings": {
+        "on_update": "fuzzy_waffle_ocr.doctype.ocr_settings.ocr_settings.clear_raven_settings_cache"
+    },
+    "Item": {
+        "on_update": "fuzzy_waffle_ocr.learning.item_text_index.on_item_update",
+        "on_trash": "fuzzy_waffle_ocr.learning.item_text_index.on_item_trash",
+        "after_rename": "fuzzy_waffle_ocr.learning.item_text_index.on_item_rename"
     }
 }
 
@@ -120,7 +129,13 @@ doc_events = {
 # ---------------
 
 scheduler_events = {
+    "hourly": [
+        "fuzzy_waffle_ocr.ocr.metrics.rollup_pipeline_stats"
+    ],
     "daily": [
+        "fuzzy_waffle_ocr.doctype.ocr_supplier_counter.ocr_supplier_counter.reconcile_supplier_counters",
+        "fuzzy_waffle_ocr.learning.comprehensive_learning.run_incremental_learning",
+        "fuzzy_waffle_ocr.learning.item_text_index.rebuild_item_text_index",
         "fuzzy_waffle_ocr.learning.analytics.calculate_daily_metrics"
     ],
     "weekly": [
@@ -128,6 +143,24 @@ scheduler_events = {
     ]
 }
 
+# Background Jobs
+# ---------------
+# Load the OCR stack once per worker process before its first OCR job
+
+before_job = [
+    "fuzzy_waffle_ocr.ocr.warmup.warm_up_ocr_worker"
+]
+
+# OCR Field Patterns
+# ------------------
+# Functions that receive the fuzzy_waffle_ocr.ocr.extraction.FieldPatternRegistry
+# and register extra invoice field patterns, e.g.
+#   registry.register("tax_info.cess", r'Cess\s*[:.]?\s*([0-9,]+\.?\d*)', parse=parse_amount, hints=("cess",))
+
+# ocr_field_patterns = [
+#	"custom_app.ocr.register_field_patterns"
+# ]
+
 # Testing
 # -------
 
@@ -1,9 +1,41 @@
 import frappe
-from fuzzywuzzy import fuzz, process
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
+# Purchase Invoice columns patterns are learned from, shared by the full and incremental scans
+PURCHASE_INVOICE_PATTERN_COLUMNS = """
+            pi.supplier,
+            pi.project,
+            pi.cost_center,
+            pi.set_warehouse,
+            pi.payment_terms_template,
+            pi.tax_withholding_category,
+            pi.company,
+            pi.posting_date,
+            pi.grand_total,
+            pi.is_return,
+            
+            -- Item level details
+            pii.item_code,
+            pii.item_name,
+            pii.description,
+            pii.item_group,
+            pii.uom,
+            pii.stock_uom,
+            pii.conversion_factor,
+            pii.qty,
+            pii.rate,
+            pii.amount,
+            pii.warehouse,
+            pii.expense_account,
+            pii.cost_center as item_cost_center,
+            pii.project as item_project,
+            
+            -- Tax details
+            pii.item_tax_template
+"""
+
 class ComprehensiveLearning:
     """
     Ultra-intelligent learning system that behaves like an experienced data entry person
@@ -24,73 +56,59 @@ class ComprehensiveLearning:
     def __init__(self):
         self.learning_confidence_threshold = 70
         
-    def learn_from_all_historical_data(self):
-        """Master learning function - analyzes ALL historical transaction patterns"""
-        
-        print("🧠 Starting comprehensive learning from historical data...")
-        
-        # Learn from Purchase Invoices (most comprehensive data)
-        self._learn_from_purchase_invoices()
+    def learn_from_all_historical_data(self, shards: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Master learning function - analyzes ALL historical transaction patterns
         
-        # Learn from Journal Entries (expense patterns)
-        self._learn_from_journal_entries()
+        Queues a sharded learning run on the long queue and returns the run id and
+        its shards; see sharded_learning.start_historical_learning.
+        """
+        from fuzzy_waffle_ocr.learning.sharded_learning import DEFAULT_SHARDS, queue_historical_learning
         
-        # Learn from Payment Entries (payment patterns)  
-        self._learn_from_payment_entries()
+        run = queue_historical_learning(shards or DEFAULT_SHARDS)
+        print(f"🧠 Queued comprehensive learning run {run['run_id']} with {len(run['shards'])} shards")
         
-        # Learn from Asset records (asset categorization)
-        self._learn_from_assets()
+        return run
+    
+    def _learn_from_purchase_invoices(self, shard: Optional[int] = None, shards: int = 1,
+                                      watermark: Optional[Dict[str, str]] = None):
+        """
+        Learn ALL field patterns from Purchase Invoices
         
-        # Learn from Stock Entries (warehouse patterns)
-        self._learn_from_stock_entries()
+        With `shard`, only suppliers hashing to that shard of `shards` are
+        learned, and only their ledger rows are reset; the coordinator passes
+        the run's watermark and sets it once every shard is done.
+        """
+        from fuzzy_waffle_ocr.learning.pattern_aggregator import MappingPatternAggregator
+        from fuzzy_waffle_ocr.learning.streaming import stream_sql
+        from fuzzy_waffle_ocr.doctype.ocr_learning_ledger.ocr_learning_ledger import (
+            get_latest_watermark, reset_ledger, set_watermark
+        )
         
-        # Analyze cross-field relationships
-        self._analyze_field_relationships()
+        # Taken before the scan: documents changing meanwhile are picked up by the next incremental run
+        if shard is None:
+            watermark = get_latest_watermark("Purchase Invoice")
         
-        frappe.db.commit()
-        print("🎯 Comprehensive learning completed!")
+        shard_condition = "AND MOD(CRC32(pi.supplier), %(shards)s) = %(shard)s" if shard is not None else ""
+        values = {"shard": shard, "shards": shards}
         
-    def _learn_from_purchase_invoices(self):
-        """Learn ALL field patterns from Purchase Invoices"""
+        # Bounded by the watermark, so the scan counts exactly the documents the ledger is reset to
+        watermark_condition = ""
+        if watermark:
+            watermark_condition = "AND (pi.modified, pi.name) <= (%(modified)s, %(name)s)"
+            values.update(modified=watermark["modified"], name=watermark["name"])
         
-        query = """
+        query = f"""
             SELECT 
-                pi.supplier,
-                pi.project,
-                pi.cost_center,
-                pi.set_warehouse,
-                pi.payment_terms_template,
-                pi.tax_withholding_category,
-                pi.company,
-                pi.posting_date,
-                pi.grand_total,
-                pi.is_return,
-                
-                -- Item level details
-                pii.item_code,
-                pii.item_name,
-                pii.description,
-                pii.item_group,
-                pii.uom,
-                pii.stock_uom,
-                pii.conversion_factor,
-                pii.qty,
-                pii.rate,
-                pii.amount,
-                pii.warehouse,
-                pii.expense_account,
-                pii.cost_center as item_cost_center,
-                pii.project as item_project,
-                
-                -- Tax details
-                pii.item_tax_template,
-                
+                {PURCHASE_INVOICE_PATTERN_COLUMNS},
                 COUNT(*) as frequency
                 
             FROM `tabPurchase Invoice` pi
             JOIN `tabPurchase Invoice Item` pii ON pi.name = pii.parent
             WHERE pi.creation >= DATE_SUB(CURDATE(), INTERVAL 3 YEAR)
             AND pi.docstatus = 1
+            {shard_condition}
+            {watermark_condition}
             GROUP BY 
                 pi.supplier, pii.item_code, pii.expense_account, 
                 pi.project, pi.cost_center, pii.warehouse
@@ -98,46 +116,171 @@ class ComprehensiveLearning:
             ORDER BY pi.supplier, pii.item_code, frequency DESC
         """
         
-        results = frappe.db.sql(query, as_dict=True)
+        aggregator = MappingPatternAggregator("Purchase Invoice")
         
-        print(f"📊 Analyzing {len(results)} Purchase Invoice patterns...")
+        print("📊 Analyzing Purchase Invoice patterns...")
         
-        for result in results:
-            self._save_comprehensive_pattern(
-                supplier=result.supplier,
-                item_code=result.item_code,
-                item_name=result.item_name or result.item_code,
-                pattern_data={
-                    # Core mappings
-                    "expense_account": result.expense_account,
-                    "project": result.project or result.item_project,
-                    "cost_center": result.cost_center or result.item_cost_center,
-                    "warehouse": result.warehouse or result.set_warehouse,
-                    
-                    # Business intelligence
-                    "payment_terms": result.payment_terms_template,
-                    "item_group": result.item_group,
-                    "tax_template": result.item_tax_template,
-                    
-                    # UOM intelligence  
-                    "supplier_uom": result.uom,
-                    "stock_uom": result.stock_uom,
-                    "conversion_factor": result.conversion_factor,
-                    
-                    # Financial patterns
-                    "average_rate": result.rate,
-                    "average_amount": result.amount,
-                    "total_invoice_value": result.grand_total,
-                    
-                    # Temporal patterns
-                    "last_used_date": result.posting_date,
-                    "usage_frequency": result.frequency,
-                    
-                    # Context
-                    "company": result.company,
-                    "source": "Purchase Invoice"
-                }
+        # Aggregate every row in memory first; each mapping is written once below
+        for result in stream_sql(query, values, label="Purchase Invoice"):
+            self._add_purchase_invoice_pattern(aggregator, result, result.frequency)
+        
+        stats = aggregator.write()
+        
+        # Incremental learning continues from here, counting only documents not in this scan
+        if watermark:
+            reset_ledger(
+                "Purchase Invoice",
+                "docstatus = 1 AND creation >= DATE_SUB(CURDATE(), INTERVAL 3 YEAR) AND (modified, name) <= (%(modified)s, %(name)s)",
+                values,
+                scope="MOD(CRC32(supplier), %(shards)s) = %(shard)s" if shard is not None else None
             )
+            
+            if shard is None:
+                set_watermark("Purchase Invoice", watermark["modified"], watermark["name"])
+        
+        print(
+            f"⚡ Learned {stats['mappings']} mappings ({stats['created']} new) from {stats['rows']} rows "
+            f"in {stats['total_seconds']}s, {stats['rows_per_second']} rows/sec"
+        )
+        
+        return stats
+    
+    def learn_incrementally(self, batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Fold Purchase Invoices changed since the last run into the learned patterns
+        
+        Reads documents past the stored watermark (modified, name) in batches.
+        Submitted documents not yet in the OCR Learning Ledger add their rows to
+        the pattern counts; cancelled documents that are in it subtract them, so
+        an amendment moves its counts from the cancelled original to the new
+        document. Everything is written and the watermark moved in one commit.
+        Without a watermark this runs the full scan, which sets one.
+        """
+        from fuzzy_waffle_ocr.learning.pattern_aggregator import MappingPatternAggregator
+        from fuzzy_waffle_ocr.learning.sharded_learning import get_active_learning_run
+        from fuzzy_waffle_ocr.doctype.ocr_learning_ledger.ocr_learning_ledger import (
+            add_learned, get_learned, get_watermark, remove_learned, set_watermark
+        )
+        
+        # A sharded full run is rebuilding the ledger; it sets the watermark when done
+        active_run = get_active_learning_run()
+        if active_run:
+            print(f"⏳ Historical learning run {active_run} in progress, skipping incremental learning")
+            return {"skipped": True, "run_id": active_run}
+        
+        watermark = get_watermark("Purchase Invoice")
+        if not watermark:
+            stats = self._learn_from_purchase_invoices()
+            frappe.db.commit()
+            return stats
+        
+        aggregator = MappingPatternAggregator("Purchase Invoice", fold=True)
+        added, removed, scanned = [], [], 0
+        
+        while True:
+            documents = frappe.db.sql("""
+                SELECT name, modified, docstatus
+                FROM `tabPurchase Invoice`
+                WHERE docstatus > 0
+                AND (modified > %(modified)s OR (modified = %(modified)s AND name > %(name)s))
+                ORDER BY modified, name
+                LIMIT %(limit)s
+            """, {**watermark, "limit": batch_size}, as_dict=True)
+            
+            if not documents:
+                break
+            
+            scanned += len(documents)
+            learned = get_learned("Purchase Invoice", [d.name for d in documents])
+            signs = {}
+            
+            for d in documents:
+                if d.docstatus == 1 and d.name not in learned:
+                    signs[d.name] = 1
+                elif d.docstatus == 2 and d.name in learned:
+                    signs[d.name] = -1
+            
+            if signs:
+                rows = frappe.db.sql(f"""
+                    SELECT 
+                        pi.name,
+                        {PURCHASE_INVOICE_PATTERN_COLUMNS}
+                    FROM `tabPurchase Invoice` pi
+                    JOIN `tabPurchase Invoice Item` pii ON pi.name = pii.parent
+                    WHERE pi.name IN %(names)s
+                """, {"names": tuple(signs)}, as_dict=True)
+                
+                for row in rows:
+                    self._add_purchase_invoice_pattern(aggregator, row, signs[row.name])
+                
+                added.extend(name for name, sign in signs.items() if sign > 0)
+                removed.extend(name for name, sign in signs.items() if sign < 0)
+            
+            watermark = {"modified": str(documents[-1].modified), "name": documents[-1].name}
+            
+            if len(documents) < batch_size:
+                break
+        
+        stats = aggregator.write()
+        add_learned("Purchase Invoice", added)
+        remove_learned("Purchase Invoice", removed)
+        set_watermark("Purchase Invoice", watermark["modified"], watermark["name"])
+        frappe.db.commit()
+        
+        stats.update(documents_scanned=scanned, documents_added=len(added), documents_removed=len(removed))
+        print(
+            f"⚡ Incremental learning: {len(added)} invoices added, {len(removed)} cancelled, "
+            f"{stats['mappings']} mappings updated in {stats['total_seconds']}s"
+        )
+        
+        return stats
+    
+    def _add_purchase_invoice_pattern(self, aggregator, result, frequency: int):
+        """Add a Purchase Invoice item row (or group of rows) to the aggregator, frequency negative to subtract"""
+        from fuzzy_waffle_ocr.learning.pattern_aggregator import build_pattern
+        
+        pattern_data = {
+            # Core mappings
+            "expense_account": result.expense_account,
+            "project": result.project or result.item_project,
+            "cost_center": result.cost_center or result.item_cost_center,
+            "warehouse": result.warehouse or result.set_warehouse,
+            
+            # Business intelligence
+            "payment_terms": result.payment_terms_template,
+            "item_group": result.item_group,
+            "tax_template": result.item_tax_template,
+            
+            # UOM intelligence  
+            "supplier_uom": result.uom,
+            "stock_uom": result.stock_uom,
+            "conversion_factor": result.conversion_factor,
+            
+            # Financial patterns
+            "average_rate": result.rate,
+            "average_amount": result.amount,
+            "total_invoice_value": result.grand_total,
+            
+            # Temporal patterns
+            "last_used_date": result.posting_date,
+            "usage_frequency": frequency,
+            
+            # Context
+            "company": result.company,
+            "source": "Purchase Invoice"
+        }
+        
+        # Confidence reflects the pattern's strength, not the sign of an incremental delta
+        confidence = self._calculate_pattern_confidence({**pattern_data, "usage_frequency": abs(frequency)})
+        
+        aggregator.add(
+            supplier=result.supplier,
+            item_code=result.item_code,
+            item_name=result.item_name or result.item_code,
+            pattern=build_pattern(pattern_data, confidence),
+            frequency=frequency,
+            last_used=result.posting_date
+        )
     
     def _learn_from_journal_entries(self):
         """Learn expense account patterns from Journal Entries"""
@@ -164,25 +307,33 @@ class ComprehensiveLearning:
             ORDER BY frequency DESC
         """
         
-        results = frappe.db.sql(query, as_dict=True)
+        from fuzzy_waffle_ocr.learning.streaming import stream_sql
         
-        print(f"📝 Analyzing {len(results)} Journal Entry patterns...")
+        print("📝 Analyzing Journal Entry patterns...")
         
-        for result in results:
+        # Remarks reduce to a few item clues: keep only the summed clue patterns while streaming
+        patterns = {}
+        for result in stream_sql(query, label="Journal Entry"):
             # Extract item clues from user_remark
             remark = (result.user_remark or "").lower()
             detected_items = self._extract_item_clues_from_text(remark)
             
             for item_clue in detected_items:
-                self._save_expense_only_pattern(
-                    item_clue=item_clue,
-                    expense_account=result.account,
-                    project=result.project,
-                    cost_center=result.cost_center,
-                    frequency=result.frequency,
-                    source="Journal Entry",
-                    context=result.user_remark
-                )
+                key = (item_clue, result.account, result.project, result.cost_center)
+                pattern = patterns.setdefault(key, {"frequency": 0, "context": result.user_remark})
+                pattern["frequency"] += result.frequency
+        
+        # Written once the stream is done: the connection is busy until then
+        for (item_clue, account, project, cost_center), pattern in patterns.items():
+            self._save_expense_only_pattern(
+                item_clue=item_clue,
+                expense_account=account,
+                project=project,
+                cost_center=cost_center,
+                frequency=pattern["frequency"],
+                source="Journal Entry",
+                context=pattern["context"]
+            )
     
     def _learn_from_payment_entries(self):
         """Learn payment behavior patterns"""
@@ -206,12 +357,13 @@ class ComprehensiveLearning:
             ORDER BY pe.party, frequency DESC
         """
         
-        results = frappe.db.sql(query, as_dict=True)
+        from fuzzy_waffle_ocr.learning.streaming import stream_sql
         
-        print(f"💳 Analyzing {len(results)} Payment Entry patterns...")
+        print("💳 Analyzing Payment Entry patterns...")
         
-        for result in results:
-            self._save_payment_pattern(
+        # Grouped rows are already one per pattern; written once the stream is done
+        patterns = [
+            dict(
                 supplier=result.supplier,
                 mode_of_payment=result.mode_of_payment,
                 bank_account=result.paid_from,
@@ -220,6 +372,11 @@ class ComprehensiveLearning:
                 average_delay=result.avg_payment_delay,
                 frequency=result.frequency
             )
+            for result in stream_sql(query, label="Payment Entry")
+        ]
+        
+        for pattern in patterns:
+            self._save_payment_pattern(**pattern)
     
     def _learn_from_assets(self):
         """Learn asset creation patterns"""
@@ -245,12 +402,13 @@ class ComprehensiveLearning:
             ORDER BY frequency DESC
         """
         
-        results = frappe.db.sql(query, as_dict=True)
+        from fuzzy_waffle_ocr.learning.streaming import stream_sql
         
-        print(f"🏭 Analyzing {len(results)} Asset creation patterns...")
+        print("🏭 Analyzing Asset creation patterns...")
         
-        for result in results:
-            self._save_asset_pattern(
+        # Grouped rows are already one per pattern; written once the stream is done
+        patterns = [
+            dict(
                 supplier=result.supplier,
                 item_code=result.item_code,
                 item_name=result.item_name,
@@ -260,6 +418,11 @@ class ComprehensiveLearning:
                 warehouse=result.warehouse,
                 frequency=result.frequency
             )
+            for result in stream_sql(query, label="Asset")
+        ]
+        
+        for pattern in patterns:
+            self._save_asset_pattern(**pattern)
     
     def _extract_item_clues_from_text(self, text: str) -> List[str]:
         """Extract item clues from description text using intelligent parsing"""
@@ -293,90 +456,6 @@ class ComprehensiveLearning:
         
         return detected_items if detected_items else ['general_expense']
     
-    def _save_comprehensive_pattern(self, supplier: str, item_code: str, 
-                                  item_name: str, pattern_data: Dict[str, Any]):
-        """Save comprehensive learning pattern with all field relationships"""
-        
-        # Check if base mapping exists
-        mapping_name = f"{supplier}-{item_code}".replace(" ", "-")
-        existing = frappe.db.exists("Supplier Item Mapping", {"name": mapping_name})
-        
-        if not existing:
-            # Create base mapping if doesn't exist
-            doc = frappe.get_doc({
-                "doctype": "Supplier Item Mapping",
-                "supplier": supplier,
-                "ocr_item_text": item_name,
-                "erpnext_item_code": item_code,
-                "frequency_count": pattern_data.get('usage_frequency', 1),
-                "confidence_score": min(95, pattern_data.get('usage_frequency', 1) * 10),
-                "last_used": pattern_data.get('last_used_date', datetime.now())
-            })
-            doc.insert(ignore_permissions=True)
-            mapping_name = doc.name
-        
-        # Save comprehensive patterns in a separate table
-        comprehensive_pattern = {
-            "mapping_id": mapping_name,
-            "supplier": supplier,
-            "item_code": item_code,
-            **pattern_data,
-            "created_date": datetime.now().isoformat(),
-            "confidence": self._calculate_pattern_confidence(pattern_data)
-        }
-        
-        # Store in custom table or JSON field
-        self._store_pattern_in_database(comprehensive_pattern)
-    
-    def _store_pattern_in_database(self, pattern: Dict[str, Any]):
-        """Store pattern in database - using Simple approach with existing table"""
-        
-        try:
-            mapping = frappe.get_doc("Supplier Item Mapping", pattern['mapping_id'])
-            
-            # Store comprehensive pattern in JSON field
-            if mapping.expense_head_patterns:
-                existing_patterns = json.loads(mapping.expense_head_patterns)
-            else:
-                existing_patterns = []
-            
-            # Add new pattern
-            existing_patterns.append({
-                "expense_account": pattern.get('expense_account'),
-                "project": pattern.get('project'), 
-                "cost_center": pattern.get('cost_center'),
-                "warehouse": pattern.get('warehouse'),
-                "payment_terms": pattern.get('payment_terms'),
-                "tax_template": pattern.get('tax_template'),
-                "uom_conversion": {
-                    "supplier_uom": pattern.get('supplier_uom'),
-                    "stock_uom": pattern.get('stock_uom'),
-                    "conversion_factor": pattern.get('conversion_factor')
-                },
-                "financial_intelligence": {
-                    "average_rate": pattern.get('average_rate'),
-                    "typical_amount_range": pattern.get('average_amount')
-                },
-                "frequency": pattern.get('usage_frequency', 1),
-                "confidence": pattern.get('confidence', 70),
-                "last_used": pattern.get('last_used_date'),
-                "source": pattern.get('source'),
-                "learned_date": datetime.now().isoformat()
-            })
-            
-            # Keep only top 10 patterns per item
-            existing_patterns = sorted(
-                existing_patterns, 
-                key=lambda x: x.get('frequency', 0), 
-                reverse=True
-            )[:10]
-            
-            mapping.expense_head_patterns = json.dumps(existing_patterns)
-            mapping.save(ignore_permissions=True)
-            
-        except Exception as e:
-            print(f"Error storing pattern: {e}")
-    
     def _calculate_pattern_confidence(self, pattern_data: Dict[str, Any]) -> int:
         """Calculate confidence score based on pattern strength"""
         
@@ -412,6 +491,7 @@ class ComprehensiveLearning:
         - "Their payment terms are always 30 Days"
         - "Spare parts > ₹50,000 are usually Assets"
         """
+        from fuzzy_waffle_ocr.learning.suggestion_index import get_supplier_index
         
         suggestions = {
             "expense_account": None,
@@ -427,49 +507,39 @@ class ComprehensiveLearning:
             "reasoning": []
         }
         
-        # Get supplier patterns
-        supplier_patterns = self._get_supplier_patterns(supplier)
+        # Compiled per-supplier counts, shared across processes and rebuilt only after a mapping changes
+        index = get_supplier_index(supplier)
         
         # Get item-specific patterns
         if item_code:
-            item_patterns = self._get_item_patterns(supplier, item_code)
+            item_codes = [item_code]
         elif ocr_text:
-            item_patterns = self._get_patterns_from_ocr_text(supplier, ocr_text)
+            item_codes = self._get_patterns_from_ocr_text(supplier, ocr_text)
         else:
-            item_patterns = []
+            item_codes = []
         
         # Apply context intelligence
         context_boost = self._apply_context_intelligence(
-            item_patterns, project_context, amount
+            item_codes, project_context, amount
         )
         
         # Generate suggestions
         suggestions.update(self._generate_field_suggestions(
-            supplier_patterns, item_patterns, context_boost
+            index, item_codes, context_boost
         ))
         
         return suggestions
     
-    def _get_supplier_patterns(self, supplier: str) -> List[Dict]:
-        """Get all patterns for a supplier"""
-        
-        mappings = frappe.get_all(
-            "Supplier Item Mapping",
-            filters={"supplier": supplier},
-            fields=["*"]
-        )
+    def _get_patterns_from_ocr_text(self, supplier: str, ocr_text: str) -> List[str]:
+        """Item whose patterns apply to an OCR item text, resolved through the trigram index"""
+        from fuzzy_waffle_ocr.learning.item_text_index import get_item_text_index
+        from fuzzy_waffle_ocr.learning.mapping_resolver import FUZZY_MATCH_THRESHOLD
         
-        patterns = []
-        for mapping in mappings:
-            if mapping.expense_head_patterns:
-                item_patterns = json.loads(mapping.expense_head_patterns)
-                for pattern in item_patterns:
-                    pattern["item_code"] = mapping.erpnext_item_code
-                    patterns.append(pattern)
+        match = get_item_text_index().resolve([ocr_text], supplier, FUZZY_MATCH_THRESHOLD)[0]
         
-        return patterns
+        return [match["item_code"]] if match else []
     
-    def _apply_context_intelligence(self, patterns: List[Dict], 
+    def _apply_context_intelligence(self, item_codes: List[str], 
                                   project_context: str = None, 
                                   amount: float = None) -> Dict:
         """Apply contextual intelligence like a smart data entry person"""
@@ -509,56 +579,26 @@ class ComprehensiveLearning:
         
         return context_boost
     
-    def _generate_field_suggestions(self, supplier_patterns: List[Dict], 
-                                   item_patterns: List[Dict], 
-                                   context_boost: Dict) -> Dict:
-        """Generate intelligent field suggestions"""
-        
-        suggestions = {}
-        all_patterns = supplier_patterns + item_patterns
-        
-        if not all_patterns:
-            return suggestions
-        
-        # Expense Account suggestion
-        expense_accounts = [p.get('expense_account') for p in all_patterns if p.get('expense_account')]
-        if expense_accounts:
-            most_common = max(set(expense_accounts), key=expense_accounts.count)
-            confidence = (expense_accounts.count(most_common) / len(expense_accounts)) * 100
-            suggestions['expense_account'] = {
-                'value': most_common,
-                'confidence': confidence,
-                'reason': f'Used {expense_accounts.count(most_common)} times'
-            }
-        
-        # Project suggestion with context intelligence
-        projects = [p.get('project') for p in all_patterns if p.get('project')]
-        if projects:
-            most_common_project = max(set(projects), key=projects.count)
-            confidence = (projects.count(most_common_project) / len(projects)) * 100
-            
-            # Apply context boost
-            if context_boost.get('expense_preference'):
-                confidence += 15
-                
-            suggestions['project'] = {
-                'value': most_common_project,
-                'confidence': min(95, confidence),
-                'reason': f'Historical pattern + context intelligence'
-            }
+    def _generate_field_suggestions(self, index, item_codes: List[str], context_boost: Dict) -> Dict:
+        """
+        Generate intelligent field suggestions
         
-        # Continue for other fields...
-        return suggestions
+        Every field is scored at once over the supplier index's count arrays:
+        expense account, project, cost center, warehouse, payment terms, tax
+        template, UOM conversion, asset category and mode of payment.
+        """
+        
+        return index.score(item_codes, context_boost)
 
 # API Functions for frontend
 @frappe.whitelist()
 def migrate_comprehensive_learning():
-    """API to trigger comprehensive learning migration"""
+    """API to trigger comprehensive learning migration; poll get_learning_run_status with the returned run id"""
+    from fuzzy_waffle_ocr.learning.sharded_learning import start_historical_learning
     
-    learning = ComprehensiveLearning()
-    learning.learn_from_all_historical_data()
+    run = start_historical_learning()
     
-    return {"status": "success", "message": "Comprehensive learning completed"}
+    return {"status": "queued", "run_id": run["run_id"], "message": "Comprehensive learning queued"}
 
 @frappe.whitelist() 
 def get_smart_suggestions(supplier: str, item_code: str = None, 
@@ -575,4 +615,12 @@ def get_smart_suggestions(supplier: str, item_code: str = None,
         amount=float(amount) if amount else None
     )
     
-    return suggestions
\ No newline at end of file
+    return suggestions
+
+def run_incremental_learning():
+    """Nightly: fold Purchase Invoices changed since the last run into the learned patterns"""
+    try:
+        ComprehensiveLearning().learn_incrementally()
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Incremental learning failed: {e}\n{frappe.get_traceback()}", "OCR Learning")
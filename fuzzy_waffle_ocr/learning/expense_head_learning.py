@@ -1,5 +1,4 @@
 import frappe
-from fuzzywuzzy import fuzz, process
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime
@@ -15,53 +14,31 @@ class ExpenseHeadLearning:
     def __init__(self, supplier: str = None):
         self.supplier = supplier
         
-    def learn_from_historical_data(self):
-        """Learn expense head patterns from historical Purchase Invoices and Journal Entries"""
+    def learn_from_historical_data(self) -> Dict[str, Any]:
+        """Learn expense head patterns from Purchase Invoices changed since the last run and from Journal Entries"""
         
         # Learn from Purchase Invoices
-        self._learn_from_purchase_invoices()
+        stats = self._learn_from_purchase_invoices()
         
         # Learn from Journal Entries  
         self._learn_from_journal_entries()
         
         frappe.db.commit()
         
-    def _learn_from_purchase_invoices(self):
-        """Extract patterns from Purchase Invoice items"""
+        return stats
         
-        # Get Purchase Invoices with expense head data
-        query = """
-            SELECT 
-                pi.supplier,
-                pi.project,
-                pi.cost_center,
-                pii.item_code,
-                pii.item_name,
-                pii.expense_account,
-                COUNT(*) as frequency,
-                pi.creation
-            FROM `tabPurchase Invoice` pi
-            JOIN `tabPurchase Invoice Item` pii ON pi.name = pii.parent
-            WHERE pii.expense_account IS NOT NULL 
-            AND pii.expense_account != ''
-            AND pi.creation >= DATE_SUB(CURDATE(), INTERVAL 3 YEAR)
-            GROUP BY pi.supplier, pii.item_code, pii.expense_account, pi.project
-            ORDER BY frequency DESC
+    def _learn_from_purchase_invoices(self) -> Dict[str, Any]:
         """
+        Fold Purchase Invoices changed since the last run into the item patterns
         
-        results = frappe.db.sql(query, as_dict=True)
+        Invoice item expense accounts are learned with the other item fields by
+        ComprehensiveLearning, whose incremental pass counts each invoice once
+        through the OCR Learning Ledger and subtracts cancelled ones. Scanning
+        the invoices again here would only count them a second time.
+        """
+        from fuzzy_waffle_ocr.learning.comprehensive_learning import ComprehensiveLearning
         
-        for result in results:
-            self._save_expense_pattern(
-                supplier=result.supplier,
-                item_code=result.item_code,
-                item_name=result.item_name,
-                expense_head=result.expense_account,
-                project=result.project,
-                cost_center=result.cost_center,
-                frequency=result.frequency,
-                source="Purchase Invoice"
-            )
+        return ComprehensiveLearning().learn_incrementally()
     
     def _learn_from_journal_entries(self):
         """Extract patterns from Journal Entry accounts"""
@@ -84,9 +61,11 @@ class ExpenseHeadLearning:
             ORDER BY frequency DESC
         """
         
-        results = frappe.db.sql(query, as_dict=True)
+        from fuzzy_waffle_ocr.learning.streaming import stream_sql
         
-        for result in results:
+        # Remarks reduce to a few item hints: keep only the summed patterns while streaming
+        patterns = {}
+        for result in stream_sql(query, label="Journal Entry"):
             # Extract item hints from user_remark
             remark = result.user_remark.lower()
             
@@ -105,16 +84,20 @@ class ExpenseHeadLearning:
                     break
             
             if detected_item:
-                self._save_expense_pattern(
-                    supplier="Journal Entry",
-                    item_code=detected_item,
-                    item_name=detected_item.title(),
-                    expense_head=result.account,
-                    project=result.project,
-                    cost_center=result.cost_center,
-                    frequency=result.frequency,
-                    source="Journal Entry"
-                )
+                key = (detected_item, result.account, result.project, result.cost_center)
+                patterns[key] = patterns.get(key, 0) + result.frequency
+        
+        for (detected_item, account, project, cost_center), frequency in patterns.items():
+            self._save_expense_pattern(
+                supplier="Journal Entry",
+                item_code=detected_item,
+                item_name=detected_item.title(),
+                expense_head=account,
+                project=project,
+                cost_center=cost_center,
+                frequency=frequency,
+                source="Journal Entry"
+            )
     
     def _save_expense_pattern(self, supplier: str, item_code: str, item_name: str, 
                             expense_head: str, project: str = None, cost_center: str = None,
@@ -153,12 +136,14 @@ class ExpenseHeadLearning:
             existing_pattern = None
             for pattern in patterns:
                 if (pattern.get('expense_head') == expense_head and
-                    pattern.get('project') == project):
+                    pattern.get('project') == project and
+                    pattern.get('source', source) == source):
                     existing_pattern = pattern
                     break
             
+            # Frequencies come from a full rescan: replace them, adding would inflate them every run
             if existing_pattern:
-                existing_pattern['frequency'] += frequency
+                existing_pattern['frequency'] = frequency
             else:
                 patterns.append(expense_pattern)
             
@@ -219,12 +204,16 @@ class ExpenseHeadLearning:
             patterns = json.loads(mapping.expense_head_patterns)
             
             for pattern in patterns:
+                expense_head = get_expense_head(pattern)
+                if not expense_head:
+                    continue
+                
                 confidence = self._calculate_pattern_confidence(pattern, project)
                 
                 if confidence > highest_confidence:
                     highest_confidence = confidence
                     best_suggestion = {
-                        "expense_head": pattern['expense_head'],
+                        "expense_head": expense_head,
                         "project": pattern.get('project'),
                         "cost_center": pattern.get('cost_center'),
                         "confidence": confidence,
@@ -321,7 +310,7 @@ class ExpenseHeadLearning:
                 patterns = json.loads(mapping.expense_head_patterns)
                 for pattern in patterns:
                     # Expense head distribution
-                    expense_head = pattern.get('expense_head', 'Unknown')
+                    expense_head = get_expense_head(pattern) or 'Unknown'
                     analytics["expense_head_distribution"][expense_head] = \
                         analytics["expense_head_distribution"].get(expense_head, 0) + pattern.get('frequency', 1)
                     
@@ -337,6 +326,10 @@ class ExpenseHeadLearning:
         
         return analytics
 
+def get_expense_head(pattern: Dict[str, Any]) -> Optional[str]:
+    """Expense head of a learned pattern; Purchase Invoice item patterns store it as expense_account"""
+    return pattern.get('expense_head') or pattern.get('expense_account')
+
 @frappe.whitelist()
 def migrate_expense_head_patterns():
     """Migrate expense head patterns from historical data"""
@@ -0,0 +1,365 @@
+import frappe
+from frappe.utils import cint
+import json
+import numpy as np
+from array import array
+from functools import partial
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from fuzzy_waffle_ocr.learning.item_text_normalization import get_canonical_key, get_match_text, normalize_text
+
+# Bump when the snapshot changes shape, so old Redis entries are never read
+ITEM_TEXT_INDEX_VERSION = 2
+
+ITEM_TEXT_INDEX_KEY_PREFIX = "fuzzy_waffle_ocr:item_text_index:"
+
+# Candidates re-ranked by edit distance per line
+CANDIDATES_PER_LINE = 24
+
+# Posting entries merged per line: rarest trigrams first, common ones dropped once this is reached
+MAX_POSTINGS_PER_LINE = 12000
+
+# Ranking bonus for texts learned from or aliased for the invoice's supplier
+SUPPLIER_BONUS = 0.05
+
+# site -> ItemTextIndex
+process_indexes = {}
+
+# One text an item can be recognized by: (text, item code, supplier it is specific to or None)
+IndexText = Tuple[str, str, Optional[str]]
+
+class ItemTextIndex:
+    """
+    Trigram inverted index over OCR item texts, item names and aliases
+    
+    Each source document (a Supplier Item Mapping, an Item) is a key owning
+    one or more texts. Texts are normalized, OCR confusions folded, and
+    indexed three ways: by the text itself, by its canonical key (also
+    without spacing and units) and by padded trigrams, each trigram's
+    posting list holding the ids of the texts containing it. A lookup tries
+    the two hash lookups first. Otherwise it merges the postings of the
+    line's rarest trigrams, keeps the texts sharing most trigrams and
+    re-ranks only those by edit distance.
+    
+    Replacing a key's texts appends new ids and retires the old ones, so
+    updates never rewrite posting lists; the daily rebuild compacts them.
+    """
+    
+    def __init__(self, seq: int = 0, fold: bool = True):
+        # Change log position this index includes
+        self.seq = seq
+        
+        # Without folding, texts are only normalized and there are no canonical keys (for comparison)
+        self.fold = fold
+        
+        self.texts = []
+        self.item_codes = []
+        self.suppliers = []
+        self.alive = bytearray()
+        
+        self.keys = {}
+        self.exact = {}
+        self.canonical = {}
+        self.postings = {}
+    
+    def set_texts(self, key: str, texts: Iterable[IndexText]):
+        """Replace the texts of a source document; no texts removes it"""
+        for text_id in self.keys.pop(key, ()):
+            self.alive[text_id] = 0
+        
+        text_ids = []
+        for raw_text, item_code, supplier in texts:
+            text = self.get_text(raw_text)
+            if not text or not item_code:
+                continue
+            
+            text_id = len(self.texts)
+            self.texts.append(text)
+            self.item_codes.append(item_code)
+            self.suppliers.append(supplier)
+            self.alive.append(1)
+            
+            self.exact.setdefault(text, []).append(text_id)
+            canonical_key = get_canonical_key(raw_text) if self.fold else None
+            if canonical_key:
+                self.canonical.setdefault(canonical_key, []).append(text_id)
+            for trigram in get_trigrams(text):
+                postings = self.postings.get(trigram)
+                if postings is None:
+                    postings = self.postings[trigram] = array("i")
+                postings.append(text_id)
+            
+            text_ids.append(text_id)
+        
+        if text_ids:
+            self.keys[key] = text_ids
+    
+    def resolve(self, descriptions: List[Optional[str]], supplier: Optional[str] = None,
+                threshold: float = 0.8) -> List[Optional[Dict[str, Any]]]:
+        """
+        Best item for every OCR line of an invoice
+        
+        Returns, in line order, the matched item code, the edit-distance
+        similarity (0-1), the text it matched and how it was found (exact,
+        canonical or fuzzy), or None below threshold.
+        """
+        ratio = get_ratio_function()
+        results = []
+        
+        for description in descriptions:
+            text = self.get_text(description)
+            match, candidates = self.get_hash_candidates(text, get_canonical_key(description) if self.fold else None)
+            best = self.get_best(text, candidates, supplier, threshold, ratio) if candidates else None
+            
+            # A hash hit too far off in edit distance (another pack size) still gets the trigram search
+            if not best and text:
+                match = "fuzzy"
+                best = self.get_best(text, self.get_fuzzy_candidates(text), supplier, threshold, ratio)
+            
+            if best:
+                text_id, similarity = best
+                results.append({
+                    "item_code": self.item_codes[text_id],
+                    "similarity": round(similarity, 4),
+                    "text": self.texts[text_id],
+                    "supplier": self.suppliers[text_id],
+                    "match": match
+                })
+            else:
+                results.append(None)
+        
+        return results
+    
+    def get_best(self, text: str, candidates: List[int], supplier: Optional[str], threshold: float,
+                 ratio) -> Optional[Tuple[int, float]]:
+        """Most similar live candidate at or above threshold, preferring the supplier's own texts"""
+        best, best_rank = None, None
+        
+        for text_id in candidates:
+            if not self.alive[text_id]:
+                continue
+            
+            similarity = ratio(text, self.texts[text_id])
+            if similarity < threshold:
+                continue
+            
+            rank = similarity + (SUPPLIER_BONUS if supplier and self.suppliers[text_id] == supplier else 0)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = (text_id, similarity), rank
+        
+        return best
+    
+    def get_text(self, text: Optional[str]) -> str:
+        return get_match_text(text) if self.fold else normalize_text(text)
+    
+    def get_hash_candidates(self, text: str, key: Optional[str] = None) -> Tuple[Optional[str], List[int]]:
+        """Live texts equal to the line, else sharing its canonical key, and which of the two it was"""
+        for match, ids in (("exact", self.exact.get(text)), ("canonical", self.canonical.get(key))):
+            found = [text_id for text_id in ids or () if self.alive[text_id]]
+            if found:
+                return match, found
+        
+        return None, []
+    
+    def get_fuzzy_candidates(self, text: str) -> List[int]:
+        """Text ids sharing most trigrams with the text"""
+        postings = sorted(
+            (self.postings[trigram] for trigram in get_trigrams(text) if trigram in self.postings),
+            key=len
+        )
+        if not postings:
+            return []
+        
+        merged, total = [], 0
+        for posting in postings:
+            if merged and total + len(posting) > MAX_POSTINGS_PER_LINE:
+                break
+            merged.append(posting)
+            total += len(posting)
+        
+        text_ids, shared = np.unique(np.frombuffer(b"".join(merged), dtype=np.int32), return_counts=True)
+        
+        # Room for retired ids, skipped by get_best
+        limit = CANDIDATES_PER_LINE * 2
+        if len(text_ids) > limit:
+            text_ids = text_ids[np.argpartition(-shared, limit)[:limit]]
+        
+        return text_ids.tolist()
+    
+    def to_payload(self) -> Dict[str, Any]:
+        return {
+            "seq": self.seq,
+            "fold": self.fold,
+            "texts": self.texts,
+            "item_codes": self.item_codes,
+            "suppliers": self.suppliers,
+            "alive": self.alive,
+            "keys": self.keys,
+            "exact": self.exact,
+            "canonical": self.canonical,
+            "postings": self.postings
+        }
+    
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "ItemTextIndex":
+        index = cls()
+        for name, value in payload.items():
+            setattr(index, name, value)
+        return index
+
+def get_trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def get_ratio_function():
+    """Normalized edit-distance similarity, from python-Levenshtein when available"""
+    try:
+        from Levenshtein import ratio
+    except ImportError:
+        from difflib import SequenceMatcher
+        ratio = lambda a, b: SequenceMatcher(None, a, b).ratio()
+    
+    return ratio
+
+def get_item_text_index() -> ItemTextIndex:
+    """
+    This process' index for the site, brought up to date with the shared change log
+    
+    The index is loaded once per process from the Redis snapshot (built from
+    the database when missing). Every call then costs one Redis read of the
+    change log position, plus one read of the changes when there are new ones.
+    """
+    cache = frappe.cache()
+    seq = cint(cache.get(get_key("seq")))
+    
+    index = process_indexes.get(frappe.local.site)
+    if index is None:
+        index = process_indexes[frappe.local.site] = load_item_text_index()
+    
+    if index.seq < seq:
+        index = catch_up(index, seq)
+    
+    return index
+
+def load_item_text_index() -> ItemTextIndex:
+    payload = frappe.cache().get_value(f"{ITEM_TEXT_INDEX_KEY_PREFIX}snapshot:v{ITEM_TEXT_INDEX_VERSION}")
+    if payload is None:
+        return rebuild_item_text_index()
+    
+    return ItemTextIndex.from_payload(payload)
+
+def catch_up(index: ItemTextIndex, seq: int) -> ItemTextIndex:
+    """Apply the logged changes after the index's position, in order"""
+    from redis import Redis
+    
+    cache = frappe.cache()
+    positions = list(range(index.seq + 1, seq + 1))
+    changes = Redis.hmget(cache, get_key("changes"), positions)
+    
+    for position, change in zip(positions, changes):
+        if change is None:
+            # Compacted into a newer snapshot: start from that one instead
+            if index.seq < cint(cache.get(get_key("snapshot_seq"))):
+                index = process_indexes[frappe.local.site] = load_item_text_index()
+                return catch_up(index, seq) if index.seq < seq else index
+            
+            # Still being written by its sender; picked up on a later call
+            break
+        
+        key, texts = json.loads(change)
+        index.set_texts(key, texts)
+        index.seq = position
+    
+    return index
+
+def rebuild_item_text_index() -> ItemTextIndex:
+    """
+    Daily: build the index from the database and store it as the shared snapshot
+    
+    Changes logged up to the position read first are in the snapshot and are
+    dropped from the log. Later ones are applied on top again, which is safe
+    since a change replaces a key's texts.
+    """
+    from redis import Redis
+    from fuzzy_waffle_ocr.learning.streaming import stream_sql
+    
+    cache = frappe.cache()
+    index = ItemTextIndex(seq=cint(cache.get(get_key("seq"))))
+    
+    items = {}
+    for row in stream_sql("SELECT name, item_name FROM `tabItem` WHERE disabled = 0"):
+        items[row.name] = [(row.item_name, row.name, None), (row.name, row.name, None)]
+    
+    for row in stream_sql("""
+        SELECT parent, supplier, supplier_part_no
+        FROM `tabItem Supplier`
+        WHERE parenttype = 'Item' AND IFNULL(supplier_part_no, '') != ''
+    """):
+        if row.parent in items:
+            items[row.parent].append((row.supplier_part_no, row.parent, row.supplier))
+    
+    for item_code, texts in items.items():
+        index.set_texts(get_item_key(item_code), texts)
+    
+    for row in stream_sql("""
+        SELECT name, supplier, ocr_item_text, erpnext_item_code
+        FROM `tabSupplier Item Mapping`
+        WHERE IFNULL(ocr_item_text, '') != '' AND IFNULL(erpnext_item_code, '') != ''
+    """):
+        index.set_texts(get_mapping_key(row.name), [(row.ocr_item_text, row.erpnext_item_code, row.supplier)])
+    
+    cache.set_value(f"{ITEM_TEXT_INDEX_KEY_PREFIX}snapshot:v{ITEM_TEXT_INDEX_VERSION}", index.to_payload())
+    cache.set(get_key("snapshot_seq"), index.seq)
+    
+    compacted = [field for field in Redis.hkeys(cache, get_key("changes")) if cint(field) <= index.seq]
+    if compacted:
+        Redis.hdel(cache, get_key("changes"), *compacted)
+    
+    process_indexes[frappe.local.site] = index
+    return index
+
+def get_key(name: str) -> str:
+    return frappe.cache().make_key(ITEM_TEXT_INDEX_KEY_PREFIX + name)
+
+def get_item_key(item_code: str) -> str:
+    return f"Item::{item_code}"
+
+def get_mapping_key(mapping: str) -> str:
+    return f"Supplier Item Mapping::{mapping}"
+
+def log_text_changes(changes: List[Tuple[str, List[IndexText]]]):
+    """Share changed texts with every process once the current transaction commits"""
+    if changes:
+        frappe.db.after_commit.add(partial(push_text_changes, changes))
+
+def push_text_changes(changes: List[Tuple[str, List[IndexText]]]):
+    from redis import Redis
+    
+    cache = frappe.cache()
+    for key, texts in changes:
+        position = cache.incr(get_key("seq"))
+        Redis.hset(cache, get_key("changes"), position, json.dumps([key, texts]))
+
+def get_item_texts(doc) -> List[IndexText]:
+    if doc.get("disabled"):
+        return []
+    
+    texts = [(doc.item_name, doc.name, None), (doc.name, doc.name, None)]
+    for row in doc.get("supplier_items") or []:
+        if row.supplier_part_no:
+            texts.append((row.supplier_part_no, doc.name, row.supplier))
+    
+    return texts
+
+def get_mapping_texts(supplier: str, ocr_item_text: str, item_code: str) -> List[IndexText]:
+    return [(ocr_item_text, item_code, supplier)] if ocr_item_text and item_code else []
+
+def on_item_update(doc, method=None):
+    """doc_events hook: an Item's name, aliases or enabled state may have changed"""
+    log_text_changes([(get_item_key(doc.name), get_item_texts(doc))])
+
+def on_item_trash(doc, method=None):
+    log_text_changes([(get_item_key(doc.name), [])])
+
+def on_item_rename(doc, method=None, old_name=None, new_name=None, merge=False):
+    log_text_changes([(get_item_key(old_name), []), (get_item_key(new_name), get_item_texts(doc))])
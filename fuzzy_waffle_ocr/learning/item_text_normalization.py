@@ -0,0 +1,50 @@
+import re
+from typing import Optional
+
+# Characters OCR confuses, folded to one representative of their class
+CONFUSION_FOLDS = str.maketrans({
+    "0": "o",
+    "1": "l", "i": "l", "|": "l",
+    "5": "s",
+    "8": "b",
+    "2": "z",
+    "6": "g"
+})
+
+# Letter pairs read as one letter, folded before single characters
+CONFUSION_PAIRS = (("rn", "m"), ("vv", "w"))
+
+# A quantity with a unit ("5 ltr", "500ML", "2x1kg", "1.5-L"); digits only, so "0IL" stays a word
+UNIT_PATTERN = re.compile(
+    r"(?<![a-z0-9])\d+(?:[.,]\d+)?[\s-]*(?:x[\s-]*\d+(?:[.,]\d+)?[\s-]*)?"
+    r"(?:ml|ltrs?|litres?|liters?|lts?|l|kgs?|gms?|g|mg|pcs?|nos?|units?|mtrs?|m|mm|cm|ft"
+    r"|box(?:es)?|pkts?|packs?|btls?|bottles?|cans?|drums?)(?![a-z0-9])"
+)
+
+NON_ALPHANUMERIC_PATTERN = re.compile(r"[^0-9a-z]+")
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase text with punctuation and whitespace runs collapsed to one space"""
+    return NON_ALPHANUMERIC_PATTERN.sub(" ", (text or "").lower()).strip()
+
+def fold_confusions(text: str) -> str:
+    """Fold OCR confusion classes (0/O, 1/l/I, 5/S, 8/B, 2/Z, 6/G, rn/m, vv/w) of normalized text"""
+    for pair, letter in CONFUSION_PAIRS:
+        text = text.replace(pair, letter)
+    return text.translate(CONFUSION_FOLDS)
+
+def get_match_text(text: Optional[str]) -> str:
+    """Normalized, confusion-folded text, compared by edit distance; keeps units and spacing"""
+    return fold_confusions(normalize_text(text))
+
+def get_canonical_key(text: Optional[str]) -> str:
+    """
+    Key equal for texts differing only by OCR confusions, punctuation, spacing or units
+    
+    "0IL FILTER 5 LTR", "Oil filter 5L" and "OIL F1LTER" share one key, so
+    most scanned lines resolve with one hash lookup. Units are dropped from
+    the key only; edit distance on get_match_text still tells pack sizes
+    apart when a key holds several items.
+    """
+    text = UNIT_PATTERN.sub(" ", (text or "").lower())
+    return fold_confusions(normalize_text(text)).replace(" ", "")
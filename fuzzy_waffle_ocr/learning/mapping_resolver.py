@@ -0,0 +1,266 @@
+import frappe
+import json
+import re
+from collections import Counter
+from typing import Dict, List, Any, Optional
+
+# Every Supplier Item Mapping field the resolver reads, loaded in one query per supplier
+MAPPING_FIELDS = [
+    "name", "ocr_item_text", "erpnext_item_code", "confidence_score", "frequency_count",
+    "success_rate", "uom_conversion_pattern", "payment_terms_pattern",
+    "expense_head_patterns", "default_expense_head"
+]
+
+# OCR text at least this similar to a learned text is taken as the same item
+FUZZY_MATCH_THRESHOLD = 0.8
+
+# Confidence of a full match on an item name or alias the supplier has no mapping for
+CATALOG_MATCH_CONFIDENCE = 70
+
+# Project suggestions never claim more than this
+MAX_PROJECT_CONFIDENCE = 95
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_item_text(text: Optional[str]) -> str:
+    """Lowercase text with whitespace collapsed, the key learned item texts are indexed by"""
+    return WHITESPACE_PATTERN.sub(" ", (text or "").lower()).strip()
+
+def parse_json_field(value) -> Any:
+    """Parse a JSON field once; malformed values count as empty"""
+    if not value:
+        return None
+    
+    if not isinstance(value, str):
+        return value
+    
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+class SupplierMappingResolver:
+    """
+    Resolve a whole invoice against one supplier's learned mappings
+    
+    All Supplier Item Mapping rows of the supplier are read with one query and
+    indexed by normalized OCR text and by OCR-confusion-folded canonical key,
+    with their JSON patterns parsed once. Lines matching neither are
+    resolved together through the shared trigram index over every mapping, item name and alias. Items, UOM
+    conversions, payment terms, the project and the overall confidence are
+    then worked out in memory, so an invoice costs the same number of
+    queries however many items it has.
+    """
+    
+    def __init__(self, supplier: str):
+        self.supplier = supplier
+        self.mappings = self.load_mappings() if supplier else []
+        
+        # First mapping wins for a text or item: rows come most used first
+        self.index = {}
+        self.canonical = {}
+        self.by_item = {}
+        for mapping in self.mappings:
+            self.index.setdefault(mapping["key"], mapping)
+            self.by_item.setdefault(mapping["item_code"], mapping)
+            if mapping["canonical_key"]:
+                self.canonical.setdefault(mapping["canonical_key"], []).append(mapping)
+    
+    def load_mappings(self) -> List[Dict[str, Any]]:
+        from fuzzy_waffle_ocr.learning.item_text_normalization import get_canonical_key, get_match_text
+        from fuzzy_waffle_ocr.learning.pattern_aggregator import get_top_patterns
+        
+        rows = frappe.get_all(
+            "Supplier Item Mapping",
+            filters={"supplier": self.supplier},
+            fields=MAPPING_FIELDS,
+            order_by="frequency_count desc"
+        )
+        
+        mappings = []
+        for row in rows:
+            if not row.erpnext_item_code:
+                continue
+            
+            mappings.append({
+                "name": row.name,
+                "key": normalize_item_text(row.ocr_item_text),
+                "canonical_key": get_canonical_key(row.ocr_item_text),
+                "match_text": get_match_text(row.ocr_item_text),
+                "item_code": row.erpnext_item_code,
+                "confidence": row.confidence_score or 0,
+                "frequency": row.frequency_count or 0,
+                "success_rate": row.success_rate,
+                "uom_conversion": parse_json_field(row.uom_conversion_pattern),
+                "payment_terms": row.payment_terms_pattern,
+                "expense_patterns": get_top_patterns(parse_json_field(row.expense_head_patterns)),
+                "default_expense_head": row.default_expense_head
+            })
+        
+        return mappings
+    
+    def resolve(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Resolve extracted invoice data in one pass
+        
+        Returns item results (in item order, None where no mapping matched),
+        the payment terms, the project suggestion and the overall confidence.
+        """
+        items = extracted_data.get("items") or []
+        matches = self.match_items([item.get("description") for item in items])
+        
+        results = []
+        for item, match in zip(items, matches):
+            if not match:
+                results.append(None)
+                continue
+            
+            mapping, item_code, confidence = match
+            result = {"item_code": item_code, "confidence": confidence}
+            
+            conversion = mapping and self.convert_uom(mapping, item.get("quantity"), item.get("uom"), item.get("rate"))
+            if conversion:
+                result.update(conversion)
+            
+            results.append(result)
+        
+        matched = [match[0] for match in matches if match and match[0]]
+        
+        return {
+            "items": results,
+            "payment_terms": self.get_payment_terms(matched) if extracted_data.get("payment_terms") else None,
+            "project": self.suggest_project(matched),
+            "confidence": self.get_overall_confidence(items, results)
+        }
+    
+    def match_items(self, descriptions: List[Optional[str]]) -> List[Optional[tuple]]:
+        """
+        (mapping or None, item code, confidence) for every OCR item text, None where nothing matched
+        
+        Exact texts are looked up in the supplier's mappings, then texts
+        differing only by OCR confusions, spacing or units by canonical key;
+        the rest go to the trigram index in one call. A canonical or fuzzy
+        match on an item the supplier has a mapping for uses that mapping,
+        scaled by the similarity.
+        """
+        from fuzzy_waffle_ocr.learning.item_text_index import get_item_text_index
+        
+        matches = []
+        unmatched = []
+        
+        for position, description in enumerate(descriptions):
+            mapping = self.index.get(normalize_item_text(description))
+            match = (mapping, mapping["item_code"], mapping["confidence"]) if mapping else None
+            
+            if not match and description:
+                match = self.match_canonical(description)
+            
+            matches.append(match)
+            if not match and description:
+                unmatched.append(position)
+        
+        if not unmatched:
+            return matches
+        
+        resolved = get_item_text_index().resolve(
+            [descriptions[position] for position in unmatched], self.supplier, FUZZY_MATCH_THRESHOLD
+        )
+        
+        for position, match in zip(unmatched, resolved):
+            if not match:
+                continue
+            
+            mapping = self.by_item.get(match["item_code"])
+            if mapping:
+                matches[position] = (mapping, mapping["item_code"], round(mapping["confidence"] * match["similarity"], 2))
+            else:
+                matches[position] = (None, match["item_code"], round(CATALOG_MATCH_CONFIDENCE * match["similarity"], 2))
+        
+        return matches
+    
+    def match_canonical(self, description: str) -> Optional[tuple]:
+        """Most similar mapping sharing the text's canonical key; edit distance tells pack sizes apart"""
+        from fuzzy_waffle_ocr.learning.item_text_index import get_ratio_function
+        from fuzzy_waffle_ocr.learning.item_text_normalization import get_canonical_key, get_match_text
+        
+        mappings = self.canonical.get(get_canonical_key(description))
+        if not mappings:
+            return None
+        
+        ratio = get_ratio_function()
+        text = get_match_text(description)
+        similarity, mapping = max(((ratio(text, mapping["match_text"]), mapping) for mapping in mappings),
+                                  key=lambda candidate: candidate[0])
+        
+        if similarity < FUZZY_MATCH_THRESHOLD:
+            return None
+        
+        return (mapping, mapping["item_code"], round(mapping["confidence"] * similarity, 2))
+    
+    def convert_uom(self, mapping: Dict[str, Any], quantity, uom: Optional[str], rate) -> Optional[Dict[str, Any]]:
+        """Quantity, UOM and rate in the stock UOM, when the mapping learned a conversion for the OCR UOM"""
+        conversion = mapping["uom_conversion"]
+        if not isinstance(conversion, dict):
+            return None
+        
+        factor = conversion.get("conversion_factor")
+        stock_uom = conversion.get("stock_uom")
+        supplier_uom = conversion.get("supplier_uom")
+        
+        if not factor or not stock_uom or quantity is None:
+            return None
+        
+        if uom and supplier_uom and uom.lower() != supplier_uom.lower():
+            return None
+        
+        factor = float(factor)
+        
+        return {
+            "erpnext_quantity": float(quantity) * factor,
+            "erpnext_uom": stock_uom,
+            "erpnext_rate": float(rate) / factor if rate is not None else None
+        }
+    
+    def get_payment_terms(self, matched: List[Dict[str, Any]]) -> Optional[str]:
+        """Payment terms learned most often, preferring the invoice's own items over the rest of the supplier"""
+        for mappings in (matched, self.mappings):
+            terms = Counter()
+            
+            for mapping in mappings:
+                if mapping["payment_terms"]:
+                    terms[mapping["payment_terms"]] += mapping["frequency"] or 1
+                
+                for pattern in mapping["expense_patterns"]:
+                    if isinstance(pattern, dict) and pattern.get("payment_terms"):
+                        terms[pattern["payment_terms"]] += pattern.get("frequency") or 1
+            
+            if terms:
+                return terms.most_common(1)[0][0]
+        
+        return None
+    
+    def suggest_project(self, matched: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Project the matched items were booked against most often, weighted by pattern frequency"""
+        projects = Counter()
+        
+        for mapping in matched:
+            for pattern in mapping["expense_patterns"]:
+                if isinstance(pattern, dict) and pattern.get("project"):
+                    projects[pattern["project"]] += pattern.get("frequency") or 1
+        
+        if not projects:
+            return None
+        
+        project, weight = projects.most_common(1)[0]
+        
+        return {
+            "project": project,
+            "confidence": min(MAX_PROJECT_CONFIDENCE, round(weight * 100 / sum(projects.values()), 2))
+        }
+    
+    def get_overall_confidence(self, items: List[Dict[str, Any]], results: List[Optional[Dict[str, Any]]]) -> float:
+        """Mean item confidence, unmatched items counting as 0"""
+        if not items:
+            return 0
+        
+        return round(sum(result["confidence"] for result in results if result) / len(items), 2)
@@ -0,0 +1,271 @@
+import frappe
+from frappe.utils import now as now_str
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+# Patterns read per mapping, most frequent first; every pattern is stored so counts survive folding
+MAX_PATTERNS_PER_MAPPING = 10
+
+# Rows per multi-row upsert statement
+UPSERT_CHUNK_SIZE = 500
+
+# Suppliers per lookup of existing mappings
+LOOKUP_CHUNK_SIZE = 200
+
+# Pattern fields that make two learned rows the same pattern
+PATTERN_KEY_FIELDS = ("expense_account", "project", "cost_center", "warehouse")
+
+class MappingPatternAggregator:
+    """
+    Aggregate learned patterns in memory, then write each Supplier Item Mapping once
+    
+    Rows are added per (supplier, item code); identical patterns are merged
+    by summing their frequency. write() reads the existing mappings with a
+    few batched queries and writes every mapping with multi-row upserts, so
+    a learning run costs a handful of statements per thousand mappings
+    instead of several round trips and a document save per row.
+    
+    Patterns from the run's source replace those the same source stored
+    before, so running the learning again does not double count history.
+    With `fold`, rows are instead signed deltas added to the stored counts:
+    incremental learning adds new documents and subtracts cancelled ones,
+    and patterns whose count drops to zero are removed. A mapping's
+    frequency, confidence and last use are recomputed from its merged
+    patterns on every write.
+    """
+    
+    def __init__(self, source: str, fold: bool = False):
+        self.source = source
+        self.fold = fold
+        self.mappings = {}
+        self.rows = 0
+        self.started = time.monotonic()
+    
+    def add(self, supplier: str, item_code: str, item_name: str, pattern: Dict[str, Any], frequency: int = 1,
+            last_used=None):
+        """Add one learned row for a supplier's item"""
+        if not supplier or not item_code:
+            return
+        
+        self.rows += 1
+        
+        mapping = self.mappings.setdefault((supplier, item_code), {
+            "item_name": item_name or item_code,
+            "frequency": 0,
+            "last_used": None,
+            "patterns": {}
+        })
+        mapping["frequency"] += frequency or 0
+        if last_used and (not mapping["last_used"] or last_used > mapping["last_used"]):
+            mapping["last_used"] = last_used
+        
+        key = get_pattern_key(pattern)
+        existing = mapping["patterns"].get(key)
+        
+        if existing:
+            add_to_pattern(existing, pattern)
+        else:
+            mapping["patterns"][key] = dict(pattern)
+    
+    def write(self) -> Dict[str, Any]:
+        """Upsert every aggregated mapping and return run statistics"""
+        from fuzzy_waffle_ocr.learning.suggestion_index import invalidate_supplier_indexes
+        from fuzzy_waffle_ocr.learning.item_text_index import get_mapping_key, get_mapping_texts, log_text_changes
+        
+        aggregated = time.monotonic()
+        existing = self.get_existing_mappings()
+        
+        now = now_str()
+        user = frappe.session.user
+        new_rows, updated_rows = [], []
+        
+        for (supplier, item_code), mapping in self.mappings.items():
+            current = existing.get((supplier, item_code))
+            
+            if current:
+                patterns = self.merge_patterns(current["expense_head_patterns"], mapping["patterns"])
+                frequency, last_used = get_pattern_totals(patterns)
+                updated_rows.append((
+                    current["name"], json.dumps(patterns, default=str), frequency, get_confidence(frequency),
+                    last_used, now, user
+                ))
+            else:
+                patterns = self.merge_patterns(None, mapping["patterns"])
+                
+                # Only cancellations of a mapping nobody learned yet: nothing to create
+                if not patterns or mapping["frequency"] <= 0:
+                    continue
+                
+                new_rows.append((
+                    frappe.generate_hash(length=10), supplier, mapping["item_name"], item_code,
+                    mapping["frequency"], get_confidence(mapping["frequency"]), 100 if mapping["frequency"] else 0,
+                    mapping["last_used"] or now, json.dumps(patterns, default=str), now, now, user, user
+                ))
+        
+        self.insert_mappings(new_rows)
+        self.update_patterns(updated_rows)
+        
+        # Bulk writes skip the mapping's hooks
+        invalidate_supplier_indexes(supplier for supplier, _ in self.mappings)
+        log_text_changes([
+            (get_mapping_key(row[0]), get_mapping_texts(row[1], row[2], row[3])) for row in new_rows
+        ])
+        
+        finished = time.monotonic()
+        seconds = finished - self.started
+        
+        return {
+            "source": self.source,
+            "rows": self.rows,
+            "mappings": len(self.mappings),
+            "created": len(new_rows),
+            "updated": len(updated_rows),
+            "aggregate_seconds": round(aggregated - self.started, 2),
+            "write_seconds": round(finished - aggregated, 2),
+            "total_seconds": round(seconds, 2),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else 0.0
+        }
+    
+    def get_existing_mappings(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Existing mappings of the aggregated keys, the most used one where a key has several"""
+        suppliers = sorted({supplier for supplier, _ in self.mappings})
+        existing = {}
+        
+        for i in range(0, len(suppliers), LOOKUP_CHUNK_SIZE):
+            rows = frappe.get_all(
+                "Supplier Item Mapping",
+                filters={"supplier": ["in", suppliers[i:i + LOOKUP_CHUNK_SIZE]]},
+                fields=["name", "supplier", "erpnext_item_code", "expense_head_patterns"],
+                order_by="frequency_count desc"
+            )
+            
+            for row in rows:
+                key = (row.supplier, row.erpnext_item_code)
+                if key in self.mappings:
+                    existing.setdefault(key, row)
+        
+        return existing
+    
+    def merge_patterns(self, stored: Optional[str], learned: Dict[tuple, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Stored patterns of other sources plus this run's (or, folding, this run's added to the stored), most frequent first
+        
+        Every pattern is kept: one that is not among the most frequent now still
+        holds its count for later increments and decrements. Readers take the
+        top ones with get_top_patterns.
+        """
+        from fuzzy_waffle_ocr.learning.mapping_resolver import parse_json_field
+        
+        patterns = []
+        own = {}
+        
+        for pattern in parse_json_field(stored) or []:
+            if not isinstance(pattern, dict):
+                continue
+            
+            # Left by ExpenseHeadLearning's old rescan, which counted the same Purchase Invoices again
+            if pattern.get("source") == self.source and "expense_head" in pattern:
+                continue
+            
+            if pattern.get("source") != self.source:
+                patterns.append(pattern)
+            elif self.fold:
+                key = get_pattern_key(pattern)
+                if key in own:
+                    add_to_pattern(own[key], pattern)
+                else:
+                    own[key] = pattern
+        
+        for key, pattern in learned.items():
+            if key in own:
+                add_to_pattern(own[key], pattern)
+            else:
+                own[key] = dict(pattern)
+        
+        patterns.extend(pattern for pattern in own.values() if (pattern.get("frequency") or 0) > 0)
+        
+        return sorted(patterns, key=lambda x: x.get("frequency", 0), reverse=True)
+    
+    def insert_mappings(self, rows: List[tuple]):
+        fields = (
+            "name", "supplier", "ocr_item_text", "erpnext_item_code", "frequency_count", "confidence_score",
+            "success_rate", "last_used", "expense_head_patterns", "creation", "modified", "owner", "modified_by"
+        )
+        
+        for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            frappe.db.bulk_insert("Supplier Item Mapping", fields, rows[i:i + UPSERT_CHUNK_SIZE])
+    
+    def update_patterns(self, rows: List[tuple]):
+        """Replace the patterns of existing mappings and the counts derived from them, many rows per statement"""
+        for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[i:i + UPSERT_CHUNK_SIZE]
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+            
+            frappe.db.sql(f"""
+                INSERT INTO `tabSupplier Item Mapping`
+                    (name, expense_head_patterns, frequency_count, confidence_score, last_used, modified, modified_by)
+                VALUES {placeholders}
+                ON DUPLICATE KEY UPDATE
+                    expense_head_patterns = VALUES(expense_head_patterns),
+                    frequency_count = VALUES(frequency_count),
+                    confidence_score = VALUES(confidence_score),
+                    last_used = COALESCE(VALUES(last_used), last_used),
+                    modified = VALUES(modified),
+                    modified_by = VALUES(modified_by)
+            """, [value for row in chunk for value in row])
+
+def get_pattern_key(pattern: Dict[str, Any]) -> tuple:
+    return tuple(pattern.get(field) for field in PATTERN_KEY_FIELDS)
+
+def get_top_patterns(patterns: Any) -> List[Dict[str, Any]]:
+    """The most frequent patterns of a mapping's parsed expense_head_patterns"""
+    if not isinstance(patterns, list):
+        return []
+    
+    patterns = [pattern for pattern in patterns if isinstance(pattern, dict)]
+    return sorted(patterns, key=lambda x: x.get("frequency") or 0, reverse=True)[:MAX_PATTERNS_PER_MAPPING]
+
+def get_pattern_totals(patterns: List[Dict[str, Any]]) -> Tuple[int, Optional[str]]:
+    """A mapping's frequency and last use, from all of its patterns"""
+    frequency = sum(max(pattern.get("frequency") or 0, 0) for pattern in patterns)
+    last_used = max((pattern["last_used"] for pattern in patterns if pattern.get("last_used")), default=None)
+    
+    return frequency, last_used
+
+def get_confidence(frequency: int) -> int:
+    return min(95, max(frequency, 0) * 10)
+
+def add_to_pattern(pattern: Dict[str, Any], delta: Dict[str, Any]):
+    """Add a pattern's count to another of the same key, keeping the latest use"""
+    pattern["frequency"] = (pattern.get("frequency") or 0) + (delta.get("frequency") or 0)
+    
+    if (delta.get("frequency") or 0) > 0 and (delta.get("last_used") or "") > (pattern.get("last_used") or ""):
+        pattern["last_used"] = delta["last_used"]
+        pattern["learned_date"] = delta.get("learned_date")
+
+def build_pattern(pattern_data: Dict[str, Any], confidence: int) -> Dict[str, Any]:
+    """Pattern as stored in Supplier Item Mapping's expense_head_patterns"""
+    return {
+        "expense_account": pattern_data.get('expense_account'),
+        "project": pattern_data.get('project'),
+        "cost_center": pattern_data.get('cost_center'),
+        "warehouse": pattern_data.get('warehouse'),
+        "payment_terms": pattern_data.get('payment_terms'),
+        "tax_template": pattern_data.get('tax_template'),
+        "uom_conversion": {
+            "supplier_uom": pattern_data.get('supplier_uom'),
+            "stock_uom": pattern_data.get('stock_uom'),
+            "conversion_factor": pattern_data.get('conversion_factor')
+        },
+        "financial_intelligence": {
+            "average_rate": pattern_data.get('average_rate'),
+            "typical_amount_range": pattern_data.get('average_amount')
+        },
+        "frequency": pattern_data.get('usage_frequency', 1),
+        "confidence": confidence,
+        "last_used": str(pattern_data['last_used_date']) if pattern_data.get('last_used_date') else None,
+        "source": pattern_data.get('source'),
+        "learned_date": datetime.now().isoformat()
+    }
@@ -0,0 +1,287 @@
+import frappe
+from frappe import _
+from frappe.utils import cint, now_datetime, time_diff_in_seconds
+import time
+from typing import Dict, Any, Optional
+
+LEARNING_SHARD_JOB = "fuzzy_waffle_ocr.learning.sharded_learning.run_learning_shard"
+
+# Run state lives in Redis for a week after the run starts
+RUN_KEY_PREFIX = "fuzzy_waffle_ocr:learning_run:"
+RUN_EXPIRES_IN_SEC = 7 * 24 * 60 * 60
+
+# Run that has not reached a final state yet; incremental learning waits for it
+ACTIVE_RUN_KEY = "fuzzy_waffle_ocr:learning_run:active"
+
+DEFAULT_SHARDS = 8
+
+# Learners not keyed by supplier, each run as one shard of its own: shard name to
+# (learner class, method). ComprehensiveLearning's Journal Entry, Payment Entry
+# and Asset learners save through pattern helpers it does not have yet, so they
+# would always fail; add them here once they can finish.
+GLOBAL_LEARNERS = {
+    # Its Purchase Invoice pass skips while the run is active: the invoice shards cover it
+    "expense_heads": ("fuzzy_waffle_ocr.learning.expense_head_learning.ExpenseHeadLearning", "learn_from_historical_data")
+}
+
+# Stats summed over shards into the run summary
+SUMMED_STATS = ("rows", "mappings", "created", "updated")
+
+@frappe.whitelist()
+def start_historical_learning(shards: int = DEFAULT_SHARDS) -> Dict[str, Any]:
+    """
+    Run the full historical learning as parallel background jobs
+    
+    Purchase Invoice learning is split into `shards` jobs by a hash of the
+    supplier. Every Supplier Item Mapping belongs to one supplier, so shards
+    never write the same rows. Learners in GLOBAL_LEARNERS run as one job
+    each. All jobs run on the long queue; poll get_learning_run_status with the
+    returned run id, or listen for `ocr_learning_progress` realtime events.
+    """
+    frappe.only_for("System Manager")
+    
+    return queue_historical_learning(shards)
+
+def queue_historical_learning(shards: int = DEFAULT_SHARDS) -> Dict[str, Any]:
+    """Queue the jobs of a historical learning run, see start_historical_learning"""
+    from fuzzy_waffle_ocr.doctype.ocr_learning_ledger.ocr_learning_ledger import get_latest_watermark
+    
+    active = get_active_learning_run()
+    if active:
+        frappe.throw(_("Historical learning run {0} is still in progress").format(active))
+    
+    shards = max(cint(shards), 1)
+    shard_names = [f"purchase_invoices:{shard}" for shard in range(shards)] + list(GLOBAL_LEARNERS)
+    
+    run = LearningRun(frappe.generate_hash(length=10))
+    run.start(
+        user=frappe.session.user,
+        shards=shards,
+        shard_names=shard_names,
+        # Taken before any shard scans: documents changing meanwhile are left to incremental learning
+        watermark=get_latest_watermark("Purchase Invoice")
+    )
+    frappe.cache().set_value(ACTIVE_RUN_KEY, run.run_id, expires_in_sec=RUN_EXPIRES_IN_SEC)
+    
+    for shard_name in shard_names:
+        enqueue_shard(run.run_id, shard_name)
+    
+    return {"run_id": run.run_id, "shards": shard_names, "status": "queued"}
+
+@frappe.whitelist()
+def retry_learning_shard(run_id: str, shard_name: str) -> Dict[str, Any]:
+    """Queue one failed shard of a run again; finished shards are left as they are"""
+    frappe.only_for("System Manager")
+    
+    run = LearningRun(run_id)
+    meta = run.get_meta()
+    
+    if not meta or shard_name not in meta["shard_names"]:
+        frappe.throw(_("Learning shard {0} of run {1} not found or expired").format(shard_name, run_id),
+                     frappe.DoesNotExistError)
+    
+    if run.get_shards().get(shard_name, {}).get("status") != "Failed":
+        frappe.throw(_("Only failed shards can be retried"))
+    
+    active = get_active_learning_run()
+    if active and active != run_id:
+        frappe.throw(_("Historical learning run {0} is still in progress").format(active))
+    
+    # The run is open again until the retried shard finishes
+    if meta.pop("finished_at", None):
+        frappe.cache().set_value(run.key, meta, expires_in_sec=RUN_EXPIRES_IN_SEC)
+    
+    frappe.cache().set_value(ACTIVE_RUN_KEY, run_id, expires_in_sec=RUN_EXPIRES_IN_SEC)
+    
+    enqueue_shard(run_id, shard_name)
+    
+    return run.get_status(meta)
+
+@frappe.whitelist()
+def get_learning_run_status(run_id: str) -> Dict[str, Any]:
+    """API to poll per-shard progress and the merged summary of a learning run"""
+    frappe.only_for("System Manager")
+    
+    run = LearningRun(run_id)
+    meta = run.get_meta()
+    
+    if not meta:
+        frappe.throw(_("Learning run {0} not found or expired").format(run_id), frappe.DoesNotExistError)
+    
+    return run.get_status(meta)
+
+def get_active_learning_run() -> Optional[str]:
+    """
+    The learning run that still has shards queued or running
+    
+    A run whose shards are all done is not active even if its key is left
+    over, e.g. after a worker was killed before it could clear it.
+    """
+    run_id = frappe.cache().get_value(ACTIVE_RUN_KEY)
+    if not run_id:
+        return None
+    
+    run = LearningRun(run_id)
+    meta = run.get_meta()
+    
+    if meta:
+        shards = run.get_shards()
+        
+        # Shards without a state yet are about to be queued
+        if any(shards.get(name, {}).get("status", "Queued") in ("Queued", "Running") for name in meta["shard_names"]):
+            return run_id
+    
+    return None
+
+def enqueue_shard(run_id: str, shard_name: str):
+    LearningRun(run_id).set_shard(shard_name, status="Queued")
+    
+    frappe.enqueue(
+        LEARNING_SHARD_JOB,
+        queue="long",
+        timeout=4 * 60 * 60,
+        # One job per shard and run, so a retry never runs next to a stuck attempt
+        job_id=f"ocr_learning:{run_id}:{shard_name}",
+        deduplicate=True,
+        run_id=run_id,
+        shard_name=shard_name
+    )
+
+def run_learning_shard(run_id: str, shard_name: str):
+    """Background job: run one shard of a learning run and record its outcome"""
+    from fuzzy_waffle_ocr.learning.comprehensive_learning import ComprehensiveLearning
+    
+    run = LearningRun(run_id)
+    meta = run.get_meta()
+    if not meta:
+        return
+    
+    run.set_shard(shard_name, status="Running", started_at=str(now_datetime()))
+    started = time.monotonic()
+    
+    try:
+        if shard_name.startswith("purchase_invoices:"):
+            stats = ComprehensiveLearning()._learn_from_purchase_invoices(
+                shard=cint(shard_name.split(":")[1]),
+                shards=meta["shards"],
+                watermark=meta["watermark"]
+            )
+        else:
+            learner, method = GLOBAL_LEARNERS[shard_name]
+            stats = getattr(frappe.get_attr(learner)(), method)() or {}
+        
+        frappe.db.commit()
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Learning run {run_id} shard {shard_name} failed: {e}\n{frappe.get_traceback()}", "OCR Learning")
+        run.set_shard(shard_name, status="Failed", error=str(e), seconds=round(time.monotonic() - started, 2))
+    else:
+        run.set_shard(
+            shard_name,
+            status="Completed",
+            seconds=round(time.monotonic() - started, 2),
+            **{key: stats.get(key, 0) for key in SUMMED_STATS}
+        )
+    
+    run.after_shard(meta)
+
+class LearningRun:
+    """
+    Redis-backed state of one sharded learning run
+    
+    Each shard's state is its own field of a Redis hash, so shards finishing
+    at the same time never overwrite each other.
+    """
+    
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.key = RUN_KEY_PREFIX + run_id
+        self.shards_key = self.key + ":shards"
+        self.cache = frappe.cache()
+    
+    def start(self, **meta):
+        meta.update(run_id=self.run_id, started_at=str(now_datetime()))
+        self.cache.set_value(self.key, meta, expires_in_sec=RUN_EXPIRES_IN_SEC)
+    
+    def get_meta(self) -> Optional[Dict[str, Any]]:
+        return self.cache.get_value(self.key)
+    
+    def set_shard(self, shard_name: str, **data):
+        """Update a shard's state, keeping fields not given"""
+        state = self.get_shards().get(shard_name, {})
+        
+        # A retried shard starts over
+        if data.get("status") == "Queued":
+            state = {}
+        
+        state.update(data)
+        
+        self.cache.hset(self.shards_key, shard_name, state)
+        self.cache.expire(self.cache.make_key(self.shards_key), RUN_EXPIRES_IN_SEC)
+    
+    def get_shards(self) -> Dict[str, Dict[str, Any]]:
+        shards = self.cache.hgetall(self.shards_key) or {}
+        return {frappe.safe_decode(name): state for name, state in shards.items()}
+    
+    def after_shard(self, meta: Dict[str, Any]):
+        """Finish the run once its Purchase Invoice shards are all done, and publish progress"""
+        from fuzzy_waffle_ocr.doctype.ocr_learning_ledger.ocr_learning_ledger import set_watermark
+        
+        shards = self.get_shards()
+        invoice_shards = [state for name, state in shards.items() if name.startswith("purchase_invoices:")]
+        
+        # Only one shard may move the watermark: the key is set once
+        if (
+            len(invoice_shards) == meta["shards"]
+            and all(state.get("status") == "Completed" for state in invoice_shards)
+            and self.cache.set(self.cache.make_key(self.key + ":finalized"), 1, nx=True, ex=RUN_EXPIRES_IN_SEC)
+        ):
+            if meta.get("watermark"):
+                set_watermark("Purchase Invoice", meta["watermark"]["modified"], meta["watermark"]["name"])
+                frappe.db.commit()
+        
+        status = self.get_status(meta)
+        
+        if status["status"] in ("Completed", "Failed"):
+            # A failed run is abandoned until a retry opens it again; the watermark stays where it was
+            if self.cache.get_value(ACTIVE_RUN_KEY) == self.run_id:
+                self.cache.delete_value(ACTIVE_RUN_KEY)
+            
+            if not meta.get("finished_at"):
+                meta["finished_at"] = str(now_datetime())
+                self.cache.set_value(self.key, meta, expires_in_sec=RUN_EXPIRES_IN_SEC)
+                status = self.get_status(meta)
+        
+        if meta.get("user"):
+            frappe.publish_realtime("ocr_learning_progress", status, user=meta["user"])
+    
+    def get_status(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-shard state and the summary merged over completed shards"""
+        shards = self.get_shards()
+        states = [shards.get(name, {}).get("status", "Queued") for name in meta["shard_names"]]
+        
+        if all(state == "Completed" for state in states):
+            status = "Completed"
+        elif all(state in ("Completed", "Failed") for state in states):
+            status = "Failed"
+        elif any(state != "Queued" for state in states):
+            status = "Running"
+        else:
+            status = "Queued"
+        
+        completed = [state for state in shards.values() if state.get("status") == "Completed"]
+        elapsed = time_diff_in_seconds(meta.get("finished_at") or now_datetime(), meta["started_at"])
+        
+        summary = {key: sum(state.get(key, 0) for state in completed) for key in SUMMED_STATS}
+        summary["shard_seconds"] = round(sum(state.get("seconds", 0) for state in completed), 2)
+        
+        return {
+            "run_id": self.run_id,
+            "status": status,
+            "shards_total": len(meta["shard_names"]),
+            "shards_completed": states.count("Completed"),
+            "shards_failed": [name for name, state in zip(meta["shard_names"], states) if state == "Failed"],
+            "elapsed_seconds": round(elapsed, 2),
+            "summary": summary,
+            "shards": {name: shards.get(name, {"status": "Queued"}) for name in meta["shard_names"]}
+        }
@@ -0,0 +1,37 @@
+import frappe
+from itertools import islice
+from typing import Dict, Any, Iterator, Optional
+
+# Rows converted to dicts at a time; memory stays at one chunk however large the result
+DEFAULT_CHUNK_SIZE = 2000
+
+def stream_sql(query: str, values: Optional[Dict[str, Any]] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               label: Optional[str] = None) -> Iterator[frappe._dict]:
+    """
+    Yield the rows of a query as dicts, read through an unbuffered server-side cursor
+    
+    Rows are fetched from the server chunk_size at a time instead of being
+    loaded into memory at once. With a label, progress and worker memory are
+    printed after every chunk.
+    
+    The connection is busy until the iteration finishes: consumers must not
+    run other queries inside the loop. Collect what needs writing and write
+    it afterwards.
+    """
+    from fuzzy_waffle_ocr.ocr.metrics import get_rss_bytes
+    
+    read = 0
+    
+    with frappe.db.unbuffered_cursor():
+        rows = frappe.db.sql(query, values, as_dict=True, as_iterator=True)
+        
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            
+            read += len(chunk)
+            if label:
+                print(f"   {label}: {read} rows read, worker memory {get_rss_bytes() / (1024 * 1024):.0f} MB")
+            
+            yield from chunk
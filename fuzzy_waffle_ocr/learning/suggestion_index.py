@@ -0,0 +1,287 @@
+import frappe
+from frappe.utils import cint
+import sys
+import numpy as np
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+# Bump when the compiled index changes shape, so old Redis entries are never read
+SUGGESTION_INDEX_VERSION = 2
+
+SUGGESTION_INDEX_KEY_PREFIX = "fuzzy_waffle_ocr:suggestion_index:"
+SUGGESTION_INDEX_EXPIRES_IN_SEC = 24 * 60 * 60
+
+# Compiled supplier indexes kept per worker process, least recently used dropped first
+PROCESS_CACHE_SIZE = 512
+
+# Suggested fields, in slot order
+SUGGESTION_FIELDS = (
+    "expense_account", "project", "cost_center", "warehouse", "payment_terms",
+    "tax_template", "uom_conversion", "asset_category", "mode_of_payment"
+)
+FIELD_IDS = {field: field_id for field_id, field in enumerate(SUGGESTION_FIELDS)}
+
+# Context intelligence: confidence points added to matching values, capped at MAX_BOOSTED_CONFIDENCE
+CONTEXT_BOOST = 15
+MAX_BOOSTED_CONFIDENCE = 95
+EXPENSE_PREFERENCE_KEYWORDS = {
+    "vehicle_maintenance": ("vehicle", "truck", "transport", "repair", "maintenance", "r&m"),
+    "generator_fuel": ("generator", "fuel", "diesel", "power"),
+    "office_expenses": ("office", "admin", "stationery", "printing")
+}
+ASSET_LIKELIHOOD_BOOST = {"high": 15, "medium": 5}
+
+# (site, supplier) -> (generation, index)
+process_cache = OrderedDict()
+
+class SupplierSuggestionIndex:
+    """
+    Learned patterns of one supplier, compiled into array-backed counts
+    
+    Every distinct (field, value) of the supplier's patterns is a slot.
+    Slots are grouped by field in SUGGESTION_FIELDS order, most used value
+    first, so each field is one contiguous segment starting at
+    `field_starts`. `counts` holds the patterns using each slot over all
+    mappings; `items` holds (slots, counts) arrays per item code. Values
+    are interned, so a value repeated across patterns is one string in
+    memory and is pickled once into Redis.
+    """
+    
+    __slots__ = ("supplier", "pattern_count", "slot_fields", "slot_values", "slot_text", "counts",
+                 "field_starts", "items", "segments")
+    
+    def __init__(self, supplier: str, pattern_count: int = 0, slot_fields: np.ndarray = None,
+                 slot_values: List = None, slot_text: np.ndarray = None, counts: np.ndarray = None,
+                 field_starts: np.ndarray = None, items: Dict[str, Tuple[np.ndarray, np.ndarray]] = None):
+        self.supplier = supplier
+        self.pattern_count = pattern_count
+        self.slot_fields = slot_fields if slot_fields is not None else np.zeros(0, dtype=np.int8)
+        self.slot_values = slot_values or []
+        self.slot_text = slot_text if slot_text is not None else np.zeros(0, dtype=str)
+        self.counts = counts if counts is not None else np.zeros(0)
+        self.field_starts = field_starts if field_starts is not None else np.zeros(0, dtype=np.int32)
+        self.items = items or {}
+        
+        # Field segment of every slot, derived when loading rather than stored
+        self.segments = np.repeat(
+            np.arange(len(self.field_starts)), np.diff(np.append(self.field_starts, len(self.counts)))
+        )
+    
+    def to_payload(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__ if name not in ("supplier", "segments")}
+    
+    def score(self, item_codes: Optional[List[str]] = None, context_boost: Optional[Dict] = None) -> Dict[str, Dict]:
+        """
+        Best value of every field in one vectorized pass
+        
+        Counts of the given items are added to the supplier's counts, so item
+        patterns weigh double, as before. A value's confidence is its share of
+        its field's counts plus the context boost points it earns.
+        """
+        if not len(self.counts):
+            return {}
+        
+        counts = self.counts.copy()
+        for item_code in item_codes or []:
+            if item_code in self.items:
+                slots, item_counts = self.items[item_code]
+                counts[slots] += item_counts
+        
+        segment = self.segments
+        totals = np.add.reduceat(counts, self.field_starts)
+        
+        points = self.get_boost_points(context_boost or {})
+        confidence = counts / totals[segment] * 100 + points
+        confidence = np.where(points > 0, np.minimum(confidence, MAX_BOOSTED_CONFIDENCE), confidence)
+        
+        # First slot reaching its field's maximum; slots are ordered by supplier-wide use, which breaks ties
+        best = np.maximum.reduceat(confidence, self.field_starts)
+        winners = np.flatnonzero(confidence == best[segment])
+        winners = winners[np.unique(segment[winners], return_index=True)[1]]
+        
+        suggestions = {}
+        for slot in winners:
+            field = SUGGESTION_FIELDS[self.slot_fields[slot]]
+            reason = f"Used {int(counts[slot])} times"
+            if points[slot] > 0:
+                reason += " + context intelligence"
+            
+            suggestions[field] = {
+                "value": get_suggested_value(field, self.slot_values[slot]),
+                "confidence": round(float(confidence[slot]), 2),
+                "reason": reason
+            }
+        
+        return suggestions
+    
+    def get_boost_points(self, context_boost: Dict) -> np.ndarray:
+        """Confidence points per slot from _apply_context_intelligence's preferences"""
+        points = np.zeros(len(self.counts))
+        
+        expense_preference = context_boost.get("expense_preference")
+        if expense_preference:
+            matches = np.zeros(len(self.counts), dtype=bool)
+            for keyword in EXPENSE_PREFERENCE_KEYWORDS.get(expense_preference, ()):
+                matches |= np.char.find(self.slot_text, keyword) >= 0
+            
+            points[matches & (self.slot_fields == FIELD_IDS["expense_account"])] += CONTEXT_BOOST
+            points[self.slot_fields == FIELD_IDS["project"]] += CONTEXT_BOOST
+        
+        cost_center_preference = context_boost.get("cost_center_preference")
+        if cost_center_preference:
+            matches = np.char.find(self.slot_text, cost_center_preference.lower()) >= 0
+            points[matches & (self.slot_fields == FIELD_IDS["cost_center"])] += CONTEXT_BOOST
+        
+        asset_boost = ASSET_LIKELIHOOD_BOOST.get(context_boost.get("asset_likelihood"))
+        if asset_boost:
+            points[self.slot_fields == FIELD_IDS["asset_category"]] += asset_boost
+        
+        return points
+
+def get_supplier_index(supplier: str) -> SupplierSuggestionIndex:
+    """
+    Compiled suggestion index of a supplier, read from the database only after a change
+    
+    A per-supplier generation counter in Redis is part of the key. Saving a
+    mapping bumps it, so each process notices the change with one Redis read
+    and other suppliers' indexes stay valid.
+    """
+    generation = get_generation(supplier)
+    key = (frappe.local.site, supplier)
+    
+    cached = process_cache.get(key)
+    if cached and cached[0] == generation:
+        process_cache.move_to_end(key)
+        return cached[1]
+    
+    index = build_supplier_index(supplier, generation)
+    
+    process_cache[key] = (generation, index)
+    process_cache.move_to_end(key)
+    while len(process_cache) > PROCESS_CACHE_SIZE:
+        process_cache.popitem(last=False)
+    
+    return index
+
+def build_supplier_index(supplier: str, generation: int) -> SupplierSuggestionIndex:
+    cache = frappe.cache()
+    key = f"{SUGGESTION_INDEX_KEY_PREFIX}{supplier}:v{SUGGESTION_INDEX_VERSION}:{generation}"
+    
+    payload = cache.get_value(key)
+    if payload is None:
+        payload = compile_supplier_index(supplier).to_payload()
+        cache.set_value(key, payload, expires_in_sec=SUGGESTION_INDEX_EXPIRES_IN_SEC)
+    
+    return SupplierSuggestionIndex(supplier, **payload)
+
+def compile_supplier_index(supplier: str) -> SupplierSuggestionIndex:
+    """Compile every learned pattern of a supplier's mappings"""
+    from fuzzy_waffle_ocr.learning.mapping_resolver import parse_json_field
+    from fuzzy_waffle_ocr.learning.pattern_aggregator import get_top_patterns
+    
+    mappings = frappe.get_all(
+        "Supplier Item Mapping",
+        filters={"supplier": supplier},
+        fields=["erpnext_item_code", "expense_head_patterns"]
+    )
+    
+    return compile_patterns(
+        supplier,
+        ((mapping.erpnext_item_code, get_top_patterns(parse_json_field(mapping.expense_head_patterns))) for mapping in mappings)
+    )
+
+def compile_patterns(supplier: str, mappings: Iterable[Tuple[str, Any]]) -> SupplierSuggestionIndex:
+    """Index of (item code, patterns) pairs: counts per field value, then laid out as slots"""
+    pattern_count = 0
+    field_counts = {}
+    item_field_counts = {}
+    
+    for item_code, patterns in mappings:
+        if not isinstance(patterns, list):
+            continue
+        
+        item = item_field_counts.setdefault(intern(item_code), {}) if item_code else None
+        
+        for pattern in patterns:
+            if not isinstance(pattern, dict):
+                continue
+            
+            pattern_count += 1
+            
+            for field in SUGGESTION_FIELDS:
+                value = get_pattern_value(pattern, field)
+                if not value:
+                    continue
+                
+                key = (field, value)
+                field_counts[key] = field_counts.get(key, 0) + 1
+                if item is not None:
+                    item[key] = item.get(key, 0) + 1
+    
+    # Grouped by field, most used value first
+    keys = sorted(field_counts, key=lambda key: (FIELD_IDS[key[0]], -field_counts[key]))
+    slot_of = {key: slot for slot, key in enumerate(keys)}
+    
+    slot_fields = np.array([FIELD_IDS[field] for field, _ in keys], dtype=np.int8)
+    field_starts = np.flatnonzero(np.diff(slot_fields, prepend=-1)).astype(np.int32)
+    
+    items = {}
+    for item_code, counts in item_field_counts.items():
+        if counts:
+            items[item_code] = (
+                np.array([slot_of[key] for key in counts], dtype=np.int32),
+                np.array(list(counts.values()), dtype=np.float64)
+            )
+    
+    return SupplierSuggestionIndex(
+        supplier,
+        pattern_count=pattern_count,
+        slot_fields=slot_fields,
+        slot_values=[value for _, value in keys],
+        slot_text=np.array([value.lower() if isinstance(value, str) else "" for _, value in keys], dtype=str),
+        counts=np.array([field_counts[key] for key in keys], dtype=np.float64),
+        field_starts=field_starts,
+        items=items
+    )
+
+def get_pattern_value(pattern: Dict[str, Any], field: str):
+    """A pattern's hashable value for a field; UOM conversions become (supplier UOM, stock UOM, factor)"""
+    if field != "uom_conversion":
+        return intern(pattern.get(field))
+    
+    conversion = pattern.get("uom_conversion") or {}
+    if not isinstance(conversion, dict) or not conversion.get("supplier_uom") or not conversion.get("stock_uom"):
+        return None
+    
+    return (intern(conversion["supplier_uom"]), intern(conversion["stock_uom"]), conversion.get("conversion_factor"))
+
+def get_suggested_value(field: str, value):
+    if field == "uom_conversion":
+        return dict(zip(("supplier_uom", "stock_uom", "conversion_factor"), value))
+    return value
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def get_generation(supplier: str) -> int:
+    return cint(frappe.cache().get(get_generation_key(supplier)))
+
+def get_generation_key(supplier: str) -> str:
+    return frappe.cache().make_key(f"{SUGGESTION_INDEX_KEY_PREFIX}{supplier}:generation")
+
+def invalidate_supplier_indexes(suppliers: Iterable[str]):
+    """Recompile the given suppliers' indexes in every process once the current transaction commits"""
+    suppliers = sorted({supplier for supplier in suppliers if supplier})
+    if not suppliers:
+        return
+    
+    # Bumping earlier would let another process cache the old mappings under the new generation
+    frappe.db.after_commit.add(partial(bump_generations, suppliers))
+
+def bump_generations(suppliers: Iterable[str]):
+    # Indexes of older generations are no longer read and expire on their own
+    pipeline = frappe.cache().pipeline()
+    for supplier in suppliers:
+        pipeline.incr(get_generation_key(supplier))
+    pipeline.execute()
@@ -0,0 +1,1048 @@
+"""
+Benchmarks for the OCR pipeline
+
+Run from the bench directory, e.g.:
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_engines
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_engines --kwargs "{'file_url': '/private/files/bill.pdf'}"
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_field_extraction --kwargs "{'documents': 2000}"
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.stress_line_item_parser
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_import_time
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_learning_memory
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_suggestions
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_suggestion_scoring
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_item_resolver
+    bench --site <site> execute fuzzy_waffle_ocr.ocr.benchmark.benchmark_ocr_normalization
+"""
+
+import json
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Any, Callable, Optional
+
+import frappe
+import numpy as np
+
+SAMPLE_INVOICE_LINES = [
+    "ABC MOTORS PVT LTD",
+    "GSTIN: 27AABCA1234F1Z5",
+    "Invoice No: INV-2041        Date: 12/03/2024",
+    "",
+    "Description        Qty   Rate     Amount",
+    "Diesel             50 Lt  90.50   4525.00",
+    "Engine Oil         4 Lt   420.00  1680.00",
+    "Grease             2 Kg   180.00  360.00",
+    "Coolant            5 Lt   150.00  750.00",
+    "",
+    "CGST @ 9%: 658.35",
+    "SGST @ 9%: 658.35",
+    "Grand Total: Rs. 8631.70",
+    "Payment Terms: Net 30 Days"
+]
+
+def render_sample_invoice(lines: List[str] = None, scale: int = 2) -> np.ndarray:
+    """Render a synthetic invoice page as a grayscale array"""
+    from PIL import Image, ImageDraw, ImageFont
+    
+    lines = lines or SAMPLE_INVOICE_LINES
+    font_size = 16 * scale
+    line_height = int(font_size * 1.6)
+    
+    image = Image.new("L", (1240 * scale // 2, line_height * (len(lines) + 2)), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    
+    for i, line in enumerate(lines, start=1):
+        draw.text((40, i * line_height), line, fill=0, font=font)
+    
+    return np.asarray(image)
+
+def load_benchmark_image(file_url: str = None) -> np.ndarray:
+    """Load the first page of an uploaded file, or render a synthetic invoice"""
+    if not file_url:
+        return render_sample_invoice()
+    
+    from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    
+    processor = OCRProcessor()
+    file_path = frappe.get_site_path(file_url.lstrip('/'))
+    
+    if file_path.lower().endswith('.pdf'):
+        return next(processor.iter_pdf_pages(file_path, first_page=1, last_page=1))
+    
+    return processor.load_image(file_path)
+
+def time_calls(func: Callable, iterations: int) -> Dict[str, float]:
+    """Time a function over several calls, reporting the cold first call separately"""
+    started = time.perf_counter()
+    func()
+    first_call = time.perf_counter() - started
+    
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    
+    return {
+        "first_call_ms": round(first_call * 1000, 2),
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2)
+    }
+
+def benchmark_engines(file_url: str = None, iterations: int = 5, config: str = "--psm 6") -> Dict[str, Any]:
+    """Compare the pooled Tesseract engine against the per-call subprocess path"""
+    import pytesseract
+    from fuzzy_waffle_ocr.ocr.engine import SubprocessEngine, PooledEngine
+    from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    
+    processor = OCRProcessor(settings={"parallel_ocr_workers": 0})
+    processed_image = processor.preprocess_image(load_benchmark_image(file_url))
+    
+    engines = []
+    if shutil.which(pytesseract.pytesseract.tesseract_cmd):
+        engines.append(SubprocessEngine())
+    
+    try:
+        engines.append(PooledEngine())
+    except ImportError:
+        print("tesserocr is not installed, skipping pooled engine")
+    
+    results = {}
+    for engine in engines:
+        results[engine.name] = {
+            "image_to_data": time_calls(lambda: engine.image_to_data(processed_image, config), iterations),
+            "image_to_string": time_calls(lambda: engine.image_to_string(processed_image, config), iterations)
+        }
+    
+    if "subprocess" in results and "pooled" in results:
+        results["speedup"] = {
+            call: round(results["subprocess"][call]["mean_ms"] / results["pooled"][call]["mean_ms"], 2)
+            for call in ("image_to_data", "image_to_string")
+        }
+    
+    print_results("Tesseract engine benchmark", results)
+    
+    return results
+
+def legacy_handwriting_ocr(engine, processed_image: np.ndarray, configs: List[str]) -> str:
+    """Previous handwriting path: every config sequentially, re-running OCR when confidence improves"""
+    best_text = ""
+    highest_confidence = 0
+    
+    for config in configs:
+        data = engine.image_to_data(processed_image, config)
+        confidences = [float(conf) for conf in data["conf"] if float(conf) > 0]
+        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+        
+        if avg_confidence > highest_confidence:
+            highest_confidence = avg_confidence
+            text = engine.image_to_string(processed_image, config)
+            if len(text.strip()) > len(best_text.strip()):
+                best_text = text
+    
+    return best_text
+
+def benchmark_handwriting(file_url: str = None, iterations: int = 3,
+                          confidence_threshold: float = 60) -> Dict[str, Any]:
+    """Compare single-pass concurrent handwriting OCR with the previous sequential sweep"""
+    from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    
+    processor = OCRProcessor(settings={"confidence_threshold": confidence_threshold})
+    image = load_benchmark_image(file_url)
+    processed_image = processor.preprocess_image(image)
+    
+    result = processor.ocr_handwriting_page(image)
+    
+    results = {
+        "engine": processor.engine.name,
+        "legacy": time_calls(
+            lambda: legacy_handwriting_ocr(processor.engine, processed_image, processor.HANDWRITING_CONFIGS),
+            iterations
+        ),
+        "single_pass": time_calls(lambda: processor.ocr_handwriting_page(image), iterations),
+        "selected_config": result["config"],
+        "confidence": round(result["confidence"], 2)
+    }
+    results["speedup"] = round(results["legacy"]["mean_ms"] / results["single_pass"]["mean_ms"], 2)
+    
+    print_results("Handwriting OCR benchmark", results)
+    
+    return results
+
+class LegacyFieldExtractor:
+    """Previous regex-per-field extractors, kept as the baseline for benchmark_field_extraction"""
+    
+    def extract_invoice_data(self, ocr_text: str) -> Dict[str, Any]:
+        """Extract structured invoice data from OCR text"""
+        data = {
+            "invoice_number": self.extract_invoice_number(ocr_text),
+            "invoice_date": self.extract_date(ocr_text),
+            "total_amount": self.extract_total_amount(ocr_text),
+            "items": self.extract_line_items(ocr_text),
+            "payment_terms": self.extract_payment_terms(ocr_text),
+            "tax_info": self.extract_tax_info(ocr_text)
+        }
+        
+        return data
+    
+    def extract_invoice_number(self, text: str) -> Optional[str]:
+        """Extract invoice number from text"""
+        patterns = [
+            r'Invoice\s*(?:No|Number|#)?\s*[:.]?\s*([A-Z0-9\-/]+)',
+            r'Bill\s*(?:No|Number)?\s*[:.]?\s*([A-Z0-9\-/]+)',
+            r'Inv\s*[:.]?\s*([A-Z0-9\-/]+)',
+            r'(?:Invoice|Bill|Inv)\s*([A-Z0-9\-/]+)'
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                return match.group(1)
+        
+        return None
+    
+    def extract_date(self, text: str) -> Optional[str]:
+        """Extract date from text"""
+        date_patterns = [
+            r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
+            r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4})',
+            r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})'
+        ]
+        
+        for pattern in date_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                date_str = match.group(1)
+                # Convert to standard format
+                return self.standardize_date(date_str)
+        
+        return None
+    
+    def standardize_date(self, date_str: str) -> str:
+        """Convert date to YYYY-MM-DD format"""
+        from dateutil import parser
+        try:
+            parsed_date = parser.parse(date_str)
+            return parsed_date.strftime('%Y-%m-%d')
+        except:
+            return date_str
+    
+    def extract_total_amount(self, text: str) -> Optional[float]:
+        """Extract total amount from text"""
+        patterns = [
+            r'Total\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)',
+            r'Grand\s*Total\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)',
+            r'Amount\s*Payable\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)',
+            r'Net\s*Amount\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)'
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                amount_str = match.group(1).replace(',', '')
+                try:
+                    return float(amount_str)
+                except:
+                    continue
+        
+        return None
+    
+    def extract_line_items(self, text: str) -> List[Dict[str, Any]]:
+        """Extract line items from invoice text"""
+        items = []
+        
+        # Pattern for line items (description, quantity, rate, amount)
+        item_pattern = r'([A-Za-z\s\-]+)\s+(\d+\.?\d*)\s*(?:Pcs|Kg|Lt|Nos|Box)?\s+(?:₹|Rs\.?)?\s*(\d+\.?\d*)\s+(?:₹|Rs\.?)?\s*(\d+\.?\d*)'
+        
+        matches = re.finditer(item_pattern, text)
+        
+        for match in matches:
+            item = {
+                "description": match.group(1).strip(),
+                "quantity": float(match.group(2)),
+                "rate": float(match.group(3)),
+                "amount": float(match.group(4))
+            }
+            
+            # Extract UOM if present
+            uom_match = re.search(r'(\d+\.?\d*)\s*(Pcs|Kg|Lt|Nos|Box|Unit)', match.group(0), re.IGNORECASE)
+            if uom_match:
+                item["uom"] = uom_match.group(2)
+            
+            items.append(item)
+        
+        return items
+    
+    def extract_payment_terms(self, text: str) -> Optional[str]:
+        """Extract payment terms from text"""
+        patterns = [
+            r'Payment\s*Terms?\s*[:.]?\s*([A-Za-z0-9\s]+)',
+            r'(?:Net|Credit)\s*(\d+\s*Days?)',
+            r'Due\s*(?:in|within)\s*(\d+\s*Days?)',
+            r'(Cash|COD|Credit)'
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                return match.group(1).strip()
+        
+        return None
+    
+    def extract_tax_info(self, text: str) -> Dict[str, Any]:
+        """Extract tax information from text"""
+        tax_info = {}
+        
+        # GST pattern
+        gst_pattern = r'GST[IN]*\s*[:.]?\s*([A-Z0-9]+)'
+        gst_match = re.search(gst_pattern, text, re.IGNORECASE)
+        if gst_match:
+            tax_info["gstin"] = gst_match.group(1)
+        
+        # Tax amounts
+        tax_patterns = {
+            "cgst": r'CGST\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)',
+            "sgst": r'SGST\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)',
+            "igst": r'IGST\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)'
+        }
+        
+        for tax_type, pattern in tax_patterns.items():
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                amount_str = match.group(1).replace(',', '')
+                try:
+                    tax_info[tax_type] = float(amount_str)
+                except:
+                    pass
+        
+        return tax_info
+
+# Field name in extract_invoice_data output -> legacy extractor method
+LEGACY_FIELD_METHODS = {
+    "invoice_number": "extract_invoice_number",
+    "invoice_date": "extract_date",
+    "total_amount": "extract_total_amount",
+    "items": "extract_line_items",
+    "payment_terms": "extract_payment_terms",
+    "tax_info": "extract_tax_info"
+}
+
+SAMPLE_ITEMS = [
+    ("Diesel", "Lt"), ("Engine Oil", "Lt"), ("Grease", "Kg"), ("Coolant", "Lt"),
+    ("Brake Pads", "Pcs"), ("Air Filter", "Nos"), ("Tyre Tube", "Pcs"), ("Cement Bags", "Box")
+]
+
+def generate_invoice_text(rng: random.Random, max_items: int = 40) -> tuple:
+    """Generate one synthetic OCR'd invoice with random labels and amounts, returning (text, item rows)"""
+    lines = [
+        rng.choice(["ABC MOTORS PVT LTD", "Sharma Traders", "Om Sai Hardware & Co"]),
+        f"GSTIN: 27AABCA{rng.randint(1000, 9999)}F1Z5",
+        "Address: Plot 12, MIDC Industrial Area, Pune 411019"
+    ]
+    
+    invoice_no = f"{rng.choice(['INV', 'BL', 'SI'])}-{rng.randint(100, 99999)}"
+    invoice_date = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/20{rng.randint(18, 25)}"
+    lines.append(rng.choice([
+        f"Invoice No: {invoice_no}        Date: {invoice_date}",
+        f"Bill No. {invoice_no}   Dated {invoice_date}",
+        f"Tax Invoice #{invoice_no}   {invoice_date}"
+    ]))
+    lines += ["", "Description        Qty   Rate     Amount"]
+    
+    items = []
+    subtotal = 0
+    for _ in range(rng.randint(1, max_items)):
+        description, uom = rng.choice(SAMPLE_ITEMS)
+        qty = rng.randint(1, 100)
+        rate = round(rng.uniform(10, 1000), 2)
+        amount = round(qty * rate, 2)
+        subtotal += amount
+        items.append({"description": description, "quantity": qty, "rate": rate, "amount": amount, "uom": uom})
+        lines.append(f"{description}   {qty} {uom}   {rate:.2f}   {amount:.2f}")
+    
+    tax = round(subtotal * 0.09, 2)
+    lines += [
+        "",
+        f"CGST @ 9%: {tax:.2f}",
+        f"SGST @ 9%: {tax:.2f}",
+        f"Grand Total: Rs. {subtotal + 2 * tax:,.2f}",
+        rng.choice(["Payment Terms: Net 30 Days", "Due within 15 Days", "Cash", "Credit 45 Days"]),
+        "Thank you for your business"
+    ]
+    
+    return "\n".join(lines), items
+
+def benchmark_field_extraction(documents: int = 1000, iterations: int = 3, seed: int = 42) -> Dict[str, Any]:
+    """
+    Compare the single-pass field extractor with the previous regex-per-field methods
+    
+    Times each field on its own and all fields together over a synthetic corpus, and
+    reports how often both produce the same value. Values are compared up to their
+    first line break, since the previous patterns could run on into the next line
+    (e.g. payment terms taking the closing line along). Line items are checked
+    against the generated rows instead, for the same reason.
+    """
+    from fuzzy_waffle_ocr.ocr.extraction import get_field_extractor
+    
+    rng = random.Random(seed)
+    corpus, expected_items = zip(*[generate_invoice_text(rng) for _ in range(documents)])
+    
+    legacy = LegacyFieldExtractor()
+    extractor = get_field_extractor()
+    
+    def run(func):
+        return lambda: [func(text) for text in corpus]
+    
+    results = {
+        "documents": documents,
+        "corpus_mb": round(sum(len(text) for text in corpus) / 1024 / 1024, 2)
+    }
+    
+    fields = dict(LEGACY_FIELD_METHODS, all_but_items=None, all=None)
+    
+    # Every field but line items, whose tokenizing parser costs the same in either pass
+    scalar_fields = [field for field in extractor.rules if field != "items"]
+    scalar_methods = [getattr(legacy, method) for field, method in LEGACY_FIELD_METHODS.items() if field != "items"]
+    
+    for field, method in fields.items():
+        if field == "all_but_items":
+            legacy_method = lambda text: [scalar_method(text) for scalar_method in scalar_methods]
+            single_pass = lambda text: extractor.extract(text, fields=scalar_fields)
+        elif field == "all":
+            legacy_method = legacy.extract_invoice_data
+            single_pass = extractor.extract_invoice_data
+        elif field == "tax_info":
+            legacy_method = getattr(legacy, method)
+            tax_fields = extractor.registry.get_group_fields("tax_info")
+            single_pass = lambda text: extractor.extract_invoice_data(text, tax_fields).get("tax_info", {})
+        else:
+            legacy_method = getattr(legacy, method)
+            single_pass = lambda text, field=field: extractor.extract(text, fields=[field])[field]
+        
+        legacy_timing = time_calls(run(legacy_method), iterations)
+        single_pass_timing = time_calls(run(single_pass), iterations)
+        
+        results[field] = {
+            "legacy_ms": legacy_timing["mean_ms"],
+            "single_pass_ms": single_pass_timing["mean_ms"],
+            "speedup": round(legacy_timing["mean_ms"] / single_pass_timing["mean_ms"], 2)
+        }
+        
+        if field == "items":
+            for name, func in (("legacy", legacy_method), ("single_pass", single_pass)):
+                results[field][f"{name}_correct_pct"] = percent(
+                    sum(1 for text, items in zip(corpus, expected_items) if func(text) == items), documents
+                )
+        elif field not in ("all", "all_but_items"):
+            results[field]["agreement_pct"] = percent(
+                sum(1 for text in corpus if first_line(legacy_method(text)) == first_line(single_pass(text))), documents
+            )
+    
+    print_results("Field extraction benchmark", results)
+    
+    return results
+
+def first_line(value):
+    return value.split("\n", 1)[0] if isinstance(value, str) else value
+
+def generate_adversarial_inputs(lines: int, seed: int = 7) -> Dict[str, str]:
+    """Build noisy OCR-like inputs that make backtracking row patterns blow up"""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ-"
+    
+    def random_words(count):
+        return " ".join(
+            "".join(rng.choice(letters) for _ in range(rng.randint(1, 12)))
+            for _ in range(count)
+        )
+    
+    return {
+        # Scanned noise read as text: letters and spaces, never a number
+        "letters_and_spaces": "\n".join(random_words(20) for _ in range(lines)),
+        # Wide gaps between words, as from a skewed table
+        "whitespace_runs": "\n".join(f"Item{' ' * 200}x{' ' * 200}y" for _ in range(lines)),
+        # Rows that look like items but lack the amount column
+        "almost_rows": "\n".join(f"{random_words(5)} 12 Lt Rs. 40.00 x" for _ in range(lines)),
+        "number_soup": "\n".join(" ".join(str(rng.randint(0, 999)) for _ in range(20)) for _ in range(lines)),
+        # Lost line breaks: the whole page on one line
+        "single_line": " ".join(f"{random_words(3)} 4 Lt" for _ in range(lines)),
+        # Glued tokens with no whitespace to split on
+        "glued_tokens": "\n".join("4Lt" * 50 + "Rs." * 50 + "₹1,0" * 30 for _ in range(lines)),
+        "unicode_noise": "\n".join(
+            "".join(rng.choice("₹|═░▓ .,:;/\\0123abc") for _ in range(120)) for _ in range(lines)
+        ),
+        "valid_rows": "\n".join(
+            f"{rng.choice(SAMPLE_ITEMS)[0]} {rng.randint(1, 99)} Kg {rng.randint(1, 999)}.50 {rng.randint(1, 99999)}.00"
+            for _ in range(lines)
+        )
+    }
+
+def stress_line_item_parser(lines: int = 10000, max_seconds: float = 2.0, legacy_lines: int = 5) -> Dict[str, Any]:
+    """
+    Stress the line-item parser with adversarial inputs of `lines` lines each
+    
+    Fails if any input takes longer than `max_seconds`, if doubling the input more
+    than triples the time (i.e. cost is not linear), or if valid rows are missed.
+    The previous regex is timed on `legacy_lines` lines of each input for comparison;
+    keep that small, its cost on wide whitespace gaps grows far faster than linear.
+    """
+    from fuzzy_waffle_ocr.ocr.line_items import parse_line_items
+    
+    legacy = LegacyFieldExtractor()
+    full_inputs = generate_adversarial_inputs(lines)
+    half_inputs = generate_adversarial_inputs(lines // 2)
+    small_inputs = generate_adversarial_inputs(legacy_lines)
+    
+    results = {}
+    failures = []
+    
+    for name, text in full_inputs.items():
+        started = time.perf_counter()
+        items = parse_line_items(text)
+        seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        parse_line_items(half_inputs[name])
+        half_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        legacy.extract_line_items(small_inputs[name])
+        legacy_seconds = time.perf_counter() - started
+        
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "scaling": round(seconds / half_seconds, 2) if half_seconds else None,
+            "items": len(items),
+            f"legacy_seconds_{legacy_lines}_lines": round(legacy_seconds, 4)
+        }
+        
+        if seconds > max_seconds:
+            failures.append(f"{name}: {seconds:.2f}s exceeds {max_seconds}s")
+        
+        # Doubling the input may at most triple the time (allows for timer noise)
+        if half_seconds > 0.01 and seconds / half_seconds > 3:
+            failures.append(f"{name}: cost grows {seconds / half_seconds:.1f}x when input doubles")
+    
+    if results["valid_rows"]["items"] != lines:
+        failures.append(f"valid_rows: parsed {results['valid_rows']['items']} of {lines} rows")
+    
+    print_results("Line item parser stress test", results)
+    
+    if failures:
+        raise AssertionError("Line item parser stress test failed:\n" + "\n".join(failures))
+    
+    return results
+
+# Modules and the heavy dependencies they imported at module level before loading them lazily
+IMPORT_BENCHMARK_MODULES = {
+    "fuzzy_waffle_ocr.ocr.processor": ("numpy", "cv2", "PIL.Image", "pdf2image", "pytesseract"),
+    "fuzzy_waffle_ocr.ai_integration.chatgpt_processor": ("openai", "requests"),
+    "fuzzy_waffle_ocr.learning.comprehensive_learning": ("fuzzywuzzy.fuzz",),
+    "fuzzy_waffle_ocr.learning.expense_head_learning": ("fuzzywuzzy.fuzz",)
+}
+
+HEAVY_MODULES = ("numpy", "cv2", "PIL", "pdf2image", "pytesseract", "tesserocr", "openai", "requests", "fuzzywuzzy")
+
+# Runs in a fresh interpreter: imports frappe first, then times the eager dependencies plus the module
+IMPORT_TIMER_SCRIPT = """
+import importlib, json, sys, time
+import frappe
+module, eager, heavy = sys.argv[1], [name for name in sys.argv[2].split(",") if name], sys.argv[3].split(",")
+started = time.perf_counter()
+for name in eager:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+importlib.import_module(module)
+print(json.dumps({"seconds": time.perf_counter() - started, "loaded": [name for name in heavy if name in sys.modules]}))
+"""
+
+def benchmark_import_time(runs: int = 5, include_warm_up: bool = True) -> Dict[str, Any]:
+    """
+    Time importing OCR modules in fresh interpreters, lazily and as they were before
+    
+    "lazy_ms" is the import as it is now; "eager_ms" also imports the heavy
+    dependencies the module used to import at the top, which is what every
+    worker and bench command paid before. Also lists the heavy modules a lazy
+    import still loads, and (in this process) what warm_up() costs once per worker.
+    """
+    results = {}
+    
+    for module, eager_imports in IMPORT_BENCHMARK_MODULES.items():
+        timings = {"lazy": [], "eager": []}
+        loaded = []
+        
+        for _ in range(runs):
+            for mode, imports in (("lazy", ()), ("eager", eager_imports)):
+                output = subprocess.run(
+                    [sys.executable, "-c", IMPORT_TIMER_SCRIPT, module, ",".join(imports), ",".join(HEAVY_MODULES)],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                ).stdout
+                run = json.loads(output.strip().splitlines()[-1])
+                
+                timings[mode].append(run["seconds"])
+                if mode == "lazy":
+                    loaded = run["loaded"]
+        
+        lazy_ms = statistics.median(timings["lazy"]) * 1000
+        eager_ms = statistics.median(timings["eager"]) * 1000
+        
+        results[module] = {
+            "lazy_ms": round(lazy_ms, 1),
+            "eager_ms": round(eager_ms, 1),
+            "saved_ms": round(eager_ms - lazy_ms, 1),
+            "heavy_modules_loaded": ", ".join(loaded) or "none"
+        }
+    
+    if include_warm_up:
+        from fuzzy_waffle_ocr.ocr.warmup import warm_up
+        
+        results["warm_up_seconds"] = warm_up()
+    
+    print_results("Import time benchmark", results)
+    
+    return results
+
+# Runs one read of a synthetic learning result set in a fresh interpreter and reports its peak memory growth
+MEMORY_BENCHMARK_SCRIPT = """
+import json, resource, sys
+import frappe
+site, sites_path, mode, rows, chunk_size = sys.argv[1:6]
+frappe.init(site=site, sites_path=sites_path)
+frappe.connect()
+from fuzzy_waffle_ocr.learning.streaming import stream_sql
+from fuzzy_waffle_ocr.ocr.benchmark import synthetic_history_query
+query = synthetic_history_query(int(rows))
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if mode == "streamed":
+    read = sum(1 for _ in stream_sql(query, chunk_size=int(chunk_size)))
+else:
+    read = len(frappe.db.sql(query, as_dict=True))
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+frappe.destroy()
+print(json.dumps({"rows": read, "growth_mb": (peak - baseline) / 1024}))
+"""
+
+def synthetic_history_query(rows: int) -> str:
+    """Query returning rows shaped like the Purchase Invoice learning scan, from MariaDB's sequence engine"""
+    return f"""
+        SELECT
+            CONCAT('Supplier ', seq % 500) as supplier,
+            CONCAT('Project ', seq % 40) as project,
+            CONCAT('Cost Center ', seq % 20) as cost_center,
+            CONCAT('ITEM-', LPAD(seq % 5000, 5, '0')) as item_code,
+            CONCAT('Item description ', MD5(seq)) as item_name,
+            CONCAT('Expense Account ', seq % 60) as expense_account,
+            'Nos' as uom,
+            seq * 1.25 as rate,
+            seq * 3.75 as amount,
+            DATE_SUB(CURDATE(), INTERVAL seq % 1000 DAY) as posting_date,
+            seq % 17 + 1 as frequency
+        FROM seq_1_to_{int(rows)}
+    """
+
+def benchmark_learning_memory(sizes: List[int] = None, chunk_size: int = 2000) -> Dict[str, Any]:
+    """
+    Peak worker memory growth reading learning history buffered and streamed
+    
+    Each read runs in a fresh interpreter so peaks do not carry over. Buffered
+    memory grows with the history; streamed memory should stay flat at about
+    one chunk. Needs MariaDB's sequence engine (seq_1_to_N tables).
+    """
+    sizes = sizes or [20000, 100000, 500000]
+    results = {}
+    
+    for rows in sizes:
+        results[f"{rows} rows"] = {}
+        
+        for mode in ("buffered", "streamed"):
+            output = subprocess.run(
+                [
+                    sys.executable, "-c", MEMORY_BENCHMARK_SCRIPT,
+                    frappe.local.site, frappe.local.sites_path, mode, str(rows), str(chunk_size)
+                ],
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            
+            results[f"{rows} rows"][f"{mode}_mb"] = round(run["growth_mb"], 1)
+    
+    print_results("Learning history memory benchmark", results)
+    
+    return results
+
+def legacy_supplier_suggestions(supplier: str) -> Dict[str, Any]:
+    """Previous suggestion path: every mapping row and pattern blob read and counted per call"""
+    patterns = []
+    for mapping in frappe.get_all("Supplier Item Mapping", filters={"supplier": supplier}, fields=["*"]):
+        if mapping.expense_head_patterns:
+            patterns.extend(json.loads(mapping.expense_head_patterns))
+    
+    suggestions = {}
+    for field in ("expense_account", "project"):
+        values = [p.get(field) for p in patterns if isinstance(p, dict) and p.get(field)]
+        if values:
+            suggestions[field] = max(set(values), key=values.count)
+    
+    return suggestions
+
+def benchmark_suggestions(supplier: str = None, iterations: int = 200) -> Dict[str, Any]:
+    """
+    Suggestion latency reading mappings per call versus the compiled supplier index
+    
+    Defaults to the supplier with the most mappings. The index's first call
+    compiles it from the database; later calls cost one Redis read.
+    """
+    from fuzzy_waffle_ocr.learning.comprehensive_learning import ComprehensiveLearning
+    from fuzzy_waffle_ocr.learning.suggestion_index import bump_generations, get_supplier_index
+    
+    if not supplier:
+        busiest = frappe.db.sql("""
+            SELECT supplier, COUNT(*) AS mappings
+            FROM `tabSupplier Item Mapping`
+            GROUP BY supplier
+            ORDER BY mappings DESC
+            LIMIT 1
+        """, as_dict=True)
+        if not busiest:
+            frappe.throw("No Supplier Item Mapping to benchmark")
+        supplier = busiest[0].supplier
+    
+    learning = ComprehensiveLearning()
+    bump_generations([supplier])
+    
+    results = {
+        "supplier": supplier,
+        "mappings": frappe.db.count("Supplier Item Mapping", {"supplier": supplier}),
+        "legacy": time_calls(lambda: legacy_supplier_suggestions(supplier), iterations),
+        "indexed": time_calls(lambda: learning.get_intelligent_suggestions(supplier), iterations)
+    }
+    results["patterns"] = get_supplier_index(supplier).pattern_count
+    results["speedup"] = round(results["legacy"]["median_ms"] / max(results["indexed"]["median_ms"], 0.001), 1)
+    
+    print_results("Suggestion latency benchmark", results)
+    
+    return results
+
+def generate_supplier_patterns(patterns: int, seed: int = 42, patterns_per_item: int = 10) -> List[tuple]:
+    """Synthetic (item code, patterns) pairs of one supplier, with skewed field values"""
+    rng = random.Random(seed)
+    vocabulary = {
+        "expense_account": [f"Expense {i} - TC" for i in range(60)],
+        "project": [f"Project {i}" for i in range(40)],
+        "cost_center": [f"Cost Center {i} - TC" for i in range(20)],
+        "warehouse": [f"Store {i} - TC" for i in range(15)],
+        "payment_terms": ["30 Days", "45 Days", "Advance", "COD"],
+        "tax_template": ["GST 18%", "GST 12%", "GST 5%"],
+        "asset_category": ["Vehicles", "Machinery", "IT Equipment"],
+        "mode_of_payment": ["Bank Transfer", "Cheque", "Cash"]
+    }
+    uoms = [("Box", "Nos", 12), ("Litre", "Litre", 1), ("Drum", "Litre", 200), ("Kg", "Kg", 1)]
+    
+    mappings = []
+    for item in range(max(patterns // patterns_per_item, 1)):
+        item_patterns = []
+        for _ in range(patterns_per_item):
+            pattern = {
+                field: values[min(int(rng.expovariate(0.3)), len(values) - 1)]
+                for field, values in vocabulary.items()
+                if rng.random() < 0.8
+            }
+            supplier_uom, stock_uom, factor = rng.choice(uoms)
+            pattern["uom_conversion"] = {"supplier_uom": supplier_uom, "stock_uom": stock_uom, "conversion_factor": factor}
+            item_patterns.append(pattern)
+        mappings.append((f"ITEM-{item:05d}", item_patterns))
+    
+    return mappings
+
+def legacy_field_suggestions(patterns: List[Dict], fields: tuple) -> Dict[str, Any]:
+    """Previous scoring, extended to every field: a quadratic mode per field over the pattern list"""
+    from fuzzy_waffle_ocr.learning.suggestion_index import get_pattern_value
+    
+    suggestions = {}
+    for field in fields:
+        values = [get_pattern_value(p, field) for p in patterns]
+        values = [value for value in values if value]
+        if values:
+            most_common = max(set(values), key=values.count)
+            suggestions[field] = (most_common, values.count(most_common))
+    
+    return suggestions
+
+def benchmark_suggestion_scoring(sizes: List[int] = None, iterations: int = 50, seed: int = 42) -> Dict[str, Any]:
+    """
+    Scoring every suggestion field for suppliers with thousands of patterns
+    
+    Compares the previous per-field list.count modes with the vectorized
+    pass over the compiled index, for one item of the supplier, and checks
+    both pick values with the same counts.
+    """
+    from fuzzy_waffle_ocr.learning.suggestion_index import SUGGESTION_FIELDS, compile_patterns
+    
+    sizes = sizes or [1000, 5000, 20000]
+    context_boost = {"expense_preference": "vehicle_maintenance", "asset_likelihood": "high"}
+    results = {}
+    
+    for size in sizes:
+        mappings = generate_supplier_patterns(size, seed)
+        item_code, item_patterns = mappings[0]
+        all_patterns = [pattern for _, patterns in mappings for pattern in patterns] + item_patterns
+        
+        started = time.perf_counter()
+        index = compile_patterns("Benchmark Supplier", mappings)
+        compile_ms = (time.perf_counter() - started) * 1000
+        
+        legacy = legacy_field_suggestions(all_patterns, SUGGESTION_FIELDS)
+        vectorized = index.score([item_code])
+        
+        results[f"{size} patterns"] = {
+            "slots": len(index.counts),
+            "compile_ms": round(compile_ms, 2),
+            "legacy": time_calls(lambda: legacy_field_suggestions(all_patterns, SUGGESTION_FIELDS), iterations),
+            "vectorized": time_calls(lambda: index.score([item_code], context_boost), iterations),
+            "same_counts": all(
+                f"Used {count} times" == vectorized[field]["reason"] for field, (_, count) in legacy.items()
+            )
+        }
+    
+    print_results("Suggestion scoring benchmark", results)
+    
+    return results
+
+ITEM_NAME_WORDS = {
+    "brand": ["castrol", "mobil", "shell", "bosch", "exide", "amaron", "apollo", "mrf", "havells", "polycab",
+              "tata", "ashok", "servo", "gulf", "total", "valvoline", "luk", "skf", "fag", "mann"],
+    "product": ["engine oil", "gear oil", "coolant", "brake fluid", "grease", "air filter", "oil filter",
+                "fuel filter", "v belt", "battery", "tyre", "tube", "bearing", "clutch plate", "brake pad",
+                "wiper blade", "head lamp", "fuse", "cable", "hose"],
+    "spec": ["20w50", "15w40", "5w30", "dot 4", "ep2", "12v", "24v", "radial", "heavy duty", "premium",
+             "standard", "hd", "xl", "pro", "plus", "max", "ultra", "eco", "gold", "silver"]
+}
+
+def generate_item_names(items: int, seed: int = 42) -> List[str]:
+    """Distinct synthetic item names: brand, product, spec and a pack size or part number"""
+    rng = random.Random(seed)
+    names = set()
+    
+    while len(names) < items:
+        size = rng.choice([f"{rng.randint(1, 210)} {rng.choice(['l', 'ltr', 'kg', 'ml', 'nos'])}",
+                           f"{rng.choice('abcdefghkmp')}{rng.randint(100, 99999)}"])
+        names.add(" ".join([rng.choice(words) for words in ITEM_NAME_WORDS.values()] + [size]).upper())
+    
+    return sorted(names)
+
+def add_ocr_noise(text: str, rng: random.Random, rate: float = 0.06) -> str:
+    """Drop, swap or double characters and vary spacing, as low-quality scans do"""
+    noisy = []
+    for char in text:
+        roll = rng.random()
+        if roll < rate / 3:
+            continue
+        elif roll < rate * 2 / 3:
+            noisy.append(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789"))
+        elif roll < rate:
+            noisy.append(char * 2)
+        else:
+            noisy.append(char)
+    
+    return "".join(noisy).replace(" ", rng.choice([" ", "  ", " - "]), 1)
+
+def benchmark_item_resolver(items: int = 100000, lines: int = 30, invoices: int = 20, seed: int = 42,
+                            naive_lines: int = 3) -> Dict[str, Any]:
+    """
+    Resolving noisy OCR invoice lines against a synthetic item catalog
+    
+    Times whole-invoice lookups through the trigram index and reports how
+    many lines resolved to the item they were made from. The naive path,
+    edit distance against every item, is timed on a few lines and scaled
+    to an invoice.
+    """
+    from Levenshtein import ratio
+    from fuzzy_waffle_ocr.learning.item_text_index import ItemTextIndex, get_item_key
+    from fuzzy_waffle_ocr.learning.item_text_normalization import get_match_text
+    
+    rng = random.Random(seed)
+    names = generate_item_names(items, seed)
+    
+    started = time.perf_counter()
+    index = ItemTextIndex()
+    for number, name in enumerate(names):
+        item_code = f"ITEM-{number:06d}"
+        index.set_texts(get_item_key(item_code), [(name, item_code, None)])
+    build_seconds = time.perf_counter() - started
+    
+    batches = []
+    for _ in range(invoices):
+        picked = [rng.randrange(items) for _ in range(lines)]
+        batches.append(([f"ITEM-{number:06d}" for number in picked], [add_ocr_noise(names[number], rng) for number in picked]))
+    
+    resolved = correct = 0
+    timings = []
+    for expected, descriptions in batches:
+        started = time.perf_counter()
+        matches = index.resolve(descriptions)
+        timings.append(time.perf_counter() - started)
+        
+        for item_code, match in zip(expected, matches):
+            if match:
+                resolved += 1
+                correct += match["item_code"] == item_code
+    
+    texts = [get_match_text(name) for name in names]
+    started = time.perf_counter()
+    for description in batches[0][1][:naive_lines]:
+        query = get_match_text(description)
+        max(texts, key=lambda text: ratio(query, text))
+    naive_per_line = (time.perf_counter() - started) / naive_lines
+    
+    results = {
+        "items": items,
+        "trigrams": len(index.postings),
+        "build_seconds": round(build_seconds, 2),
+        "indexed": {
+            "invoice_mean_ms": round(statistics.mean(timings) * 1000, 2),
+            "invoice_median_ms": round(statistics.median(timings) * 1000, 2),
+            "invoice_max_ms": round(max(timings) * 1000, 2),
+            "resolved_percent": percent(resolved, lines * invoices),
+            "correct_percent": percent(correct, lines * invoices)
+        },
+        "naive_invoice_ms": round(naive_per_line * lines * 1000, 2)
+    }
+    
+    print_results("Item resolver benchmark", results)
+    
+    return results
+
+# Characters OCR misreads, with what it reads them as
+OCR_CONFUSIONS = {"o": "0", "s": "5", "i": "1", "l": "1", "b": "8", "z": "2", "g": "6", "m": "rn", "w": "vv"}
+
+# Spellings of the same unit on scanned invoices
+UNIT_SPELLINGS = {
+    "l": ["L", "LTR", "LTRS", "Litre", "Lt"],
+    "ltr": ["L", "LTR", "LTRS", "Litres", "Lt"],
+    "kg": ["KG", "KGS", "Kg", "Kgs"],
+    "ml": ["ML", "Ml", "ml"],
+    "nos": ["NOS", "Nos", "PCS", "Pcs"]
+}
+
+def add_ocr_confusions(text: str, rng: random.Random, rate: float = 0.12) -> str:
+    """Misread confusable characters, respell the unit and break spacing, as scans of printed invoices do"""
+    words = text.lower().split(" ")
+    
+    # Pack size ("5 ltr"): another spelling of the unit, joined to the quantity or not
+    if len(words) > 1 and words[-1] in UNIT_SPELLINGS and words[-2].isdigit():
+        quantity, unit = words[-2:]
+        words[-2:] = [quantity + rng.choice(["", " "]) + rng.choice(UNIT_SPELLINGS[unit])]
+    
+    noisy = []
+    for char in " ".join(words):
+        if char in OCR_CONFUSIONS and rng.random() < rate:
+            noisy.append(OCR_CONFUSIONS[char])
+        elif char == " " and rng.random() < rate:
+            noisy.append(rng.choice(["", "  ", ".", "-"]))
+        else:
+            noisy.append(char)
+    
+    text = "".join(noisy)
+    return rng.choice([text.upper(), text.title(), text])
+
+def measure_resolution(index, labeled: List[tuple]) -> Dict[str, Any]:
+    """Resolve labeled (text, item code) lines one at a time: match rates and per-line latency"""
+    correct = resolved = hashed = 0
+    timings = []
+    
+    for text, item_code in labeled:
+        started = time.perf_counter()
+        match = index.resolve([text])[0]
+        timings.append(time.perf_counter() - started)
+        
+        if match:
+            resolved += 1
+            correct += match["item_code"] == item_code
+            hashed += match["match"] in ("exact", "canonical")
+    
+    timings.sort()
+    
+    return {
+        "correct_percent": percent(correct, len(labeled)),
+        "wrong_percent": percent(resolved - correct, len(labeled)),
+        "hash_hit_percent": percent(hashed, len(labeled)),
+        "line_mean_us": round(statistics.mean(timings) * 1e6, 1) if timings else 0,
+        "line_p95_us": round(timings[int(len(timings) * 0.95)] * 1e6, 1) if timings else 0
+    }
+
+def benchmark_ocr_normalization(items: int = 20000, lines: int = 2000, seed: int = 42,
+                                site_mappings: int = 5000) -> Dict[str, Any]:
+    """
+    Match rate and latency of OCR-confusion folding on labeled item texts
+    
+    The synthetic corpus is catalog item names misread the way scans are
+    (0/O, 5/S, 1/l, rn/m, unit spellings, broken spacing), each labeled
+    with its item. The site corpus is the OCR text of its Supplier Item
+    Mappings, labeled with the mapped item and resolved against the item
+    catalog alone. Both are resolved by an index with plain normalization
+    and one with confusion folding and canonical keys.
+    """
+    from fuzzy_waffle_ocr.learning.item_text_index import ItemTextIndex, get_item_key
+    from fuzzy_waffle_ocr.learning.streaming import stream_sql
+    
+    rng = random.Random(seed)
+    names = generate_item_names(items, seed)
+    catalog = [(f"ITEM-{number:06d}", name) for number, name in enumerate(names)]
+    picked = [rng.randrange(items) for _ in range(lines)]
+    corpora = {
+        "synthetic": (catalog, [(add_ocr_confusions(names[number], rng), catalog[number][0]) for number in picked])
+    }
+    
+    mappings = frappe.get_all(
+        "Supplier Item Mapping",
+        filters={"ocr_item_text": ["is", "set"], "erpnext_item_code": ["is", "set"]},
+        fields=["ocr_item_text", "erpnext_item_code"],
+        limit=site_mappings
+    )
+    if mappings:
+        site_catalog = [(row.name, row.item_name) for row in stream_sql("SELECT name, item_name FROM `tabItem` WHERE disabled = 0")]
+        corpora["site"] = (site_catalog, [(row.ocr_item_text, row.erpnext_item_code) for row in mappings])
+    
+    results = {}
+    for corpus, (catalog, labeled) in corpora.items():
+        results[corpus] = {"items": len(catalog), "lines": len(labeled)}
+        
+        for label, fold in (("plain", False), ("folded", True)):
+            index = ItemTextIndex(fold=fold)
+            for item_code, name in catalog:
+                index.set_texts(get_item_key(item_code), [(name, item_code, None), (item_code, item_code, None)])
+            
+            results[corpus][label] = measure_resolution(index, labeled)
+    
+    print_results("OCR normalization benchmark", results)
+    
+    return results
+
+def percent(count: int, total: int) -> float:
+    return round(count / total * 100, 2) if total else 0
+
+def print_results(title: str, results: Dict[str, Any]):
+    """Print benchmark results as an indented tree"""
+    print(f"\n{title}")
+    
+    def _print(value, indent):
+        for key, item in value.items():
+            if isinstance(item, dict):
+                print(f"{' ' * indent}{key}:")
+                _print(item, indent + 2)
+            else:
+                print(f"{' ' * indent}{key}: {item}")
+    
+    _print(results, 2)
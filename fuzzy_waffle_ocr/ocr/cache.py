@@ -0,0 +1,161 @@
+import frappe
+from redis import Redis
+import hashlib
+import json
+import time
+from typing import Dict, Any, Optional
+
+class OCRResultCache:
+    """
+    Content-addressed cache of OCR results, shared by all workers through Redis
+    
+    Entries are keyed by a hash of the file bytes plus everything that changes the
+    OCR output (preprocessing parameters, Tesseract config and version), so re-uploads
+    of the same bill skip rasterization, preprocessing and Tesseract entirely.
+    
+    Eviction is least-recently-used and bounded by the total size of stored results.
+    """
+    
+    KEY_PREFIX = "fuzzy_waffle_ocr:ocr_result:"
+    
+    # Sorted set of entry digests scored by last access time
+    INDEX_KEY = "fuzzy_waffle_ocr:ocr_result_index"
+    
+    # Hash of entry digest -> stored size in bytes, as a plain Redis number
+    SIZES_KEY = "fuzzy_waffle_ocr:ocr_result_sizes"
+    
+    BYTES_KEY = "fuzzy_waffle_ocr:ocr_result_bytes"
+    STATS_KEYS = ("hits", "misses", "evictions")
+    
+    HASH_CHUNK_SIZE = 1024 * 1024
+    
+    def __init__(self, max_size_mb: int = 256):
+        self.max_bytes = max(0, int(max_size_mb or 0)) * 1024 * 1024
+        self.cache = frappe.cache()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def make_key(self, file_path: str, params: Dict[str, Any]) -> str:
+        """Hash file content and OCR parameters into a cache key"""
+        digest = hashlib.sha256()
+        
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached OCR result, counting the hit or miss"""
+        payload = self.cache.get_value(self.KEY_PREFIX + key)
+        
+        if payload is None:
+            self._incr_stat("misses")
+            return None
+        
+        # Refresh recency for LRU eviction
+        self.cache.zadd(self.cache.make_key(self.INDEX_KEY), {key: time.time()})
+        self._incr_stat("hits")
+        
+        return json.loads(payload)
+    
+    def set(self, key: str, result: Dict[str, Any]):
+        """Store OCR result and evict least recently used entries over the size budget"""
+        payload = json.dumps(result, default=str)
+        size = len(payload)
+        
+        # A single result larger than the whole budget is never worth caching
+        if size > self.max_bytes:
+            return
+        
+        self.cache.set_value(self.KEY_PREFIX + key, payload)
+        self.cache.zadd(self.cache.make_key(self.INDEX_KEY), {key: time.time()})
+        
+        # Only the call adding the entry counts its bytes, so concurrent stores of one result count it once
+        if not Redis.hsetnx(self.cache, self.cache.make_key(self.SIZES_KEY), key, size):
+            return
+        
+        total_bytes = self.cache.incrby(self.cache.make_key(self.BYTES_KEY), size)
+        
+        if total_bytes > self.max_bytes:
+            self.evict(total_bytes)
+    
+    def evict(self, total_bytes: int):
+        """Drop least recently used entries until the cache fits its size budget"""
+        index_key = self.cache.make_key(self.INDEX_KEY)
+        sizes_key = self.cache.make_key(self.SIZES_KEY)
+        
+        while total_bytes > self.max_bytes:
+            oldest = self.cache.zpopmin(index_key)
+            if not oldest:
+                break
+            
+            key = frappe.safe_decode(oldest[0][0])
+            size = int(Redis.hget(self.cache, sizes_key, key) or 0)
+            
+            self.cache.delete_value(self.KEY_PREFIX + key)
+            
+            # Whoever removes the size field uncounts the entry, as only its adder counted it
+            if Redis.hdel(self.cache, sizes_key, key):
+                total_bytes = self.cache.decrby(self.cache.make_key(self.BYTES_KEY), size)
+            self._incr_stat("evictions")
+    
+    def clear(self):
+        """Remove all cached OCR results and reset counters"""
+        index_key = self.cache.make_key(self.INDEX_KEY)
+        
+        for key in self.cache.zrange(index_key, 0, -1):
+            self.cache.delete_value(self.KEY_PREFIX + frappe.safe_decode(key))
+        
+        self.cache.delete(
+            index_key,
+            self.cache.make_key(self.SIZES_KEY),
+            self.cache.make_key(self.BYTES_KEY),
+            *[self._stat_key(stat) for stat in self.STATS_KEYS]
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and current cache usage"""
+        stats = {stat: int(self.cache.get(self._stat_key(stat)) or 0) for stat in self.STATS_KEYS}
+        lookups = stats["hits"] + stats["misses"]
+        
+        stats.update({
+            "hit_rate": round(stats["hits"] / lookups * 100, 2) if lookups else 0,
+            "entries": self.cache.zcard(self.cache.make_key(self.INDEX_KEY)),
+            "size_bytes": int(self.cache.get(self.cache.make_key(self.BYTES_KEY)) or 0),
+            "max_bytes": self.max_bytes
+        })
+        
+        return stats
+    
+    def _stat_key(self, stat: str) -> str:
+        return self.cache.make_key(f"fuzzy_waffle_ocr:ocr_result_{stat}")
+    
+    def _incr_stat(self, stat: str):
+        self.cache.incr(self._stat_key(stat))
+
+def get_ocr_result_cache() -> OCRResultCache:
+    """Get OCR result cache sized from OCR Settings"""
+    from fuzzy_waffle_ocr.doctype.ocr_settings.ocr_settings import get_ocr_settings
+    
+    return OCRResultCache(get_ocr_settings().ocr_cache_size_mb)
+
+@frappe.whitelist()
+def get_ocr_cache_stats() -> Dict[str, Any]:
+    """API to get OCR result cache hit/miss counters"""
+    frappe.only_for("System Manager")
+    
+    return get_ocr_result_cache().get_stats()
+
+@frappe.whitelist()
+def clear_ocr_cache():
+    """API to clear the OCR result cache"""
+    frappe.only_for("System Manager")
+    
+    get_ocr_result_cache().clear()
+    
+    return {"status": "success", "message": "OCR result cache cleared"}
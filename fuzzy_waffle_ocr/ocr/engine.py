@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import shlex
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+# Backends import numpy, pytesseract and tesserocr when the engine is created or used
+if TYPE_CHECKING:
+    import numpy as np
+
+# Engine and pooled Tesseract instances shared by all OCRProcessor instances in this worker
+_engine = None
+_engine_lock = threading.Lock()
+
+# Tesseract version of the engine, looked up once per process
+_version = None
+
+class TesseractEngine(ABC):
+    """
+    Common interface for Tesseract backends
+    
+    Both methods take an in-memory image array and a pytesseract-style config string
+    (e.g. '--psm 6 -c tessedit_char_whitelist=0123456789'), so callers do not need to
+    know which backend is running. A backend that does not implement every
+    abstract method fails when it is created, not in the middle of OCR.
+    """
+    
+    name = None
+    
+    def __init__(self, lang: str = "eng"):
+        self.lang = lang
+    
+    @abstractmethod
+    def image_to_data(self, image: np.ndarray, config: str = "") -> Dict[str, List]:
+        """Recognize words with confidence, position and block/paragraph/line ids"""
+    
+    @abstractmethod
+    def image_to_string(self, image: np.ndarray, config: str = "") -> str:
+        """Recognize plain text"""
+    
+    @abstractmethod
+    def version(self) -> str:
+        """Get Tesseract version used by this engine"""
+
+class SubprocessEngine(TesseractEngine):
+    """Runs the tesseract binary through pytesseract, forking a process (and reloading traineddata) per call"""
+    
+    name = "subprocess"
+    
+    def image_to_data(self, image: np.ndarray, config: str = "") -> Dict[str, List]:
+        import pytesseract
+        
+        return pytesseract.image_to_data(
+            image,
+            lang=self.lang,
+            config=config,
+            output_type=pytesseract.Output.DICT
+        )
+    
+    def image_to_string(self, image: np.ndarray, config: str = "") -> str:
+        import pytesseract
+        
+        return pytesseract.image_to_string(image, lang=self.lang, config=config)
+    
+    def version(self) -> str:
+        import pytesseract
+        
+        return str(pytesseract.get_tesseract_version())
+
+class PooledEngine(TesseractEngine):
+    """
+    Keeps long-lived, initialized Tesseract instances through the tesserocr C API bindings
+    
+    Instances are pooled per page segmentation mode and variable set, so traineddata is
+    loaded once per worker instead of once per call. Images are handed over as raw
+    bytes from memory. Each instance is used by one thread at a time; concurrent callers
+    with the same config get their own instance.
+    """
+    
+    name = "pooled"
+    
+    def __init__(self, lang: str = "eng", source_dpi: int = 300):
+        import tesserocr
+        
+        super().__init__(lang)
+        self.tesserocr = tesserocr
+        self.source_dpi = source_dpi
+        self.pool = {}
+        self.pool_lock = threading.Lock()
+    
+    def image_to_data(self, image: np.ndarray, config: str = "") -> Dict[str, List]:
+        RIL = self.tesserocr.RIL
+        
+        data = {key: [] for key in (
+            "text", "conf", "left", "top", "width", "height",
+            "block_num", "par_num", "line_num", "word_num"
+        )}
+        
+        with self.checkout(config) as api:
+            self._set_image(api, image)
+            api.Recognize()
+            
+            iterator = api.GetIterator()
+            if iterator is None:
+                return data
+            
+            block_num = par_num = line_num = word_num = 0
+            
+            while True:
+                if iterator.IsAtBeginningOf(RIL.BLOCK):
+                    block_num += 1
+                    par_num = 0
+                if iterator.IsAtBeginningOf(RIL.PARA):
+                    par_num += 1
+                    line_num = 0
+                if iterator.IsAtBeginningOf(RIL.TEXTLINE):
+                    line_num += 1
+                    word_num = 0
+                
+                word = iterator.GetUTF8Text(RIL.WORD)
+                box = iterator.BoundingBox(RIL.WORD)
+                
+                if word and box:
+                    word_num += 1
+                    left, top, right, bottom = box
+                    data["text"].append(word)
+                    data["conf"].append(iterator.Confidence(RIL.WORD))
+                    data["left"].append(left)
+                    data["top"].append(top)
+                    data["width"].append(right - left)
+                    data["height"].append(bottom - top)
+                    data["block_num"].append(block_num)
+                    data["par_num"].append(par_num)
+                    data["line_num"].append(line_num)
+                    data["word_num"].append(word_num)
+                
+                if not iterator.Next(RIL.WORD):
+                    break
+        
+        return data
+    
+    def image_to_string(self, image: np.ndarray, config: str = "") -> str:
+        with self.checkout(config) as api:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+    
+    def version(self) -> str:
+        return self.tesserocr.tesseract_version().split()[1]
+    
+    @contextmanager
+    def checkout(self, config: str):
+        """Borrow an initialized Tesseract instance for this config, returning it to the pool afterwards"""
+        psm, variables = parse_tesseract_config(config)
+        pool_key = (psm, tuple(sorted(variables.items())))
+        
+        with self.pool_lock:
+            idle = self.pool.setdefault(pool_key, [])
+            api = idle.pop() if idle else None
+        
+        if api is None:
+            api = self._create_api(psm, variables)
+        
+        try:
+            yield api
+        finally:
+            api.Clear()
+            with self.pool_lock:
+                self.pool[pool_key].append(api)
+    
+    def warm_up(self, configs: List[str]):
+        """Initialize one instance per config ahead of the first request"""
+        for config in configs:
+            with self.checkout(config):
+                pass
+    
+    def close(self):
+        """Release all pooled Tesseract instances"""
+        with self.pool_lock:
+            for idle in self.pool.values():
+                for api in idle:
+                    api.End()
+            self.pool = {}
+    
+    def _create_api(self, psm: int, variables: Dict[str, str]):
+        api = self.tesserocr.PyTessBaseAPI(lang=self.lang, psm=psm)
+        
+        for name, value in variables.items():
+            api.SetVariable(name, value)
+        
+        return api
+    
+    def _set_image(self, api, image: np.ndarray):
+        import numpy as np
+        
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        
+        api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        api.SetSourceResolution(self.source_dpi)
+
+def parse_tesseract_config(config: str) -> Tuple[int, Dict[str, str]]:
+    """Split a pytesseract-style config string into page segmentation mode and -c variables"""
+    psm = 3  # Tesseract default: fully automatic page segmentation
+    variables = {}
+    
+    tokens = shlex.split(config or "")
+    
+    for i, token in enumerate(tokens[:-1]):
+        if token == "--psm":
+            psm = int(tokens[i + 1])
+        elif token == "-c" and "=" in tokens[i + 1]:
+            name, value = tokens[i + 1].split("=", 1)
+            variables[name] = value
+    
+    return psm, variables
+
+def get_engine() -> TesseractEngine:
+    """
+    Get the process-wide Tesseract engine
+    
+    Uses the pooled C API engine when tesserocr is installed, otherwise falls
+    back to running the tesseract binary per call.
+    """
+    global _engine
+    
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    _engine = PooledEngine()
+                except ImportError:
+                    _engine = SubprocessEngine()
+    
+    return _engine
+
+def get_tesseract_version() -> str:
+    """Tesseract version of the process-wide engine, part of every OCR result cache key"""
+    global _version
+    
+    if _version is None:
+        _version = get_engine().version()
+    
+    return _version
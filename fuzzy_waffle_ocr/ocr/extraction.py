@@ -0,0 +1,325 @@
+import frappe
+import re
+from functools import lru_cache
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+from fuzzy_waffle_ocr.ocr.line_items import parse_line_item_row
+
+# Extractor built from the default patterns plus every app's `ocr_field_patterns` hook
+_extractor = None
+
+AMOUNT_PREFIX = r'(?:₹|Rs\.?|INR)?'
+TAX_AMOUNT = r'\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)'
+
+class FieldRule:
+    """A compiled pattern for one invoice field"""
+    
+    __slots__ = ("field", "regex", "priority", "parse", "hints", "multi")
+    
+    def __init__(self, field: str, regex, priority: int, parse: Callable, hints: tuple, multi: bool):
+        self.field = field
+        self.regex = regex
+        self.priority = priority
+        self.parse = parse
+        self.hints = hints
+        self.multi = multi
+
+class FieldPatternRegistry:
+    """
+    Registry of compiled invoice field patterns
+    
+    Patterns match within one line of the text. Patterns for a field are tried in
+    priority order (lowest first, then registration order): the first one that
+    matches anywhere in the document wins. Multi-value
+    fields (e.g. "items") collect every match instead. Dotted field names such as
+    "tax_info.cgst" are nested in the extracted data.
+    
+    Fields that a regex cannot parse safely get a parser function instead, which
+    receives the whole text, or each line for a line parser, and replaces any
+    patterns for that field.
+    
+    Other apps can add patterns without touching OCRProcessor by listing functions
+    that take the registry in the `ocr_field_patterns` hook.
+    """
+    
+    def __init__(self):
+        self.rules = {}
+        self.parsers = {}
+        self.line_parsers = {}
+        self.multi_fields = set()
+    
+    def register(self, field: str, pattern: str, priority: Optional[int] = None, parse: Callable = None,
+                 hints: Iterable[str] = None, flags: int = re.IGNORECASE, multi: bool = False) -> FieldRule:
+        """
+        Register a pattern for a field
+        
+        `parse` turns the match into the field value (group 1 by default); returning
+        None rejects the match. `hints` are lowercase substrings of which any match
+        must contain at least one, letting lines without them skip the regex entirely.
+        """
+        rules = self.rules.setdefault(field, [])
+        
+        rule = FieldRule(
+            field,
+            re.compile(pattern, flags),
+            len(rules) if priority is None else priority,
+            parse or first_group,
+            tuple(hint.lower() for hint in hints or ()),
+            multi
+        )
+        rules.append(rule)
+        
+        if multi:
+            self.multi_fields.add(field)
+        
+        return rule
+    
+    def register_parser(self, field: str, parser: Callable[[str], Any], multi: bool = False):
+        """Register a function that extracts a field from the whole OCR text"""
+        self.parsers[field] = parser
+        self.line_parsers.pop(field, None)
+        self.rules.setdefault(field, [])
+        
+        if multi:
+            self.multi_fields.add(field)
+    
+    def register_line_parser(self, field: str, parser: Callable[[str], List[Any]]):
+        """Register a function returning a multi-value field's values found on one line of OCR text"""
+        self.line_parsers[field] = parser
+        self.parsers.pop(field, None)
+        self.rules.setdefault(field, [])
+        self.multi_fields.add(field)
+    
+    def get_group_fields(self, group: str) -> List[str]:
+        """Get nested field names in a group, e.g. tax_info.gstin and tax_info.cgst for tax_info"""
+        return [field for field in self.rules if field.startswith(group + ".")]
+    
+    def get_rules(self, fields: Iterable[str] = None) -> List[FieldRule]:
+        """Get rules for the given fields (all by default), each field's rules in priority order"""
+        rules = []
+        
+        for field in fields or self.rules:
+            rules.extend(sorted(self.rules.get(field, []), key=lambda rule: rule.priority))
+        
+        return rules
+
+class FieldExtractor:
+    """
+    Fills every registered field in one pass over the lines of the OCR text
+    
+    The text is split into lines and lowercased once. Each hint of the requested
+    patterns is located with plain substring searches, giving the lines each
+    hinted pattern can match on; patterns without hints are tried on every line.
+    The lines are then walked once, each pattern searching only its candidate
+    lines, until every requested field holds the match of its highest priority
+    pattern. Line parsers see every line in the same walk.
+    """
+    
+    def __init__(self, registry: FieldPatternRegistry):
+        self.registry = registry
+        self.rules = {field: registry.get_rules([field]) for field in registry.rules}
+        
+        # A rule's rank within its field: a match of rank 0 cannot be beaten
+        self.ranks = {rule: rank for rules in self.rules.values() for rank, rule in enumerate(rules)}
+        
+        # field -> hint -> the field's rules with that hint
+        self.field_hints = {}
+        for field, rules in self.rules.items():
+            for rule in rules:
+                for hint in rule.hints:
+                    self.field_hints.setdefault(field, {}).setdefault(hint, []).append(rule)
+    
+    def extract(self, text: str, fields: Iterable[str] = None) -> Dict[str, Any]:
+        """
+        Extract fields from OCR text
+        
+        Returns a flat dict of field name to value: None for unmatched single-value
+        fields, a list for multi-value fields. Pass `fields` to only extract some.
+        """
+        values = {}
+        line_fields = []
+        
+        for field in fields or self.rules:
+            if field in self.registry.parsers:
+                values[field] = self.registry.parsers[field](text)
+            else:
+                values[field] = [] if field in self.registry.multi_fields else None
+                line_fields.append(field)
+        
+        if line_fields:
+            self.scan_lines(text, line_fields, values)
+        
+        return values
+    
+    def scan_lines(self, text: str, fields: List[str], values: Dict[str, Any]):
+        """Fill the given pattern and line parser fields of `values` in one walk over the lines"""
+        lines = text.splitlines()
+        lower = "\n".join(lines).lower()
+        
+        multi = {field for field in fields if field in self.registry.multi_fields}
+        line_parsers = [(field, self.registry.line_parsers[field]) for field in fields if field in self.registry.line_parsers]
+        
+        # Hinted rules by the offset of the lines holding their hint; lowercasing keeps line breaks.
+        # A dict per line, so a rule with several hints on one line is queued once.
+        line_rules = {}
+        for field in fields:
+            for hint, rules in self.field_hints.get(field, {}).items():
+                position = lower.find(hint)
+                while position != -1:
+                    line_start = lower.rfind("\n", 0, position) + 1
+                    line_rules.setdefault(line_start, {}).update(dict.fromkeys(rules))
+                    
+                    line_end = lower.find("\n", position)
+                    position = lower.find(hint, line_end + 1) if line_end != -1 else -1
+        
+        unhinted = [rule for field in fields for rule in self.rules.get(field, []) if not rule.hints]
+        
+        # Single-value fields still open to a better match, and the best (rank, value) so far
+        pending = {field for field in fields if field not in multi}
+        best = {}
+        multi_values = {}
+        offset = 0
+        
+        for line in lines:
+            if not pending and not multi:
+                break
+            
+            for field, parser in line_parsers:
+                values[field].extend(parser(line))
+            
+            rules = line_rules.get(offset)
+            offset += len(line) + 1
+            
+            if rules:
+                rules = sorted(rules, key=self.ranks.get) + unhinted
+            elif unhinted:
+                rules = unhinted
+            else:
+                continue
+            
+            for rule in rules:
+                field = rule.field
+                if field in multi:
+                    multi_values.setdefault(rule, []).extend(
+                        value for value in map(rule.parse, rule.regex.finditer(line)) if value is not None
+                    )
+                    continue
+                
+                rank = self.ranks[rule]
+                if field not in pending or (field in best and best[field][0] <= rank):
+                    continue
+                
+                for match in rule.regex.finditer(line):
+                    value = rule.parse(match)
+                    if value is not None:
+                        best[field] = (rank, value)
+                        if rank == 0:
+                            pending.discard(field)
+                            unhinted = [rule for rule in unhinted if rule.field != field]
+                        break
+        
+        for field, (_, value) in best.items():
+            values[field] = value
+        
+        # Pattern matches of multi-value fields are listed in priority order
+        for field in multi:
+            for rule in self.rules.get(field, []):
+                values[field].extend(multi_values.get(rule, ()))
+    
+    def extract_invoice_data(self, text: str, fields: Iterable[str] = None) -> Dict[str, Any]:
+        """Extract fields (all by default), nesting dotted field names (e.g. tax_info.cgst) into dicts"""
+        data = {}
+        
+        for field, value in self.extract(text, fields).items():
+            if "." not in field:
+                data[field] = value
+                continue
+            
+            group, key = field.split(".", 1)
+            data.setdefault(group, {})
+            
+            # Unmatched nested fields are left out, as before
+            if value is not None:
+                data[group][key] = value
+        
+        return data
+
+def first_group(match) -> str:
+    return match.group(1)
+
+def stripped_group(match) -> str:
+    return match.group(1).strip()
+
+def parse_amount(match) -> Optional[float]:
+    """Parse an amount like 1,234.50, rejecting matches that are not a number"""
+    try:
+        return float(match.group(1).replace(',', ''))
+    except ValueError:
+        return None
+
+def parse_date(match) -> str:
+    return standardize_date(match.group(1))
+
+@lru_cache(maxsize=4096)
+def standardize_date(date_str: str) -> str:
+    """Convert date to YYYY-MM-DD format"""
+    from dateutil import parser
+    try:
+        parsed_date = parser.parse(date_str)
+        return parsed_date.strftime('%Y-%m-%d')
+    except:
+        return date_str
+
+def register_default_patterns(registry: FieldPatternRegistry):
+    """Register the built-in invoice field patterns"""
+    registry.register("invoice_number", r'Invoice\s*(?:No|Number|#)?\s*[:.]?\s*([A-Z0-9\-/]+)', hints=("invoice",))
+    registry.register("invoice_number", r'Bill\s*(?:No|Number)?\s*[:.]?\s*([A-Z0-9\-/]+)', hints=("bill",))
+    registry.register("invoice_number", r'Inv\s*[:.]?\s*([A-Z0-9\-/]+)', hints=("inv",))
+    registry.register("invoice_number", r'(?:Invoice|Bill|Inv)\s*([A-Z0-9\-/]+)', hints=("inv", "bill"))
+    
+    registry.register("invoice_date", r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})', parse=parse_date)
+    registry.register(
+        "invoice_date",
+        r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4})',
+        parse=parse_date,
+        hints=("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+    )
+    registry.register("invoice_date", r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})', parse=parse_date)
+    
+    registry.register("total_amount", rf'Total\s*[:.]?\s*{AMOUNT_PREFIX}\s*([0-9,]+\.?\d*)', parse=parse_amount, hints=("total",))
+    registry.register("total_amount", rf'Grand\s*Total\s*[:.]?\s*{AMOUNT_PREFIX}\s*([0-9,]+\.?\d*)', parse=parse_amount, hints=("grand",))
+    registry.register("total_amount", rf'Amount\s*Payable\s*[:.]?\s*{AMOUNT_PREFIX}\s*([0-9,]+\.?\d*)', parse=parse_amount, hints=("payable",))
+    registry.register("total_amount", rf'Net\s*Amount\s*[:.]?\s*{AMOUNT_PREFIX}\s*([0-9,]+\.?\d*)', parse=parse_amount, hints=("net",))
+    
+    # Tokenizing parser rather than a regex: linear on noisy scans
+    registry.register_line_parser("items", parse_line_item_row)
+    
+    registry.register("payment_terms", r'Payment\s*Terms?\s*[:.]?\s*([A-Za-z0-9\s]+)', parse=stripped_group, hints=("payment",))
+    registry.register("payment_terms", r'(?:Net|Credit)\s*(\d+\s*Days?)', parse=stripped_group, hints=("net", "credit"))
+    registry.register("payment_terms", r'Due\s*(?:in|within)\s*(\d+\s*Days?)', parse=stripped_group, hints=("due",))
+    registry.register("payment_terms", r'(Cash|COD|Credit)', parse=stripped_group, hints=("cash", "cod", "credit"))
+    
+    registry.register("tax_info.gstin", r'GST[IN]*\s*[:.]?\s*([A-Z0-9]+)', hints=("gst",))
+    registry.register("tax_info.cgst", r'CGST' + TAX_AMOUNT, parse=parse_amount, hints=("cgst",))
+    registry.register("tax_info.sgst", r'SGST' + TAX_AMOUNT, parse=parse_amount, hints=("sgst",))
+    registry.register("tax_info.igst", r'IGST' + TAX_AMOUNT, parse=parse_amount, hints=("igst",))
+
+def get_field_extractor() -> FieldExtractor:
+    """Get the process-wide field extractor, building the pattern registry on first use"""
+    global _extractor
+    
+    if _extractor is None:
+        registry = FieldPatternRegistry()
+        register_default_patterns(registry)
+        
+        for method in frappe.get_hooks("ocr_field_patterns"):
+            frappe.get_attr(method)(registry)
+        
+        _extractor = FieldExtractor(registry)
+    
+    return _extractor
+
+def clear_field_extractor():
+    """Drop the built extractor so hook changes are picked up on next use"""
+    global _extractor
+    _extractor = None
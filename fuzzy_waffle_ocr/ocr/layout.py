@@ -0,0 +1,329 @@
+import numpy as np
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Tuple
+
+from fuzzy_waffle_ocr.ocr.line_items import classify_token, NUMBER, UOM
+
+# Header words that name item table columns
+COLUMN_KEYWORDS = {
+    "description": ("description", "particulars", "item", "items", "product", "goods", "details"),
+    "quantity": ("qty", "quantity"),
+    "uom": ("uom", "unit", "units"),
+    "rate": ("rate", "price"),
+    "amount": ("amount", "value", "total")
+}
+NUMERIC_COLUMNS = ("quantity", "rate", "amount")
+
+# Rows starting with one of these end the item table
+TABLE_END_KEYWORDS = ("total", "subtotal", "sub", "grand", "cgst", "sgst", "igst", "gst", "tax", "discount", "round")
+
+# Total labels in order of preference; the lowest matching row wins for each label
+TOTAL_LABELS = (("grand", "total"), ("amount", "payable"), ("net", "amount"), ("total",))
+
+class WordBoxTable:
+    """
+    Column-oriented table of OCR word boxes for one page
+    
+    Built from the word data every OCR pass already returns, so layout
+    analysis never needs another Tesseract run.
+    """
+    
+    __slots__ = ("text", "conf", "left", "top", "width", "height", "block_num", "par_num", "line_num")
+    
+    def __init__(self, words: Dict[str, List]):
+        self.text = list(words["text"])
+        self.conf = np.asarray(words["conf"], dtype=np.int16)
+        
+        for key in ("left", "top", "width", "height", "block_num", "par_num", "line_num"):
+            setattr(self, key, np.asarray(words[key], dtype=np.int32))
+    
+    def __len__(self) -> int:
+        return len(self.text)
+    
+    @property
+    def right(self) -> np.ndarray:
+        return self.left + self.width
+    
+    @property
+    def bottom(self) -> np.ndarray:
+        return self.top + self.height
+    
+    @property
+    def center_x(self) -> np.ndarray:
+        return self.left + self.width // 2
+    
+    @property
+    def center_y(self) -> np.ndarray:
+        return self.top + self.height // 2
+
+class GridIndex:
+    """Uniform grid over word boxes for fast rectangle queries"""
+    
+    def __init__(self, table: WordBoxTable, cell_size: int):
+        self.cell_size = max(int(cell_size), 1)
+        self.cells = defaultdict(list)
+        
+        col_start = table.left // self.cell_size
+        col_end = np.maximum(table.right - 1, table.left) // self.cell_size
+        row_start = table.top // self.cell_size
+        row_end = np.maximum(table.bottom - 1, table.top) // self.cell_size
+        
+        for i in range(len(table)):
+            for row in range(row_start[i], row_end[i] + 1):
+                for col in range(col_start[i], col_end[i] + 1):
+                    self.cells[(row, col)].append(i)
+        
+        self.table = table
+        self.max_col = int(col_end.max()) if len(table) else 0
+    
+    def query(self, left: int, top: int, right: int, bottom: int) -> List[int]:
+        """Indices of boxes intersecting the rectangle, in index order"""
+        table = self.table
+        found = set()
+        
+        for row in range(int(top) // self.cell_size, int(bottom) // self.cell_size + 1):
+            for col in range(max(int(left), 0) // self.cell_size, min(int(right) // self.cell_size, self.max_col) + 1):
+                found.update(self.cells.get((row, col), ()))
+        
+        return sorted(
+            i for i in found
+            if table.left[i] <= right and table.left[i] + table.width[i] >= left
+            and table.top[i] <= bottom and table.top[i] + table.height[i] >= top
+        )
+
+class PageLayout:
+    """Visual rows, item table and labeled values of one OCR'd page"""
+    
+    def __init__(self, words: Dict[str, List]):
+        self.table = WordBoxTable(words)
+        self.line_height = int(np.median(self.table.height)) if len(self.table) else 1
+        self.grid = GridIndex(self.table, self.line_height * 2)
+        self.page_right = int(self.table.right.max()) if len(self.table) else 0
+        self.rows = self.build_rows()
+    
+    def build_rows(self) -> List[List[int]]:
+        """
+        Group words into visual rows, each sorted left to right
+        
+        Words join a row when their vertical centers are within half a word height,
+        regardless of the block Tesseract put them in, so table columns that were
+        segmented separately come back together.
+        """
+        table = self.table
+        center_y = table.center_y
+        assigned = np.zeros(len(table), dtype=bool)
+        rows = []
+        
+        for i in np.argsort(center_y, kind="stable"):
+            if assigned[i]:
+                continue
+            
+            half_height = max(int(table.height[i]) // 2, 1)
+            band = self.grid.query(0, center_y[i] - half_height, self.page_right, center_y[i] + half_height)
+            
+            row = [
+                j for j in band
+                if not assigned[j] and abs(int(center_y[j]) - int(center_y[i])) <= max(table.height[i], table.height[j]) // 2
+            ]
+            if i not in row:
+                row.append(i)
+            
+            assigned[row] = True
+            rows.append(sorted(row, key=lambda j: table.left[j]))
+        
+        return rows
+    
+    def get_text(self) -> str:
+        """Page text rebuilt from visual rows"""
+        return "\n".join(" ".join(self.table.text[i] for i in row) for row in self.rows)
+    
+    def row_words(self, row: List[int]) -> List[str]:
+        return [normalize_word(self.table.text[i]) for i in row]
+    
+    def find_item_columns(self) -> Tuple[Optional[int], Dict[str, Tuple[int, int]]]:
+        """
+        Find the item table header row and its column spans
+        
+        A header names at least two of quantity, rate and amount. Column spans
+        reach halfway to the neighbouring header words.
+        """
+        for row_index, row in enumerate(self.rows):
+            columns = {}
+            
+            for i, word in zip(row, self.row_words(row)):
+                for column, keywords in COLUMN_KEYWORDS.items():
+                    if word in keywords and column not in columns:
+                        columns[column] = int(self.table.center_x[i])
+            
+            if sum(1 for column in NUMERIC_COLUMNS if column in columns) < 2:
+                continue
+            
+            ordered = sorted(columns.items(), key=lambda column: column[1])
+            
+            # Anything left of the first numeric column is description
+            if "description" not in columns:
+                ordered.insert(0, ("description", 0))
+            
+            spans = {}
+            for k, (column, center) in enumerate(ordered):
+                start = 0 if k == 0 else (ordered[k - 1][1] + center) // 2
+                end = (center + ordered[k + 1][1]) // 2 if k + 1 < len(ordered) else np.iinfo(np.int32).max
+                spans[column] = (start, end)
+            
+            return row_index, spans
+        
+        return None, {}
+    
+    def extract_items(self) -> List[Dict[str, Any]]:
+        """Read item rows under the table header, assigning words to columns by position"""
+        header_index, spans = self.find_item_columns()
+        if header_index is None:
+            return []
+        
+        boundaries = sorted(spans.items(), key=lambda span: span[1][0])
+        starts = np.array([span[0] for _, span in boundaries])
+        items = []
+        
+        for row in self.rows[header_index + 1:]:
+            words = self.row_words(row)
+            if words and words[0] in TABLE_END_KEYWORDS:
+                break
+            
+            cells = defaultdict(list)
+            for i in row:
+                column = boundaries[np.searchsorted(starts, self.table.center_x[i], side="right") - 1][0]
+                cells[column].append(self.table.text[i])
+            
+            item = parse_item_cells(cells)
+            
+            if item:
+                items.append(item)
+            elif items and cells.get("description") and len(cells) == 1:
+                # Wrapped description continues the previous item
+                items[-1]["description"] += " " + " ".join(cells["description"])
+        
+        return items
+    
+    def find_labeled_amount(self, labels: Tuple[Tuple[str, ...], ...] = TOTAL_LABELS) -> Optional[float]:
+        """Amount printed right of (or else below) the most preferred label found"""
+        for label in labels:
+            for row in reversed(self.rows):
+                end = find_label(self.row_words(row), label)
+                if end is None:
+                    continue
+                
+                label_box = row[end]
+                amount = self.amount_right_of(label_box, row) or self.amount_below(label_box)
+                if amount is not None:
+                    return amount
+        
+        return None
+    
+    def amount_right_of(self, label_box: int, row: List[int]) -> Optional[float]:
+        table = self.table
+        
+        for i in row:
+            if table.left[i] > table.left[label_box]:
+                amount = parse_amount(table.text[i])
+                if amount is not None:
+                    return amount
+        
+        return None
+    
+    def amount_below(self, label_box: int) -> Optional[float]:
+        table = self.table
+        top = int(table.top[label_box] + table.height[label_box])
+        
+        candidates = self.grid.query(
+            table.left[label_box], top,
+            table.left[label_box] + table.width[label_box], top + self.line_height * 2
+        )
+        
+        for i in sorted(candidates, key=lambda i: table.top[i]):
+            amount = parse_amount(table.text[i])
+            if amount is not None:
+                return amount
+        
+        return None
+
+def normalize_word(word: str) -> str:
+    return word.strip(":.#-|").lower()
+
+def find_label(words: List[str], label: Tuple[str, ...]) -> Optional[int]:
+    """Position of the last word of the label in the row; "Sub Total" does not count as a total"""
+    for start in range(len(words) - len(label) + 1):
+        if tuple(words[start:start + len(label)]) != label:
+            continue
+        
+        if label == ("total",) and start and words[start - 1] == "sub":
+            continue
+        
+        return start + len(label) - 1
+    
+    return None
+
+def parse_amount(text: str) -> Optional[float]:
+    """Number in a word, allowing a glued currency symbol (Rs.8,631.70)"""
+    for kind, value, _ in classify_token(text):
+        if kind == NUMBER:
+            return value
+    
+    return None
+
+def parse_item_cells(cells: Dict[str, List[str]]) -> Optional[Dict[str, Any]]:
+    """Build an item from words grouped by column; None unless it has a description and an amount"""
+    description = " ".join(cells.get("description", []))
+    numbers = {}
+    uom = None
+    
+    for column in ("quantity", "uom", "rate", "amount"):
+        for word in cells.get(column, []):
+            for kind, value, _ in classify_token(word):
+                if kind == NUMBER and column in NUMERIC_COLUMNS and column not in numbers:
+                    numbers[column] = value
+                elif kind == UOM:
+                    uom = value
+    
+    if not description or "amount" not in numbers:
+        return None
+    
+    quantity = numbers.get("quantity", 1.0)
+    item = {
+        "description": description,
+        "quantity": quantity,
+        "rate": numbers.get("rate", round(numbers["amount"] / quantity, 2) if quantity else numbers["amount"]),
+        "amount": numbers["amount"]
+    }
+    
+    if uom:
+        item["uom"] = uom
+    
+    return item
+
+def extract_layout_fields(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Extract line items and total from the word boxes of OCR'd pages
+    
+    Items come from every page's item table; the total from the last page
+    that has one. Fields not found are left out.
+    """
+    items = []
+    total_amount = None
+    
+    for page in pages:
+        if not page.get("words") or not page["words"].get("text"):
+            continue
+        
+        layout = PageLayout(page["words"])
+        items.extend(layout.extract_items())
+        page_total = layout.find_labeled_amount()
+        if page_total is not None:
+            total_amount = page_total
+    
+    data = {}
+    if items:
+        data["items"] = items
+    if total_amount is not None:
+        data["total_amount"] = total_amount
+    
+    return data
@@ -0,0 +1,187 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+# Units recognized after the quantity, keyed by lowercase form
+UOMS = {uom.lower(): uom for uom in ("Pcs", "Kg", "Lt", "Nos", "Box", "Unit")}
+
+CURRENCY_SYMBOLS = ("₹", "Rs.", "Rs", "INR")
+CURRENCY_INITIALS = {symbol[0] for symbol in CURRENCY_SYMBOLS}
+
+# Token patterns are anchored and free of nested quantifiers, so classifying a token is linear in its length
+NUMBER_PATTERN = re.compile(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+\.?\d*')
+QUANTITY_UOM_PATTERN = re.compile(r'(\d+\.?\d*)([A-Za-z]+)')
+WORD_PATTERN = re.compile(r'[A-Za-z\-]+')
+
+# Token kinds
+WORD, NUMBER, UOM, CURRENCY, OTHER = "word", "number", "uom", "currency", "other"
+
+def parse_line_items(text: str) -> List[Dict[str, Any]]:
+    """
+    Parse line items (description, quantity, UOM, rate, amount) from OCR text
+    
+    Rows never span line breaks. Every character is looked at a bounded number of
+    times, so cost stays linear however noisy the scan is.
+    """
+    items = []
+    
+    for line in text.splitlines():
+        items.extend(parse_line_item_row(line))
+    
+    return items
+
+def parse_line_item_row(line: str) -> List[Dict[str, Any]]:
+    """Parse the line items of one line of OCR text"""
+    return parse_row(line.split())
+
+def parse_line_items_from_words(words: Dict[str, List]) -> List[Dict[str, Any]]:
+    """Parse line items from word-level OCR data, taking rows from the layout's line grouping"""
+    items = []
+    
+    for row in iter_word_rows(words):
+        items.extend(parse_row(row))
+    
+    return items
+
+def iter_word_rows(words: Dict[str, List]) -> Iterable[List[str]]:
+    """Yield the words of each OCR line in reading order"""
+    row = []
+    current_line = None
+    
+    for text, block_num, par_num, line_num in zip(
+        words["text"], words["block_num"], words["par_num"], words["line_num"]
+    ):
+        line = (block_num, par_num, line_num)
+        
+        if line != current_line and row:
+            yield row
+            row = []
+        
+        current_line = line
+        row.extend(text.split())
+    
+    if row:
+        yield row
+
+def parse_row(raw_tokens: List[str]) -> List[Dict[str, Any]]:
+    """
+    Find items in one row of tokens
+    
+    An item is a run of description words followed by quantity, optional UOM,
+    rate and amount, each amount optionally prefixed with a currency symbol.
+    A row may hold several items; anything else is skipped.
+    """
+    tokens = [token for raw_token in raw_tokens for token in classify_token(raw_token)]
+    items = []
+    description_start = None
+    i = 0
+    
+    while i < len(tokens):
+        kind = tokens[i][0]
+        
+        # A unit name only counts as a unit right after a quantity; elsewhere it is a word
+        if kind in (WORD, UOM):
+            if description_start is None:
+                description_start = i
+            i += 1
+            continue
+        
+        if kind == NUMBER and description_start is not None:
+            item, next_index = match_item(tokens, description_start, i)
+            if item:
+                items.append(item)
+                description_start = None
+                i = next_index
+                continue
+        
+        description_start = None
+        i += 1
+    
+    return items
+
+def match_item(tokens: List[Tuple[str, Any, str]], description_start: int, i: int) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Match quantity [UOM] [currency] rate [currency] amount starting at token i"""
+    description_end = i
+    quantity = tokens[i][1]
+    uom = None
+    i += 1
+    
+    if i < len(tokens) and tokens[i][0] == UOM:
+        uom = tokens[i][1]
+        i += 1
+    
+    amounts = []
+    while len(amounts) < 2:
+        if i < len(tokens) and tokens[i][0] == CURRENCY:
+            i += 1
+        
+        if i >= len(tokens) or tokens[i][0] != NUMBER:
+            return None, i
+        
+        amounts.append(tokens[i][1])
+        i += 1
+    
+    item = {
+        "description": " ".join(token[2] for token in tokens[description_start:description_end]),
+        "quantity": quantity,
+        "rate": amounts[0],
+        "amount": amounts[1]
+    }
+    
+    if uom:
+        item["uom"] = uom
+    
+    return item, i
+
+@lru_cache(maxsize=65536)
+def classify_token(token: str) -> Tuple[Tuple[str, Any, str], ...]:
+    """
+    Split a whitespace-free token into (kind, value, text) tokens
+    
+    Handles OCR gluing a unit to its quantity ("4Lt") and a currency symbol to
+    its amount ("Rs.90.50", "₹1,680.00"). Memoized, since descriptions, units
+    and common amounts repeat across rows and documents.
+    """
+    first = token[0]
+    
+    if first.isdigit():
+        number = parse_number(token)
+        if number is not None:
+            return ((NUMBER, number, token),)
+        
+        match = QUANTITY_UOM_PATTERN.fullmatch(token)
+        if match and match.group(2).lower() in UOMS:
+            return (
+                (NUMBER, float(match.group(1)), match.group(1)),
+                (UOM, UOMS[match.group(2).lower()], match.group(2))
+            )
+        
+        return ((OTHER, token, token),)
+    
+    if first in CURRENCY_INITIALS:
+        for symbol in CURRENCY_SYMBOLS:
+            if token.startswith(symbol):
+                rest = token[len(symbol):]
+                if not rest:
+                    return ((CURRENCY, symbol, token),)
+                
+                number = parse_number(rest)
+                if number is not None:
+                    return ((CURRENCY, symbol, symbol), (NUMBER, number, rest))
+                
+                break
+    
+    if token.lower() in UOMS:
+        return ((UOM, UOMS[token.lower()], token),)
+    
+    if WORD_PATTERN.fullmatch(token):
+        return ((WORD, token, token),)
+    
+    return ((OTHER, token, token),)
+
+def parse_number(token: str) -> Optional[float]:
+    """Parse 90, 90.50 or 1,680.00; None if the token is not a number"""
+    if not NUMBER_PATTERN.fullmatch(token):
+        return None
+    
+    return float(token.replace(",", ""))
@@ -0,0 +1,259 @@
+import frappe
+from frappe.utils import add_days, add_to_date, now_datetime
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from redis import Redis
+from typing import Dict, List, Any, Optional, Tuple
+
+# Histogram upper bounds; a value above the last one lands in +Inf
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MEMORY_BUCKETS_MB = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Metric name, help text and buckets of each histogram kept per stage
+HISTOGRAMS = {
+    "duration": (
+        "fuzzy_waffle_ocr_stage_duration_seconds",
+        "Time spent in an OCR pipeline stage per document",
+        DURATION_BUCKETS
+    ),
+    "memory": (
+        "fuzzy_waffle_ocr_stage_memory_growth_megabytes",
+        "Resident memory growth of the worker during an OCR pipeline stage",
+        MEMORY_BUCKETS_MB
+    )
+}
+
+# Cumulative per-stage histograms for Prometheus, and per-stage and supplier histograms
+# since the last stats rollup. Suppliers are unbounded, so they never reach the
+# exported histograms; the window is emptied by every hourly rollup.
+METRICS_KEY = "fuzzy_waffle_ocr:pipeline_metrics:stages"
+WINDOW_KEY = "fuzzy_waffle_ocr:pipeline_metrics:window"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# OCR Pipeline Stats rows older than this are deleted on rollup
+STATS_RETENTION_DAYS = 30
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+class PipelineMetrics:
+    """
+    Stage timings and memory growth of the document being processed
+    
+    Stages: ocr (whole extract_document, cache hits included), text_layer,
+    rasterize, preprocess, tesseract, extraction, learning and db_insert.
+    
+    Stages are accumulated in memory and flush() writes them to the Redis
+    histograms in one pipelined round trip per document, so collection costs a
+    few microseconds per stage. Disabled (the default unless OCR Settings'
+    debug mode is on) every call is a no-op.
+    """
+    
+    def __init__(self, enabled: bool = False):
+        self.enabled = bool(enabled)
+        self.stages = {}
+        
+        # Tesseract configs run in threads and record concurrently
+        self.lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time the block as a pipeline stage; repeated stages of a document add up"""
+        if not self.enabled:
+            yield
+            return
+        
+        rss = get_rss_bytes()
+        started = time.perf_counter()
+        
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, get_rss_bytes() - rss)
+    
+    def add(self, name: str, seconds: float, rss_growth: int = 0):
+        with self.lock:
+            totals = self.stages.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] = max(totals[1], rss_growth)
+    
+    def merge(self, stages: Optional[Dict[str, List]]):
+        """Add stages recorded by another process, e.g. a page pool worker"""
+        for name, (seconds, rss_growth) in (stages or {}).items():
+            self.add(name, seconds, rss_growth)
+    
+    def flush(self, supplier: Optional[str] = None):
+        """Record the accumulated stages as one document and start over"""
+        if not self.enabled or not self.stages:
+            return
+        
+        with self.lock:
+            stages, self.stages = self.stages, {}
+        
+        try:
+            record_stages(stages, supplier)
+        except Exception as e:
+            # Metrics must never fail an upload
+            frappe.logger("fuzzy_waffle_ocr").warning(f"Could not record OCR pipeline metrics: {e}")
+
+def get_rss_bytes() -> int:
+    """Resident memory of this process; 0 where /proc is not available"""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def format_bound(bound) -> str:
+    return "%g" % bound
+
+def record_stages(stages: Dict[str, List], supplier: Optional[str] = None):
+    """Add one document's stages to the cumulative and rollup window histograms"""
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    
+    for key, label in ((METRICS_KEY, None), (WINDOW_KEY, supplier or "")):
+        name = cache.make_key(key)
+        
+        for stage, (seconds, rss_growth) in stages.items():
+            observations = (("duration", seconds), ("memory", max(rss_growth, 0) / (1024 * 1024)))
+            
+            for histogram, value in observations:
+                buckets = HISTOGRAMS[histogram][2]
+                index = bisect_left(buckets, value)
+                bound = format_bound(buckets[index]) if index < len(buckets) else "+Inf"
+                
+                # Buckets are stored non-cumulative; export adds them up
+                pipe.hincrby(name, histogram_field(histogram, stage, bound, label), 1)
+                pipe.hincrby(name, histogram_field(histogram, stage, "count", label), 1)
+                pipe.hincrbyfloat(name, histogram_field(histogram, stage, "sum", label), value)
+    
+    pipe.execute()
+
+def histogram_field(histogram: str, stage: str, bound: str, supplier: Optional[str] = None) -> str:
+    if supplier is None:
+        return f"{histogram}|{stage}|{bound}"
+    
+    # Supplier goes last: it is the only part that may contain the separator
+    return f"{histogram}|{stage}|{bound}|{supplier}"
+
+def get_histograms(key: str = METRICS_KEY) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    """Read histograms keyed by (histogram, stage, supplier); supplier is empty in the cumulative histograms"""
+    cache = frappe.cache()
+    histograms = {}
+    
+    # Counters are plain Redis numbers: RedisWrapper.hgetall would prefix the key again and unpickle them
+    for field, value in (Redis.hgetall(cache, cache.make_key(key)) or {}).items():
+        histogram, stage, bound, *supplier = frappe.safe_decode(field).split("|", 3)
+        supplier = supplier[0] if supplier else ""
+        
+        data = histograms.setdefault((histogram, stage, supplier), {"buckets": {}, "sum": 0.0, "count": 0})
+        
+        if bound == "sum":
+            data["sum"] = float(value)
+        elif bound == "count":
+            data["count"] = int(value)
+        else:
+            data["buckets"][bound] = int(value)
+    
+    return histograms
+
+def render_prometheus() -> str:
+    """Cumulative stage histograms of this site in Prometheus text exposition format"""
+    histograms = get_histograms()
+    site = escape_label(frappe.local.site or "")
+    lines = []
+    
+    for histogram, (metric, help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        
+        for (name, stage, _supplier), data in sorted(histograms.items()):
+            if name != histogram:
+                continue
+            
+            labels = f'site="{site}",stage="{escape_label(stage)}"'
+            cumulative = 0
+            
+            for bound in [format_bound(bound) for bound in buckets] + ["+Inf"]:
+                cumulative += data["buckets"].get(bound, 0)
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            
+            lines.append(f"{metric}_sum{{{labels}}} {data['sum']:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {data['count']}")
+    
+    return "\n".join(lines) + "\n"
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def estimate_quantile(data: Dict[str, Any], buckets: Tuple, quantile: float) -> float:
+    """Estimate a quantile from histogram buckets by interpolating inside the bucket it falls in"""
+    if not data["count"]:
+        return 0.0
+    
+    rank = quantile * data["count"]
+    cumulative = 0
+    lower = 0.0
+    
+    for bound in buckets:
+        count = data["buckets"].get(format_bound(bound), 0)
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        
+        cumulative += count
+        lower = bound
+    
+    # Falls in +Inf: the last finite bound is the best known lower estimate
+    return float(buckets[-1])
+
+def rollup_pipeline_stats():
+    """
+    Hourly: store the stage histograms since the last run as OCR Pipeline Stats rows
+    
+    One row per stage and supplier with document count, average, p50 and p95
+    time and average memory growth. Rows older than STATS_RETENTION_DAYS are
+    deleted, so the doctype holds a rolling window.
+    """
+    cache = frappe.cache()
+    window = cache.make_key(WINDOW_KEY)
+    rollup_key = WINDOW_KEY + ":rollup"
+    
+    # Renaming is atomic: documents finishing meanwhile start the next window
+    if Redis.exists(cache, window):
+        cache.rename(window, cache.make_key(rollup_key))
+        histograms = get_histograms(rollup_key)
+        cache.delete(cache.make_key(rollup_key))
+    else:
+        histograms = {}
+    
+    period_end = now_datetime()
+    period_start = frappe.db.get_value(
+        "OCR Pipeline Stats", {}, "period_end", order_by="period_end desc"
+    ) or add_to_date(period_end, hours=-1)
+    
+    for (histogram, stage, supplier), data in histograms.items():
+        if histogram != "duration" or not data["count"]:
+            continue
+        
+        memory = histograms.get(("memory", stage, supplier), {"sum": 0.0, "count": 0})
+        
+        frappe.get_doc({
+            "doctype": "OCR Pipeline Stats",
+            "period_start": period_start,
+            "period_end": period_end,
+            "stage": stage,
+            "supplier": supplier or None,
+            "documents": data["count"],
+            "total_seconds": data["sum"],
+            "avg_seconds": data["sum"] / data["count"],
+            "p50_seconds": estimate_quantile(data, DURATION_BUCKETS, 0.5),
+            "p95_seconds": estimate_quantile(data, DURATION_BUCKETS, 0.95),
+            "avg_memory_growth_mb": memory["sum"] / memory["count"] if memory["count"] else 0
+        }).insert(ignore_permissions=True, ignore_links=True)
+    
+    frappe.db.delete("OCR Pipeline Stats", {"period_end": ("<", add_days(period_end, -STATS_RETENTION_DAYS))})
+    frappe.db.commit()
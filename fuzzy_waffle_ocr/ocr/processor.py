@@ -1,77 +1,592 @@
+from __future__ import annotations
+
 import frappe
-import pytesseract
-from PIL import Image
-import cv2
-import numpy as np
-import re
+from frappe.utils import cint, flt
 import json
-from typing import Dict, List, Any, Optional
-from pdf2image import convert_from_path
-import tempfile
 import os
+import time
+import atexit
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Iterator, Union, Callable
+from fuzzy_waffle_ocr.ocr.engine import get_engine, get_tesseract_version
+from fuzzy_waffle_ocr.ocr.metrics import PipelineMetrics
+
+# cv2, numpy and pdf2image are imported where pages are processed, so importing
+# this module (e.g. from bench commands or web requests) stays cheap
+if TYPE_CHECKING:
+    import numpy as np
+
+# Process pool shared by all OCRProcessor instances in this worker
+_page_pool = None
+_page_pool_size = 0
+
+# Thread pool for running Tesseract configs on the same page concurrently
+_config_executor = None
 
 class OCRProcessor:
-    def __init__(self):
-        self.settings = self.get_ocr_settings()
+    # Rasterization resolution for PDF pages
+    PDF_DPI = 300
+    
+    # Number of PDF pages rasterized per pdf2image call. Peak memory of the
+    # page pipeline is bounded by this window, not by the page count.
+    PAGE_WINDOW_SIZE = 2
+    
+    # Tesseract config for the standard single pass
+    TESSERACT_CONFIG = '--psm 6'
+    
+    # Bump whenever preprocess_image changes, so cached OCR results are not reused
+    PREPROCESS_VERSION = 1
+    
+    # Multiple OCR configurations for better handwriting recognition, most likely first
+    HANDWRITING_CONFIGS = [
+        '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,₹/-:() ',
+        '--psm 4 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,₹/-:() ',
+        '--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,₹/-:() ',
+        '--psm 13'  # Raw line. Treat the image as a single text line
+    ]
+    
+    # Handwriting configs running at once; later configs only start while no result is good enough
+    HANDWRITING_CONCURRENCY = 2
+    
+    # Cascade stages, cheapest first. A stage only runs for pages whose previous
+    # result fell below the confidence threshold or missed key invoice fields.
+    CASCADE_STAGES = {
+        "fast": {"scale": 0.5, "preprocessing": "basic", "configs": [TESSERACT_CONFIG]},
+        "standard": {"scale": 1.0, "preprocessing": "enhanced", "configs": [TESSERACT_CONFIG]},
+        "handwriting": {"scale": 1.0, "preprocessing": "aggressive", "configs": HANDWRITING_CONFIGS}
+    }
+    
+    # Order in which a page's final source is reported, least to most effort
+    STAGE_ORDER = ["text_layer", "fast", "standard", "handwriting"]
+    
+    # Fields whose absence sends the page they are printed on to the next cascade stage
+    REQUIRED_FIELDS = ("invoice_number", "invoice_date", "total_amount")
+    
+    # Required fields printed at the head of the first page; the rest close the last page
+    HEADER_FIELDS = ("invoice_number", "invoice_date")
+    
+    # Most pages of one document that may go past the first cascade stage
+    MAX_ESCALATED_PAGES = 3
+    
+    def __init__(self, settings: Dict[str, Any] = None, progress_callback: Callable[[str, Dict[str, Any]], None] = None):
+        # Pool workers receive settings from the parent instead of reading the DB
+        self.settings = settings or self.get_ocr_settings()
+        
+        # Called with (event, data) as pages and cascade stages complete
+        self.progress_callback = progress_callback
         
+        self.page_timings = []
+        self.cache_hit = False
+        self.ocr_stage = None
+        
+        # Per-stage timings, collected only in debug mode
+        self.metrics = PipelineMetrics(enabled=cint(self.settings.get("debug_mode")))
+    
+    @property
+    def engine(self):
+        """Long-lived Tesseract instances, reused across requests in this worker and created on first use"""
+        return get_engine()
+    
     def get_ocr_settings(self) -> Dict[str, Any]:
-        """Get OCR settings from database or use defaults"""
+        """Get OCR settings from the settings cache or use defaults"""
+        from fuzzy_waffle_ocr.doctype.ocr_settings.ocr_settings import get_ocr_settings
+        
         try:
-            settings = frappe.get_single("OCR Settings")
+            settings = get_ocr_settings()
             return {
-                "engine": settings.ocr_engine or "tesseract",
+                "engine": settings.ocr_engine,
                 "confidence_threshold": settings.confidence_threshold or 60,
-                "auto_submit_threshold": settings.auto_submit_threshold or 95
+                "auto_submit_threshold": settings.auto_submit_threshold or 95,
+                "parallel_ocr_workers": settings.parallel_ocr_workers,
+                "image_preprocessing": settings.image_preprocessing,
+                "ocr_cache_size_mb": settings.ocr_cache_size_mb,
+                "use_pdf_text_layer": cint(settings.use_pdf_text_layer),
+                "ocr_cascade_enabled": cint(settings.ocr_cascade_enabled),
+                "handwriting_recognition": cint(settings.handwriting_recognition),
+                "debug_mode": cint(settings.debug_mode)
             }
         except:
             return {
                 "engine": "tesseract",
                 "confidence_threshold": 60,
-                "auto_submit_threshold": 95
+                "auto_submit_threshold": 95,
+                "parallel_ocr_workers": 0,
+                "image_preprocessing": "enhanced",
+                "ocr_cache_size_mb": 256,
+                "use_pdf_text_layer": 1,
+                "ocr_cascade_enabled": 0,
+                "handwriting_recognition": 1,
+                "debug_mode": 0
             }
     
     def extract_text_from_file(self, file_url: str) -> str:
         """Extract text from uploaded file (PDF or image)"""
+        return self.extract_document(file_url)["text"]
+    
+    def extract_document(self, file_url: str) -> Dict[str, Any]:
+        """
+        Extract raw text and word-level data from uploaded file (PDF or image)
+        
+        Results are cached by file content, so repeat uploads of the same bill
+        return without rasterizing or running Tesseract again.
+        """
+        from fuzzy_waffle_ocr.ocr.cache import OCRResultCache
+        
         file_path = frappe.get_site_path(file_url.lstrip('/'))
         
+        cache = OCRResultCache(self.settings.get("ocr_cache_size_mb"))
+        cache_key = None
+        
+        # Checked before any rasterization
+        if cache.enabled:
+            cache_key = cache.make_key(file_path, self.get_cache_params())
+            cached_result = cache.get(cache_key)
+            if cached_result:
+                self.cache_hit = True
+                self.ocr_stage = cached_result.get("ocr_stage")
+                return cached_result
+        
         if file_path.lower().endswith('.pdf'):
-            return self.extract_text_from_pdf(file_path)
+            pages = self.extract_pages_from_pdf(file_path)
+            text = "".join(page["text"] + "\n" for page in pages)
         else:
-            return self.extract_text_from_image(file_path)
+            pages = self.extract_pages_from_image(file_path)
+            text = pages[0]["text"]
+        
+        # The most expensive stage any page needed is the stage that produced the final result
+        self.ocr_stage = max(
+            (page.get("stage", "standard") for page in pages),
+            key=self.STAGE_ORDER.index,
+            default=None
+        )
+        
+        result = {
+            "text": text,
+            "ocr_stage": self.ocr_stage,
+            "pages": [
+                {
+                    "page": page["page"],
+                    "text": page["text"],
+                    "words": page["words"],
+                    "source": page.get("source", "ocr"),
+                    "stage": page.get("stage", "standard")
+                }
+                for page in pages
+            ]
+        }
+        
+        if cache_key:
+            cache.set(cache_key, result)
+        
+        return result
+    
+    def get_cache_params(self) -> Dict[str, Any]:
+        """
+        Parameters that change OCR output and so belong in the result cache key
+        
+        Preprocessing modes are fixed per cascade stage, so the stages and
+        PREPROCESS_VERSION cover them. The Tesseract version is read once per
+        process, so a cache hit never starts Tesseract.
+        """
+        return {
+            "dpi": self.PDF_DPI,
+            "preprocess_version": self.PREPROCESS_VERSION,
+            "tesseract_config": self.TESSERACT_CONFIG,
+            "use_pdf_text_layer": cint(self.settings.get("use_pdf_text_layer")),
+            "cascade_stages": self.get_cascade_stages(),
+            "confidence_threshold": flt(self.settings.get("confidence_threshold")),
+            "tesseract_version": get_tesseract_version()
+        }
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF file"""
-        text = ""
+        """Extract text from PDF file, streaming pages through OCR"""
+        return "".join(page["text"] + "\n" for page in self.extract_pages_from_pdf(pdf_path))
+    
+    def extract_pages_from_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
+        """
+        Extract per-page text and word data from a PDF, in page order
+        
+        Pages with a usable embedded text layer (digitally generated invoices) are read
+        directly; only scanned or image-only pages are rasterized and OCR'd.
+        """
+        from pdf2image import pdfinfo_from_path
+        
+        page_count = pdfinfo_from_path(pdf_path)["Pages"]
+        started = time.perf_counter()
+        self.report_progress("document", pages=page_count)
+        
+        text_layer_pages = self.extract_text_layer_pages(pdf_path)
+        self.report_progress("text_layer", pages=sorted(text_layer_pages))
+        ocr_page_numbers = [page_no for page_no in range(1, page_count + 1) if page_no not in text_layer_pages]
+        
+        workers = min(cint(self.settings.get("parallel_ocr_workers")), len(ocr_page_numbers))
         
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path, dpi=300)
+        ocr_results = self.run_ocr_cascade(
+            ocr_page_numbers,
+            lambda page_numbers, stage: self.ocr_pdf_pages(pdf_path, page_numbers, stage),
+            known_pages=list(text_layer_pages.values())
+        )
+        
+        page_results = sorted(
+            list(text_layer_pages.values()) + [{**result, "source": "ocr"} for result in ocr_results],
+            key=lambda result: result["page"]
+        )
+        
+        self.page_timings = [
+            {
+                "page": result["page"],
+                "source": result["source"],
+                "stage": result["stage"],
+                "seconds": result["seconds"],
+                "pid": result["pid"]
+            }
+            for result in page_results
+        ]
+        self.log_page_timings(pdf_path, workers, time.perf_counter() - started)
+        
+        return page_results
+    
+    def extract_text_layer_pages(self, pdf_path: str) -> Dict[int, Dict[str, Any]]:
+        """Get pages whose embedded text layer is usable, keyed by page number"""
+        from fuzzy_waffle_ocr.ocr.text_layer import extract_text_layer, is_text_layer_usable
+        
+        if not cint(self.settings.get("use_pdf_text_layer")):
+            return {}
+        
+        started = time.perf_counter()
+        with self.metrics.stage("text_layer"):
+            text_layer = extract_text_layer(pdf_path, dpi=self.PDF_DPI)
+        
+        usable_pages = {
+            page_no: words for page_no, words in text_layer.items()
+            if is_text_layer_usable(words)
+        }
+        
+        # Reading the text layer is a single call for the whole file; spread its cost over the pages used
+        seconds = round((time.perf_counter() - started) / max(len(usable_pages), 1), 3)
+        
+        return {
+            page_no: {
+                "page": page_no,
+                "text": words_to_text(words),
+                "words": words,
+                "source": "text_layer",
+                "stage": "text_layer",
+                "seconds": seconds,
+                "pid": os.getpid()
+            }
+            for page_no, words in usable_pages.items()
+        }
+    
+    def extract_pages_from_image(self, image_path: str) -> List[Dict[str, Any]]:
+        """OCR a single image file through the cascade, reading it from disk once"""
+        image = self.load_image(image_path)
+        self.report_progress("document", pages=1)
+        
+        def ocr_image(page_numbers: List[int], stage: str) -> List[Dict[str, Any]]:
+            started = time.perf_counter()
+            page_result = self.ocr_page(image, stage)
+            self.report_progress("page", page=1, stage=stage)
             
-            for i, image in enumerate(images):
-                # Process each page
-                img_path = os.path.join(temp_dir, f"page_{i}.png")
-                image.save(img_path, 'PNG')
-                text += self.extract_text_from_image(img_path) + "\n"
+            return [{
+                "page": 1,
+                **page_result,
+                "seconds": round(time.perf_counter() - started, 3),
+                "pid": os.getpid()
+            }]
+        
+        return self.run_ocr_cascade([1], ocr_image)
+    
+    def report_progress(self, event: str, **data):
+        """Notify the progress callback, if any, of a pipeline event"""
+        if self.progress_callback:
+            self.progress_callback(event, data)
+    
+    def get_cascade_stages(self) -> List[str]:
+        """Stages an OCR page may go through, cheapest first"""
+        if not cint(self.settings.get("ocr_cascade_enabled")):
+            return ["standard"]
+        
+        stages = ["fast", "standard"]
+        if cint(self.settings.get("handwriting_recognition")):
+            stages.append("handwriting")
         
-        return text
+        return stages
     
-    def extract_text_from_image(self, image_path: str) -> str:
-        """Extract text from image using OCR"""
-        # Preprocess image
-        processed_image = self.preprocess_image(image_path)
+    def run_ocr_cascade(self, page_numbers: List[int], ocr_pages, known_pages: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Run pages through the cascade stages, escalating only while results are weak
+        
+        `ocr_pages(page_numbers, stage)` OCRs the given pages at a stage. Each page keeps
+        its most confident result and records the stage that produced it. `known_pages`
+        (e.g. text layer pages) count towards field coverage but are never re-OCR'd.
+        At most MAX_ESCALATED_PAGES pages are escalated, the most needed first.
+        """
+        stages = self.get_cascade_stages()
+        best_results = {}
+        page_seconds = {}
+        escalated = set()
+        pending = list(page_numbers)
+        
+        for stage in stages:
+            if not pending:
+                break
+            
+            self.report_progress("ocr_stage", stage=stage, pages=pending)
+            
+            for result in ocr_pages(pending, stage):
+                page_no = result["page"]
+                page_seconds[page_no] = page_seconds.get(page_no, 0) + result["seconds"]
+                
+                current = best_results.get(page_no)
+                if current is None or result["confidence"] > current["confidence"]:
+                    best_results[page_no] = {**result, "stage": stage}
+            
+            pending = []
+            for page_no in self.get_pages_to_escalate(best_results, known_pages or []):
+                # Pages already escalated keep going; new ones only while the document has room
+                if page_no in escalated or len(escalated) < self.MAX_ESCALATED_PAGES:
+                    escalated.add(page_no)
+                    pending.append(page_no)
+            pending.sort()
+        
+        for page_no, result in best_results.items():
+            result["seconds"] = round(page_seconds[page_no], 3)
+        
+        return [best_results[page_no] for page_no in sorted(best_results)]
+    
+    def get_pages_to_escalate(self, ocr_results: Dict[int, Dict[str, Any]], known_pages: List[Dict[str, Any]]) -> List[int]:
+        """
+        Pages that need the next cascade stage, most needed first
+        
+        A page goes on when its confidence is below the threshold. A missing
+        required field only sends on the page it is printed on, and only until
+        that page has had the full-resolution standard pass. A document that
+        simply lacks a field, like a receipt without an invoice number, so
+        costs at most one more pass of one page.
+        """
+        all_pages = sorted(list(ocr_results.values()) + known_pages, key=lambda page: page["page"])
+        text = "\n".join(page["text"] for page in all_pages)
+        threshold = flt(self.settings.get("confidence_threshold"))
+        
+        field_pages = set()
+        for field in self.get_missing_fields(text, all_pages):
+            page_no = all_pages[0]["page"] if field in self.HEADER_FIELDS else all_pages[-1]["page"]
+            result = ocr_results.get(page_no)
+            if result and self.STAGE_ORDER.index(result["stage"]) < self.STAGE_ORDER.index("standard"):
+                field_pages.add(page_no)
+        
+        low_confidence = sorted(
+            (page_no for page_no, result in ocr_results.items()
+             if result["confidence"] < threshold and page_no not in field_pages),
+            key=lambda page_no: ocr_results[page_no]["confidence"]
+        )
         
-        # Extract text using Tesseract
-        text = pytesseract.image_to_string(processed_image, config='--psm 6')
+        return sorted(field_pages) + low_confidence
+    
+    def get_missing_fields(self, text: str, pages: List[Dict[str, Any]] = None) -> List[str]:
+        """Required fields found neither in the text nor, for the total, in the page layout"""
+        from fuzzy_waffle_ocr.ocr.extraction import get_field_extractor
+        from fuzzy_waffle_ocr.ocr.layout import extract_layout_fields
+        
+        fields = get_field_extractor().extract(text, fields=self.REQUIRED_FIELDS)
+        
+        # A total the text patterns missed may still sit next to its label in the layout
+        if fields["total_amount"] is None and pages:
+            fields["total_amount"] = extract_layout_fields(pages).get("total_amount")
+        
+        return [field for field in self.REQUIRED_FIELDS if fields[field] is None]
+    
+    def ocr_pdf_pages(self, pdf_path: str, page_numbers: List[int], stage: str = "standard") -> List[Dict[str, Any]]:
+        """OCR the given PDF pages at a cascade stage, in parallel when configured"""
+        workers = min(cint(self.settings.get("parallel_ocr_workers")), len(page_numbers))
+        
+        # Single-page runs and single-worker setups stay in this process
+        if workers > 1:
+            return self.ocr_pdf_pages_parallel(pdf_path, page_numbers, workers, stage)
+        
+        return self.ocr_pdf_pages_serial(pdf_path, page_numbers, stage)
+    
+    def ocr_pdf_pages_serial(self, pdf_path: str, page_numbers: List[int], stage: str = "standard") -> List[Dict[str, Any]]:
+        """OCR PDF pages one after another in this process"""
+        page_results = []
+        started = time.perf_counter()
+        
+        for page_no, page_image in self.iter_pdf_page_numbers(pdf_path, page_numbers):
+            page_result = self.ocr_page(page_image, stage)
+            
+            # Page time includes its share of the window rasterization
+            finished = time.perf_counter()
+            page_results.append({
+                "page": page_no,
+                **page_result,
+                "seconds": round(finished - started, 3),
+                "pid": os.getpid()
+            })
+            started = finished
+            self.report_progress("page", page=page_no, stage=stage)
+        
+        return page_results
+    
+    def ocr_pdf_pages_parallel(self, pdf_path: str, page_numbers: List[int], workers: int,
+                               stage: str = "standard") -> List[Dict[str, Any]]:
+        """Fan PDF pages out to the process pool and reassemble them in page order"""
+        pool = get_page_pool(workers)
+        
+        # Each worker rasterizes its own page, so only the path crosses the process boundary
+        # map() yields results in submission order, i.e. page order
+        page_results = []
+        for page_result in pool.map(
+            ocr_pdf_page,
+            [pdf_path] * len(page_numbers),
+            page_numbers,
+            [self.settings] * len(page_numbers),
+            [stage] * len(page_numbers)
+        ):
+            self.metrics.merge(page_result.pop("stage_metrics", None))
+            page_results.append(page_result)
+            self.report_progress("page", page=page_result["page"], stage=stage)
+        
+        return page_results
+    
+    def log_page_timings(self, pdf_path: str, workers: int, wall_time: float):
+        """Log per-page OCR timings so serial and parallel runs can be compared"""
+        cpu_time = sum(timing["seconds"] for timing in self.page_timings)
+        
+        frappe.logger("fuzzy_waffle_ocr").info({
+            "event": "pdf_ocr_timings",
+            "file": os.path.basename(pdf_path),
+            "mode": "parallel" if workers > 1 else "serial",
+            "workers": max(workers, 1),
+            "pages": len(self.page_timings),
+            "ocr_stages": [timing["stage"] for timing in self.page_timings],
+            "text_layer_pages": sum(1 for timing in self.page_timings if timing["source"] == "text_layer"),
+            "ocr_pages": sum(1 for timing in self.page_timings if timing["source"] == "ocr"),
+            "wall_time": round(wall_time, 3),
+            "page_time_total": round(cpu_time, 3),
+            "speedup": round(cpu_time / wall_time, 2) if wall_time else None,
+            "page_timings": self.page_timings
+        })
+    
+    def iter_pdf_page_numbers(self, pdf_path: str, page_numbers: List[int]) -> Iterator[tuple]:
+        """Yield (page number, page array) for the given pages, rasterizing contiguous runs in windows"""
+        runs = []
+        for page_no in sorted(page_numbers):
+            if runs and page_no == runs[-1][1] + 1:
+                runs[-1][1] = page_no
+            else:
+                runs.append([page_no, page_no])
+        
+        for first_page, last_page in runs:
+            pages = self.iter_pdf_pages(pdf_path, first_page=first_page, last_page=last_page)
+            yield from zip(range(first_page, last_page + 1), pages)
+    
+    def iter_pdf_pages(self, pdf_path: str, dpi: int = None, window_size: int = None,
+                       first_page: int = 1, last_page: int = None) -> Iterator[np.ndarray]:
+        """
+        Yield PDF pages as grayscale arrays, in page order
+        
+        Pages are rasterized `window_size` at a time and handed over in memory,
+        so only one window of pages is held at once and nothing is written to disk.
+        """
+        import numpy as np
+        from pdf2image import convert_from_path, pdfinfo_from_path
         
-        return text
+        dpi = dpi or self.PDF_DPI
+        window_size = max(1, window_size or self.PAGE_WINDOW_SIZE)
+        
+        if last_page is None:
+            last_page = pdfinfo_from_path(pdf_path)["Pages"]
+        
+        for window_start in range(first_page, last_page + 1, window_size):
+            window_end = min(window_start + window_size - 1, last_page)
+            
+            with self.metrics.stage("rasterize"):
+                pages = convert_from_path(
+                    pdf_path,
+                    dpi=dpi,
+                    first_page=window_start,
+                    last_page=window_end,
+                    grayscale=True
+                )
+            
+            # Release each page as soon as it has been consumed
+            while pages:
+                page = pages.pop(0)
+                page_array = np.asarray(page)
+                page.close()
+                yield page_array
     
-    def preprocess_image(self, image_path: str) -> np.ndarray:
-        """Preprocess image for better OCR accuracy, optimized for handwritten bills"""
+    def extract_text_from_image(self, image: Union[str, np.ndarray]) -> str:
+        """Extract text from image path or in-memory image array using OCR"""
+        return self.ocr_page(image)["text"]
+    
+    def ocr_page(self, image: Union[str, np.ndarray], stage: str = "standard") -> Dict[str, Any]:
+        """
+        OCR a single page at a cascade stage, getting text and word-level data from one Tesseract pass
+        
+        Word boxes are always reported in full-resolution page coordinates.
+        """
+        import cv2
+        
+        stage_config = self.CASCADE_STAGES[stage]
+        img = self.load_image(image)
+        scale = stage_config["scale"]
+        
+        if scale != 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+        if len(stage_config["configs"]) > 1:
+            result = self.ocr_handwriting_page(img, stage_config["preprocessing"])
+        else:
+            # Preprocess image and extract words with positions and confidence using Tesseract
+            with self.metrics.stage("preprocess"):
+                processed_image = self.preprocess_image(img, stage_config["preprocessing"])
+            result = self.ocr_with_config(processed_image, stage_config["configs"][0])
+        
+        if scale != 1:
+            for key in ("left", "top", "width", "height"):
+                result["words"][key] = [int(value / scale) for value in result["words"][key]]
+        
+        return result
+    
+    def load_image(self, image: Union[str, np.ndarray]) -> np.ndarray:
+        """Return the image as an array, reading it from disk only when given a path"""
+        import cv2
+        import numpy as np
+        
+        if isinstance(image, np.ndarray):
+            return image
+        
+        img = cv2.imread(image)
+        if img is None:
+            raise ValueError(f"Unable to read image: {image}")
+        
+        return img
+    
+    def preprocess_image(self, image: Union[str, np.ndarray], mode: str = "enhanced") -> np.ndarray:
+        """
+        Preprocess image for better OCR accuracy, optimized for handwritten bills
+        
+        Modes: "basic" only binarizes (cheap, for clean prints), "enhanced" cleans up
+        and thickens strokes, "aggressive" additionally denoises before doing so.
+        """
+        import cv2
+        
         # Read image
-        img = cv2.imread(image_path)
+        img = self.load_image(image)
+        
+        # Convert to grayscale (rasterized PDF pages already are)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if mode == "basic":
+            # Global Otsu threshold
+            return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        
+        if mode == "aggressive":
+            # Remove paper texture and scanner noise that survive the blur
+            gray = cv2.fastNlMeansDenoising(gray, None, h=15, templateWindowSize=7, searchWindowSize=21)
         
         # Enhanced preprocessing for handwritten text
         # Apply Gaussian blur to reduce noise
@@ -97,203 +612,242 @@ class OCRProcessor:
         
         return dilated
     
-    def extract_text_with_handwriting_support(self, image_path: str) -> str:
+    def extract_text_with_handwriting_support(self, image: Union[str, np.ndarray]) -> str:
         """Extract text with enhanced handwriting recognition"""
+        return self.ocr_handwriting_page(image)["text"]
+    
+    def ocr_handwriting_page(self, image: Union[str, np.ndarray], preprocessing: str = "enhanced") -> Dict[str, Any]:
+        """
+        OCR a page with several handwriting configs, keeping the most confident result
+        
+        Each config runs exactly once and its text is rebuilt from the word data.
+        Configs start in priority order, HANDWRITING_CONCURRENCY at a time. Once
+        a result reaches the confidence threshold from OCR Settings no further
+        config starts; the configs already running finish and the most
+        confident result wins, the earlier config on a tie.
+        """
         # Preprocess image
-        processed_image = self.preprocess_image(image_path)
-        
-        # Try multiple OCR configurations for better handwriting recognition
-        ocr_configs = [
-            '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,₹/-:() ',
-            '--psm 4 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,₹/-:() ',
-            '--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,₹/-:() ',
-            '--psm 13'  # Raw line. Treat the image as a single text line
-        ]
+        with self.metrics.stage("preprocess"):
+            processed_image = self.preprocess_image(image, preprocessing)
+        threshold = flt(self.settings.get("confidence_threshold"))
+        
+        executor = get_config_executor()
+        configs = iter(enumerate(self.HANDWRITING_CONFIGS))
+        running = {}
+        results = []
+        good_enough = False
+        
+        while True:
+            while not good_enough and len(running) < self.HANDWRITING_CONCURRENCY:
+                priority, config = next(configs, (None, None))
+                if config is None:
+                    break
+                running[executor.submit(self.ocr_with_config, processed_image, config)] = priority
+            
+            if not running:
+                break
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                priority = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    continue
+                
+                results.append((result["confidence"], -priority, result))
+                good_enough = good_enough or bool(result["text"] and result["confidence"] >= threshold)
         
-        best_text = ""
-        highest_confidence = 0
+        best_result = max(results, key=lambda entry: entry[:2])[2] if results else None
         
-        for config in ocr_configs:
-            try:
-                # Get text with confidence
-                data = pytesseract.image_to_data(
-                    processed_image, 
-                    config=config, 
-                    output_type=pytesseract.Output.DICT
-                )
-                
-                # Calculate average confidence
-                confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-                avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-                
-                if avg_confidence > highest_confidence:
-                    highest_confidence = avg_confidence
-                    text = pytesseract.image_to_string(processed_image, config=config)
-                    if len(text.strip()) > len(best_text.strip()):
-                        best_text = text
-                        
-            except Exception as e:
-                continue
-        
-        return best_text if best_text else pytesseract.image_to_string(processed_image)
-    
-    def extract_invoice_data(self, ocr_text: str) -> Dict[str, Any]:
-        """Extract structured invoice data from OCR text"""
-        data = {
-            "invoice_number": self.extract_invoice_number(ocr_text),
-            "invoice_date": self.extract_date(ocr_text),
-            "total_amount": self.extract_total_amount(ocr_text),
-            "items": self.extract_line_items(ocr_text),
-            "payment_terms": self.extract_payment_terms(ocr_text),
-            "tax_info": self.extract_tax_info(ocr_text)
+        if not best_result or not best_result["text"]:
+            # Fall back to Tesseract's fully automatic page segmentation
+            best_result = self.ocr_with_config(processed_image, "")
+        
+        return best_result
+    
+    def ocr_with_config(self, processed_image: np.ndarray, config: str) -> Dict[str, Any]:
+        """Run one Tesseract pass, returning text, word data and mean word confidence"""
+        with self.metrics.stage("tesseract"):
+            words = compact_word_data(self.engine.image_to_data(processed_image, config))
+        
+        # Tesseract reports -1 for non-text boxes
+        confidences = [conf for conf in words["conf"] if conf > 0]
+        
+        return {
+            "text": words_to_text(words),
+            "words": words,
+            "confidence": sum(confidences) / len(confidences) if confidences else 0,
+            "config": config
         }
+    
+    def extract_invoice_data(self, ocr_text: str, pages: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Extract structured invoice data from OCR text in a single pass
+        
+        When the OCR'd pages (from extract_document) are passed, line items and the
+        total are read from the word-box layout, which keeps table columns that the
+        flattened text loses. Text patterns fill in whatever the layout misses.
+        """
+        from fuzzy_waffle_ocr.ocr.extraction import get_field_extractor
+        from fuzzy_waffle_ocr.ocr.layout import extract_layout_fields
+        
+        with self.metrics.stage("extraction"):
+            data = get_field_extractor().extract_invoice_data(ocr_text)
+            
+            if pages:
+                data.update(extract_layout_fields(pages))
         
         return data
     
+    def extract_field(self, field: str, text: str) -> Any:
+        """Extract a single registered field from text"""
+        from fuzzy_waffle_ocr.ocr.extraction import get_field_extractor
+        
+        return get_field_extractor().extract(text, fields=[field])[field]
+    
     def extract_invoice_number(self, text: str) -> Optional[str]:
         """Extract invoice number from text"""
-        patterns = [
-            r'Invoice\s*(?:No|Number|#)?\s*[:.]?\s*([A-Z0-9\-/]+)',
-            r'Bill\s*(?:No|Number)?\s*[:.]?\s*([A-Z0-9\-/]+)',
-            r'Inv\s*[:.]?\s*([A-Z0-9\-/]+)',
-            r'(?:Invoice|Bill|Inv)\s*([A-Z0-9\-/]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
-        
-        return None
+        return self.extract_field("invoice_number", text)
     
     def extract_date(self, text: str) -> Optional[str]:
         """Extract date from text"""
-        date_patterns = [
-            r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
-            r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4})',
-            r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})'
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                date_str = match.group(1)
-                # Convert to standard format
-                return self.standardize_date(date_str)
-        
-        return None
+        return self.extract_field("invoice_date", text)
     
     def standardize_date(self, date_str: str) -> str:
         """Convert date to YYYY-MM-DD format"""
-        from dateutil import parser
-        try:
-            parsed_date = parser.parse(date_str)
-            return parsed_date.strftime('%Y-%m-%d')
-        except:
-            return date_str
+        from fuzzy_waffle_ocr.ocr.extraction import standardize_date
+        
+        return standardize_date(date_str)
     
     def extract_total_amount(self, text: str) -> Optional[float]:
         """Extract total amount from text"""
-        patterns = [
-            r'Total\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)',
-            r'Grand\s*Total\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)',
-            r'Amount\s*Payable\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)',
-            r'Net\s*Amount\s*[:.]?\s*(?:₹|Rs\.?|INR)?\s*([0-9,]+\.?\d*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(',', '')
-                try:
-                    return float(amount_str)
-                except:
-                    continue
-        
-        return None
+        return self.extract_field("total_amount", text)
     
     def extract_line_items(self, text: str) -> List[Dict[str, Any]]:
         """Extract line items from invoice text"""
-        items = []
-        
-        # Pattern for line items (description, quantity, rate, amount)
-        item_pattern = r'([A-Za-z\s\-]+)\s+(\d+\.?\d*)\s*(?:Pcs|Kg|Lt|Nos|Box)?\s+(?:₹|Rs\.?)?\s*(\d+\.?\d*)\s+(?:₹|Rs\.?)?\s*(\d+\.?\d*)'
-        
-        matches = re.finditer(item_pattern, text)
-        
-        for match in matches:
-            item = {
-                "description": match.group(1).strip(),
-                "quantity": float(match.group(2)),
-                "rate": float(match.group(3)),
-                "amount": float(match.group(4))
-            }
-            
-            # Extract UOM if present
-            uom_match = re.search(r'(\d+\.?\d*)\s*(Pcs|Kg|Lt|Nos|Box|Unit)', match.group(0), re.IGNORECASE)
-            if uom_match:
-                item["uom"] = uom_match.group(2)
-            
-            items.append(item)
-        
-        return items
+        return self.extract_field("items", text)
     
     def extract_payment_terms(self, text: str) -> Optional[str]:
         """Extract payment terms from text"""
-        patterns = [
-            r'Payment\s*Terms?\s*[:.]?\s*([A-Za-z0-9\s]+)',
-            r'(?:Net|Credit)\s*(\d+\s*Days?)',
-            r'Due\s*(?:in|within)\s*(\d+\s*Days?)',
-            r'(Cash|COD|Credit)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-        
-        return None
+        return self.extract_field("payment_terms", text)
     
     def extract_tax_info(self, text: str) -> Dict[str, Any]:
         """Extract tax information from text"""
-        tax_info = {}
-        
-        # GST pattern
-        gst_pattern = r'GST[IN]*\s*[:.]?\s*([A-Z0-9]+)'
-        gst_match = re.search(gst_pattern, text, re.IGNORECASE)
-        if gst_match:
-            tax_info["gstin"] = gst_match.group(1)
-        
-        # Tax amounts
-        tax_patterns = {
-            "cgst": r'CGST\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)',
-            "sgst": r'SGST\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)',
-            "igst": r'IGST\s*(?:@\s*\d+%?)?\s*[:.]?\s*(?:₹|Rs\.?)?\s*([0-9,]+\.?\d*)'
-        }
+        from fuzzy_waffle_ocr.ocr.extraction import get_field_extractor
         
-        for tax_type, pattern in tax_patterns.items():
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(',', '')
-                try:
-                    tax_info[tax_type] = float(amount_str)
-                except:
-                    pass
+        extractor = get_field_extractor()
+        fields = extractor.registry.get_group_fields("tax_info")
         
-        return tax_info
+        return extractor.extract_invoice_data(text, fields).get("tax_info", {})
+
+# Word-level columns kept from Tesseract's image_to_data output
+WORD_DATA_KEYS = ("text", "conf", "left", "top", "width", "height", "block_num", "par_num", "line_num")
+
+def compact_word_data(data: Dict[str, List]) -> Dict[str, List]:
+    """Keep only recognized words from image_to_data output, as parallel lists"""
+    words = {key: [] for key in WORD_DATA_KEYS}
+    
+    for i, word in enumerate(data["text"]):
+        if not word or not word.strip():
+            continue
+        
+        for key in WORD_DATA_KEYS:
+            value = data[key][i]
+            words[key].append(value if key == "text" else int(float(value)))
+    
+    return words
+
+def words_to_text(words: Dict[str, List]) -> str:
+    """Rebuild page text from word data: one line per Tesseract line, blank line between paragraphs"""
+    lines = []
+    current_line = None
+    current_paragraph = None
+    
+    for i, word in enumerate(words["text"]):
+        paragraph = (words["block_num"][i], words["par_num"][i])
+        line = paragraph + (words["line_num"][i],)
+        
+        if line != current_line:
+            if current_paragraph is not None and paragraph != current_paragraph:
+                lines.append("")
+            lines.append(word)
+            current_line = line
+            current_paragraph = paragraph
+        else:
+            lines[-1] += " " + word
+    
+    return "\n".join(lines)
+
+def get_page_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared page OCR pool, resizing it when the configured size changes"""
+    global _page_pool, _page_pool_size
+    
+    if _page_pool is None or _page_pool_size != workers:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False)
+        
+        # Spawned workers do not inherit the parent's DB connection or locks
+        _page_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        _page_pool_size = workers
+    
+    return _page_pool
+
+def get_config_executor() -> ThreadPoolExecutor:
+    """Return the shared thread pool used to run OCR configs concurrently"""
+    global _config_executor
+    
+    if _config_executor is None:
+        # Tesseract releases the GIL while recognizing, so threads run configs in parallel
+        _config_executor = ThreadPoolExecutor(
+            max_workers=OCRProcessor.HANDWRITING_CONCURRENCY,
+            thread_name_prefix="ocr-config"
+        )
+    
+    return _config_executor
+
+@atexit.register
+def shutdown_page_pool():
+    """Stop pool workers when the parent process exits"""
+    global _page_pool
+    
+    if _page_pool is not None:
+        _page_pool.shutdown(wait=False, cancel_futures=True)
+        _page_pool = None
+
+def ocr_pdf_page(pdf_path: str, page_no: int, settings: Dict[str, Any], stage: str = "standard") -> Dict[str, Any]:
+    """OCR a single PDF page inside a pool worker"""
+    started = time.perf_counter()
+    
+    processor = OCRProcessor(settings=settings)
+    page_image = next(processor.iter_pdf_pages(pdf_path, first_page=page_no, last_page=page_no))
+    page_result = processor.ocr_page(page_image, stage)
+    
+    return {
+        "page": page_no,
+        **page_result,
+        "seconds": round(time.perf_counter() - started, 3),
+        "pid": os.getpid(),
+        "stage_metrics": processor.metrics.stages
+    }
 
 @frappe.whitelist()
 def test_ocr_extraction(file_url: str) -> Dict[str, Any]:
     """Test OCR extraction on a file"""
     processor = OCRProcessor()
     
-    # Extract text
-    ocr_text = processor.extract_text_from_file(file_url)
+    # Extract text and word boxes
+    document = processor.extract_document(file_url)
+    ocr_text = document["text"]
     
     # Extract structured data
-    invoice_data = processor.extract_invoice_data(ocr_text)
+    invoice_data = processor.extract_invoice_data(ocr_text, document["pages"])
     
     return {
         "raw_text": ocr_text[:500],  # First 500 chars for preview
-        "extracted_data": invoice_data
+        "extracted_data": invoice_data,
+        "page_timings": processor.page_timings
     }
\ No newline at end of file
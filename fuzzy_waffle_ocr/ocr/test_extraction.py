@@ -0,0 +1,54 @@
+import unittest
+
+from fuzzy_waffle_ocr.ocr.extraction import FieldExtractor, FieldPatternRegistry
+
+def make_extractor(*patterns):
+    """Extractor over a registry of (field, pattern, options) tuples"""
+    registry = FieldPatternRegistry()
+    
+    for field, pattern, options in patterns:
+        registry.register(field, pattern, **options)
+    
+    return FieldExtractor(registry)
+
+class TestFieldExtractor(unittest.TestCase):
+    def test_multi_hint_multi_value_rule_matches_once_per_line(self):
+        extractor = make_extractor(("codes", r'(HSN\d+)', {"hints": ("hsn", "code"), "multi": True}))
+        
+        self.assertEqual(extractor.extract("hsn code HSN123"), {"codes": ["HSN123"]})
+        self.assertEqual(extractor.extract("hsn code HSN123 HSN456\ncode HSN789"), {"codes": ["HSN123", "HSN456", "HSN789"]})
+    
+    def test_multi_hint_rule_is_tried_once_per_line(self):
+        calls = []
+        
+        def parse(match):
+            calls.append(match.group(1))
+            return match.group(1)
+        
+        extractor = make_extractor(
+            ("terms", r'(?:Net|Credit)\s*(\d+\s*Days)', {"hints": ("net", "credit"), "parse": parse})
+        )
+        
+        self.assertEqual(extractor.extract("Net Credit 30 Days"), {"terms": "30 Days"})
+        self.assertEqual(calls, ["30 Days"])
+    
+    def test_highest_priority_match_wins_across_lines(self):
+        extractor = make_extractor(
+            ("invoice_number", r'Invoice\s*No\.?\s*[:.]?\s*(\w+)', {"hints": ("invoice",)}),
+            ("invoice_number", r'Bill\s*No\.?\s*[:.]?\s*(\w+)', {"hints": ("bill",)})
+        )
+        
+        self.assertEqual(extractor.extract("Bill No: B-1\nInvoice No: INV7"), {"invoice_number": "INV7"})
+        self.assertEqual(extractor.extract("Bill No: B1"), {"invoice_number": "B1"})
+        self.assertEqual(extractor.extract("Receipt"), {"invoice_number": None})
+    
+    def test_matches_do_not_span_lines(self):
+        extractor = make_extractor(("total", r'Total\s*[:.]?\s*(\d+)', {"hints": ("total",)}))
+        
+        self.assertEqual(extractor.extract("Total\n500"), {"total": None})
+        self.assertEqual(extractor.extract("Total: 500"), {"total": "500"})
+    
+    def test_unhinted_multi_value_rule_sees_every_line(self):
+        extractor = make_extractor(("codes", r'(HSN\d+)', {"multi": True}))
+        
+        self.assertEqual(extractor.extract("HSN1\nnothing\nHSN2 HSN3"), {"codes": ["HSN1", "HSN2", "HSN3"]})
@@ -0,0 +1,122 @@
+import time
+import unittest
+
+from fuzzy_waffle_ocr.ocr.benchmark import generate_adversarial_inputs
+from fuzzy_waffle_ocr.ocr.line_items import classify_token, parse_line_items, parse_line_items_from_words
+
+def make_words(lines):
+    """Word-level OCR data for lines of words, one Tesseract line per entry"""
+    words = {"text": [], "block_num": [], "par_num": [], "line_num": []}
+    
+    for line_num, line in enumerate(lines, start=1):
+        for text in line:
+            words["text"].append(text)
+            words["block_num"].append(1)
+            words["par_num"].append(1)
+            words["line_num"].append(line_num)
+    
+    return words
+
+class TestLineItemParser(unittest.TestCase):
+    def test_parses_row(self):
+        self.assertEqual(parse_line_items("Diesel   50 Lt   90.50   4525.00"), [
+            {"description": "Diesel", "quantity": 50.0, "rate": 90.5, "amount": 4525.0, "uom": "Lt"}
+        ])
+    
+    def test_header_line_is_not_part_of_description(self):
+        items = parse_line_items("Description  Qty  Rate  Amount\nEngine Oil  4 Lt  420.00  1680.00")
+        
+        self.assertEqual([item["description"] for item in items], ["Engine Oil"])
+    
+    def test_rows_do_not_span_line_breaks(self):
+        self.assertEqual(parse_line_items("Diesel\n50 Lt 90.50 4525.00"), [])
+        self.assertEqual(parse_line_items("Diesel 50 Lt\n90.50 4525.00"), [])
+    
+    def test_several_items_on_one_row(self):
+        items = parse_line_items("Diesel 50 Lt 90.50 4525.00 Grease 2 Kg 180.00 360.00")
+        
+        self.assertEqual([item["description"] for item in items], ["Diesel", "Grease"])
+        self.assertEqual([item["amount"] for item in items], [4525.0, 360.0])
+    
+    def test_rows_from_word_layout(self):
+        words = make_words([
+            ["Description", "Qty", "Rate", "Amount"],
+            ["Coolant", "5", "Lt", "150.00", "750.00"],
+            ["Grease", "2", "Kg"],
+            ["180.00", "360.00"]
+        ])
+        
+        # The grease row lost its amounts to the next OCR line, so it is not an item
+        self.assertEqual(parse_line_items_from_words(words), [
+            {"description": "Coolant", "quantity": 5.0, "rate": 150.0, "amount": 750.0, "uom": "Lt"}
+        ])
+    
+    def test_uom_and_currency_glued_to_numbers(self):
+        self.assertEqual(parse_line_items("Engine Oil 4Lt Rs.420.00 ₹1,680.00"), [
+            {"description": "Engine Oil", "quantity": 4.0, "rate": 420.0, "amount": 1680.0, "uom": "Lt"}
+        ])
+    
+    def test_separate_currency_symbols_and_no_uom(self):
+        self.assertEqual(parse_line_items("Nut 10 Rs. 2.00 Rs. 20.00"), [
+            {"description": "Nut", "quantity": 10.0, "rate": 2.0, "amount": 20.0}
+        ])
+    
+    def test_missing_amount_column(self):
+        self.assertEqual(parse_line_items("Coolant 5 Lt 150.00"), [])
+    
+    def test_malformed_tokens_break_the_row(self):
+        for text in (
+            "Bolt 4xyz 10.00 40.00",  # Unknown unit glued to the quantity
+            "Nut 1,68,0.00 2 3",  # Misplaced thousands separators
+            "Washer 10 Lt 2.00 Rs",  # Currency symbol without an amount
+            "Rs. Rs. 12",
+            "₹|═░▓ .,:;/\\ 0123abc"
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(parse_line_items(text), [])
+    
+    def test_empty_text(self):
+        self.assertEqual(parse_line_items(""), [])
+        self.assertEqual(parse_line_items("\n\n   \n"), [])
+
+class TestLineItemParserStress(unittest.TestCase):
+    LINES = 10000
+    MAX_SECONDS = 2.0
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.inputs = generate_adversarial_inputs(cls.LINES)
+        cls.half_inputs = generate_adversarial_inputs(cls.LINES // 2)
+    
+    def test_adversarial_inputs_parse_in_linear_time(self):
+        for name, text in self.inputs.items():
+            with self.subTest(input=name):
+                seconds = time_parse(text)
+                half_seconds = time_parse(self.half_inputs[name])
+                
+                self.assertLess(seconds, self.MAX_SECONDS)
+                
+                # Doubling the input may at most triple the time, allowing for timer noise
+                if half_seconds > 0.01:
+                    self.assertLess(seconds / half_seconds, 3)
+    
+    def test_adversarial_inputs_hold_no_items(self):
+        for name, text in self.inputs.items():
+            if name != "valid_rows":
+                with self.subTest(input=name):
+                    self.assertEqual(parse_line_items(text), [])
+    
+    def test_every_valid_row_is_found(self):
+        self.assertEqual(len(parse_line_items(self.inputs["valid_rows"])), self.LINES)
+
+def time_parse(text: str, runs: int = 5) -> float:
+    """Best of several cold runs: token classifications memoized by an earlier run would hide the real cost"""
+    timings = []
+    
+    for _ in range(runs):
+        classify_token.cache_clear()
+        started = time.perf_counter()
+        parse_line_items(text)
+        timings.append(time.perf_counter() - started)
+    
+    return min(timings)
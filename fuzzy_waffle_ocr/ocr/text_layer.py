@@ -0,0 +1,87 @@
+import frappe
+import subprocess
+import xml.etree.ElementTree as ET
+from typing import Dict, List
+
+# Below this many words a page is treated as scanned / image-only
+MIN_TEXT_LAYER_WORDS = 5
+
+# Share of words that must contain a letter or digit; garbled font encodings fail this
+MIN_READABLE_WORD_RATIO = 0.6
+
+# PDF coordinates are in points (1/72 inch)
+PDF_POINTS_PER_INCH = 72
+
+def extract_text_layer(pdf_path: str, dpi: int = 300, timeout: int = 60) -> Dict[int, Dict[str, List]]:
+    """
+    Extract embedded text with word positions from every page of a PDF
+    
+    Uses poppler's pdftotext, which is already required by pdf2image. Returns
+    word data per page number in the same shape as OCR word data, with boxes
+    scaled to `dpi` so they line up with rasterized pages. Returns an empty
+    dict when the text layer cannot be read, so callers fall back to OCR.
+    """
+    try:
+        output = subprocess.run(
+            ["pdftotext", "-bbox-layout", "-enc", "UTF-8", pdf_path, "-"],
+            capture_output=True,
+            timeout=timeout,
+            check=True
+        ).stdout
+        root = ET.fromstring(output)
+    except (OSError, subprocess.SubprocessError, ET.ParseError) as e:
+        frappe.logger("fuzzy_waffle_ocr").warning(f"PDF text layer unavailable for {pdf_path}: {e}")
+        return {}
+    
+    scale = dpi / PDF_POINTS_PER_INCH
+    pages = {}
+    
+    for page_no, page in enumerate(iter_elements(root, "page"), start=1):
+        words = {key: [] for key in (
+            "text", "conf", "left", "top", "width", "height",
+            "block_num", "par_num", "line_num"
+        )}
+        
+        for block_num, block in enumerate(iter_elements(page, "block"), start=1):
+            for line_num, line in enumerate(iter_elements(block, "line"), start=1):
+                for word in iter_elements(line, "word"):
+                    text = (word.text or "").strip()
+                    if not text:
+                        continue
+                    
+                    left = float(word.get("xMin"))
+                    top = float(word.get("yMin"))
+                    
+                    words["text"].append(text)
+                    words["conf"].append(100)
+                    words["left"].append(int(left * scale))
+                    words["top"].append(int(top * scale))
+                    words["width"].append(int((float(word.get("xMax")) - left) * scale))
+                    words["height"].append(int((float(word.get("yMax")) - top) * scale))
+                    words["block_num"].append(block_num)
+                    words["par_num"].append(1)
+                    words["line_num"].append(line_num)
+        
+        pages[page_no] = words
+    
+    return pages
+
+def is_text_layer_usable(words: Dict[str, List]) -> bool:
+    """Check whether a page's embedded text is real, readable text rather than an empty or garbled layer"""
+    texts = words.get("text") or []
+    
+    if len(texts) < MIN_TEXT_LAYER_WORDS:
+        return False
+    
+    readable = sum(
+        1 for text in texts
+        if "�" not in text and any(char.isalnum() for char in text)
+    )
+    
+    return readable / len(texts) >= MIN_READABLE_WORD_RATIO
+
+def iter_elements(parent: ET.Element, tag: str):
+    """Iterate over descendants with the given tag, ignoring the XHTML namespace"""
+    for element in parent.iter():
+        if element.tag == tag or element.tag.endswith("}" + tag):
+            yield element
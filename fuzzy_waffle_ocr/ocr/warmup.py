@@ -0,0 +1,88 @@
+import frappe
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Background jobs that run the OCR stack; other jobs never pay for the warm-up
+OCR_JOB_METHODS = (
+    "fuzzy_waffle_ocr.doctype.invoice_ocr_processor.invoice_ocr_processor.run_ocr_upload_job",
+    "fuzzy_waffle_ocr.api.batch_processing.process_batch_chunk"
+)
+
+# Set once this process has warmed up
+_warm = False
+
+def warm_up_ocr_worker(method: str = None, **kwargs):
+    """
+    before_job hook: warm up the OCR stack before the first OCR job in this process
+    
+    Frappe has no worker boot hook, so this runs before jobs and does its work
+    only for OCR jobs and only once per process. Later jobs pay a flag check.
+    """
+    global _warm
+    
+    if _warm or (method and method not in OCR_JOB_METHODS):
+        return
+    
+    try:
+        warm_up()
+    except Exception as e:
+        # A failed warm-up only means the job warms up as it goes
+        frappe.log_error(f"OCR worker warm-up failed: {e}\n{frappe.get_traceback()}", "OCR Warm-up")
+    finally:
+        # Not retried before every job
+        _warm = True
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Import the OCR stack, load Tesseract traineddata, compile field patterns and prime caches
+    
+    Returns the seconds each step took. Run it directly to warm up a long-lived
+    worker by hand: bench --site <site> execute fuzzy_waffle_ocr.ocr.warmup.warm_up
+    """
+    global _warm
+    
+    timings = {}
+    
+    # Imported for their side effect of loading the modules into this process
+    with timed(timings, "imports"):
+        import numpy
+        import cv2
+        import pdf2image
+        import dateutil.parser
+        from fuzzy_waffle_ocr.ocr import layout, line_items
+        from fuzzy_waffle_ocr.ocr.engine import get_tesseract_version
+        from fuzzy_waffle_ocr.ocr.processor import OCRProcessor
+    
+    with timed(timings, "settings"):
+        processor = OCRProcessor()
+    
+    with timed(timings, "traineddata"):
+        engine = processor.engine
+        
+        # Pooled instances for every config the cascade may use; the subprocess engine has nothing to keep
+        if hasattr(engine, "warm_up"):
+            configs = []
+            for stage in processor.get_cascade_stages():
+                configs.extend(processor.CASCADE_STAGES[stage]["configs"])
+            
+            engine.warm_up(list(dict.fromkeys(configs)))
+        
+        get_tesseract_version()
+    
+    with timed(timings, "patterns"):
+        from fuzzy_waffle_ocr.ocr.extraction import get_field_extractor
+        
+        get_field_extractor()
+    
+    _warm = True
+    
+    frappe.logger("fuzzy_waffle_ocr").info({"event": "ocr_worker_warm_up", "timings": timings})
+    return timings
+
+@contextmanager
+def timed(timings: Dict[str, float], name: str):
+    """Record the seconds a block took under a name"""
+    started = time.perf_counter()
+    yield
+    timings[name] = round(time.perf_counter() - started, 3)